@@ -0,0 +1,137 @@
+"""
+Load protection for the read endpoints.
+
+    SingleFlight    identical requests that arrive while one of them is
+                    being computed wait for it instead of each doing
+                    the same load + filter + serialize
+    RateLimiter     token bucket per client (IP address); a client that
+                    runs out of tokens gets 429 and a Retry-After
+    AdmissionGate   at most N requests of an endpoint run at once and a
+                    bounded number wait for a turn; the rest are shed
+                    with 503 and a Retry-After, so a burst makes some
+                    clients retry instead of making everyone wait longer
+
+All of them are per process and thread-safe. app.py configures them
+per endpoint (LIMITS).
+"""
+import threading
+import time
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs one call per key at a time and hands its result to everyone waiting."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn):
+        """
+        Call fn(), or if a call for the same key is already running,
+        wait for that one. Returns (result, shared); shared is True for
+        the callers that waited. An exception reaches all of them.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+
+class RateLimiter:
+    """Token bucket per key: `rate` requests per second, bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=None, max_keys=10000):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> (tokens, time of last update)
+        self._lock = threading.Lock()
+
+    def acquire(self, key, now=None):
+        """Take a token. Returns 0 if there was one, else the seconds until there is."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / self.rate
+
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return 0.0
+
+    def _prune(self, now):
+        """Forget clients whose bucket has filled up again (caller holds _lock)."""
+        refill = self.burst / self.rate
+        self._buckets = {
+            key: (tokens, last)
+            for key, (tokens, last) in self._buckets.items()
+            if now - last < refill
+        }
+
+
+class AdmissionGate:
+    """
+    Lets `concurrency` callers in at once; up to `queue` more wait at
+    most `timeout` seconds for a turn.
+    """
+
+    def __init__(self, concurrency, queue=0, timeout=5.0):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.running = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def enter(self):
+        """True once admitted (call leave() afterwards), False if shed."""
+        with self._cond:
+            if self.running >= self.concurrency:
+                if self.waiting >= self.queue:
+                    return False
+                self.waiting += 1
+                try:
+                    admitted = self._cond.wait_for(
+                        lambda: self.running < self.concurrency, self.timeout
+                    )
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    return False
+            self.running += 1
+            return True
+
+    def leave(self):
+        with self._cond:
+            self.running -= 1
+            self._cond.notify()
@@ -1,80 +1,619 @@
-from flask import Flask, request, jsonify
-import json
+from flask import Flask, g, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
+import base64
+import math
 import os
+import sqlite3
+from bisect import bisect_right
+from collections import ChainMap
 from datetime import datetime, timedelta
+from functools import wraps
+from urllib.parse import urlencode
+
+from admission import AdmissionGate, RateLimiter, SingleFlight
+from bulk import iter_json_array, iter_ndjson
+import covers
+import metrics
+import serialization
+from covers import cover_file, parse_size
+from history import KEEP_DAYS, EventLog, change_event
+from http_cache import ResponseCache
+from jobs import DEFAULT_WORKERS, STATUSES, JobError, JobQueue
+from overdue import OverdueScheduler
+from records import MediaItem, ValidationError, parse, parse_borrow
+from storage import DEFAULT_FILES, open_store
 
 app = Flask(__name__)
 
-# Path to JSON "database"
-DATA_FILE = os.path.join(os.path.dirname(__file__), "database.json")
+# Storage backend: "json" (database.json) or "sqlite" (database.sqlite3).
+# Convert an existing catalog with migrate.py.
+STORAGE_BACKEND = os.environ.get("MEDIA_STORAGE", "json")
+
+# Path to the "database" (MEDIA_DATA_FILE overrides it, e.g. for tests)
+DATA_FILE = os.environ.get(
+    "MEDIA_DATA_FILE", os.path.join(os.path.dirname(__file__), DEFAULT_FILES[STORAGE_BACKEND])
+)
+
+# JSON backend: append single-item changes to database.log instead of
+# rewriting database.json every time (set MEDIA_JOURNAL=0 to turn off)
+JOURNAL_ENABLED = os.environ.get("MEDIA_JOURNAL", "1") != "0"
+
+# JSON backend: write snapshots as compact "json" or "msgpack" (default:
+# from the file extension). Either format is read back automatically.
+SNAPSHOT_FORMAT = os.environ.get("MEDIA_SNAPSHOT_FORMAT") or None
+
+# JSON: parsed once, then served from memory until the file changes on disk
+store = open_store(
+    DATA_FILE, STORAGE_BACKEND, journal=JOURNAL_ENABLED, snapshot_format=SNAPSHOT_FORMAT
+)
+
+# Request timings and counters for GET /metrics (set MEDIA_METRICS=0 to
+# turn them off; nothing is wrapped or hooked then)
+METRICS_ENABLED = os.environ.get("MEDIA_METRICS", "1") != "0"
+if METRICS_ENABLED:
+    metrics.instrument(store)
+
+# Opt-in sampling profiler (MEDIA_PROFILE=cprofile|tracemalloc, see metrics.py)
+profiler = metrics.profiler_from_env()
+
+# Listings with more items than this are streamed instead of built in memory
+STREAM_MIN_ITEMS = 5000
+# Items serialized per chunk of a streamed listing
+STREAM_CHUNK_ITEMS = 500
+
+# Mark borrowed items "overdue" once their due date passes
+# (set MEDIA_OVERDUE_SCHEDULER=0 to turn off)
+OVERDUE_SCHEDULER_ENABLED = os.environ.get("MEDIA_OVERDUE_SCHEDULER", "1") != "0"
+
+# Background jobs (jobs.py): their table lives next to the catalog, and
+# each process runs MEDIA_JOB_WORKERS worker threads (0: only queue them)
+JOBS_FILE = os.environ.get(
+    "MEDIA_JOBS_FILE", os.path.join(os.path.dirname(os.path.abspath(DATA_FILE)), "jobs.sqlite3")
+)
+JOB_WORKERS = int(os.environ.get("MEDIA_JOB_WORKERS", DEFAULT_WORKERS))
+# Items a bulk import job writes per transaction; borrows and returns
+# get the catalog lock in between
+JOB_CHUNK_ITEMS = 500
+
+# Borrowing history (history.py): every borrow and return as an event,
+# plus the rollups behind /stats, next to the catalog
+# (set MEDIA_HISTORY=0 to turn off)
+HISTORY_ENABLED = os.environ.get("MEDIA_HISTORY", "1") != "0"
+HISTORY_FILE = os.environ.get(
+    "MEDIA_HISTORY_FILE", os.path.join(os.path.dirname(os.path.abspath(DATA_FILE)), "history.sqlite3")
+)
+# Days GET /stats/days covers when no range is given
+STATS_DAYS = 30
+
+# Serialized bodies of the hot read endpoints, keyed by catalog version
+response_cache = ResponseCache()
+# Identical memoized reads arriving together are computed once
+coalescer = SingleFlight()
+# Response headers that belong to a memoized body
+CACHED_HEADERS = ("X-Next-Cursor", "Link")
+
+# Request bodies with these types are read as JSON Lines by POST /media/bulk
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/jsonl", "application/x-jsonlines")
+
+# Browsers and proxies may reuse a cover this long without asking again
+# (after that the ETag makes revalidation cheap)
+COVER_MAX_AGE = 24 * 60 * 60
+
+# Load protection per endpoint ("METHOD route", as labelled in /metrics):
+#   rate, burst   requests per second per client IP (token bucket); 429 beyond
+#   concurrency   requests of the endpoint running at once in a process
+#   queue         requests waiting for a turn; 503 beyond that, or after
+#                 waiting ADMISSION_TIMEOUT_SECONDS
+# Leave a key out for no limit of that kind. The limits are off unless
+# MEDIA_LIMITS is set: MEDIA_LIMITS=on applies these, and JSON replaces
+# entries, e.g. '{"GET /media/search/<query>": {"rate": 5, "burst": 10}}'.
+READ_LIMITS = {"rate": 20, "burst": 40, "concurrency": 8, "queue": 64}
+LIMITS = {
+    "GET /media": READ_LIMITS,
+    "GET /media/category/<category>": READ_LIMITS,
+    "GET /media/status/<status>": READ_LIMITS,
+    "GET /media/author/<author>": READ_LIMITS,
+    "GET /media/overdue": READ_LIMITS,
+    "GET /media/search/<query>": {"rate": 10, "burst": 20, "concurrency": 4, "queue": 32},
+    "GET /media/export": {"rate": 1, "burst": 2, "concurrency": 2, "queue": 2},
+}
+ADMISSION_TIMEOUT_SECONDS = 5
+# Retry-After sent with a 503 from a full admission queue
+SHED_RETRY_SECONDS = 1
+
+# Longest a GET /media/changes?wait=N long-poll may block
+MAX_WAIT_SECONDS = 30
+# Idle time between keep-alive comments on the change stream
+STREAM_HEARTBEAT_SECONDS = 15
+
+
+# ---------------------------------------------------------
+# JSON ENCODING
+# ---------------------------------------------------------
+class JSONProvider(DefaultJSONProvider):
+    """
+    jsonify() and request.get_json() through the fastest JSON library
+    installed (orjson, ujson or the standard library; serialization.py).
+    Output stays compact with sorted keys, indented in debug mode.
+    """
+
+    @staticmethod
+    def default(obj):
+        if isinstance(obj, MediaItem):
+            return obj.to_dict()
+        return DefaultJSONProvider.default(obj)
+
+    def dumps(self, obj, **kwargs):
+        return serialization.dumps(
+            obj,
+            sort_keys=kwargs.get("sort_keys", self.sort_keys),
+            indent=kwargs.get("indent"),
+            default=self.default,
+        )
+
+    def loads(self, s, **kwargs):
+        return serialization.loads(s)
+
+    def response(self, *args, **kwargs):
+        if args and kwargs:
+            raise TypeError("jsonify() takes either args or kwargs, not both")
+        obj = args[0] if len(args) == 1 else (args or kwargs or None)
+
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        # Encode straight to bytes, without a detour through str
+        body = serialization.dumps_bytes(obj, self.sort_keys, 2 if pretty else None, self.default)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+app.json = JSONProvider(app)
 
 
 # ---------------------------------------------------------
 # DATA HELPERS
 # ---------------------------------------------------------
 def load_data():
-    """Load media data from JSON file."""
-    if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "w") as f:
-            json.dump({}, f)
-
-    with open(DATA_FILE, "r") as f:
-        return json.load(f)
+    """Load media data (cached in memory, re-read only if the catalog changed)."""
+    return store.load()
 
 
 def save_data(data):
-    """Save media data to JSON file."""
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    """Save the whole media catalog to the JSON file."""
+    store.save(data)
+
+
+def save_item(name, item):
+    """Create or replace a single media item."""
+    store.put(name, item)
+
+
+def delete_item(name):
+    """Remove a single media item."""
+    store.delete(name)
+
+
+def save_items(items):
+    """Create or replace several media items in one write."""
+    store.put_many(items)
+
+
+history = EventLog(HISTORY_FILE) if HISTORY_ENABLED else None
+
+
+def record_history(changes):
+    """
+    Add the borrows and returns among (name, before, after) changes to
+    the borrowing history. Called after the catalog transaction, never
+    under its lock. The catalog is already changed, so a failure here is
+    only logged.
+    """
+    if history is None:
+        return
+    day = today()
+    events = [
+        event for event in (change_event(name, before, after, day) for name, before, after in changes)
+        if event is not None
+    ]
+    try:
+        history.record(events)
+    except sqlite3.Error:
+        app.logger.exception("Could not record borrowing history")
+        return
+    if METRICS_ENABLED:
+        for event in events:
+            metrics.registry.inc("media_history_events_total", (("kind", event["kind"]),))
+
+
+# ---------------------------------------------------------
+# ITEM RULES (shared by the single and batch endpoints)
+# ---------------------------------------------------------
+def new_item(payload):
+    """
+    A new item with the default fields filled in (records.parse()).
+    Returns (item, None), or (None, error message).
+    """
+    try:
+        return parse(payload), None
+    except ValidationError as e:
+        return None, str(e)
+
+
+def borrowed(data, name, payload):
+    """
+    Borrowed copy of data[name].
+    Returns (item, None), or (None, (error message, status code)).
+    """
+    if name not in data:
+        return None, ("Media not found", 404)
+
+    item = data[name]
+
+    if item["status"] == "borrowed":
+        return None, ("Media already borrowed", 400)
+
+    try:
+        borrower, days = parse_borrow(payload)
+    except ValidationError as e:
+        return None, (str(e), 400)
+
+    borrow_date = datetime.now()
+    due_date = borrow_date + timedelta(days=days)
+
+    item = MediaItem(
+        item,
+        status="borrowed",
+        borrowed_by=borrower,
+        borrow_date=borrow_date.strftime("%Y-%m-%d"),
+        due_date=due_date.strftime("%Y-%m-%d"),
+        overdue=False,
+    )
+    return item, None
+
+
+def returned(data, name):
+    """
+    Returned copy of data[name].
+    Returns (item, None), or (None, (error message, status code)).
+    """
+    if name not in data:
+        return None, ("Media not found", 404)
+
+    item = data[name]
+
+    if item["status"] != "borrowed":
+        return None, ("Media is not borrowed", 400)
+
+    item = MediaItem(
+        item, status="available", borrowed_by=None, borrow_date=None, due_date=None, overdue=False,
+    )
+    return item, None
+
+
+# ---------------------------------------------------------
+# HTTP CACHING (ETag / conditional GET)
+# ---------------------------------------------------------
+def today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def set_validators(response, etag, last_modified, version, lineage):
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    # Clients may keep the body but must revalidate it every time
+    response.headers["Cache-Control"] = "no-cache"
+    # Starting point for GET /media/changes
+    response.headers["X-Catalog-Version"] = str(version)
+    response.headers["X-Catalog-Lineage"] = lineage
+    return response
+
+
+def conditional_get(memoize=False, vary=None):
+    """
+    Tag a read endpoint with an ETag / Last-Modified derived from the
+    catalog version and answer a matching If-None-Match with 304 before
+    the view runs. With memoize=True the serialized body is also kept
+    in response_cache, so repeating a request costs a dict lookup, and
+    identical requests that arrive while it is being built wait for it
+    and are answered from the cache too.
+    `vary` adds an extra component to the ETag (e.g. today's date).
+    """
+    def decorator(view):
+        def render(key, args, kwargs):
+            response = app.make_response(view(*args, **kwargs))
+            if memoize and response.status_code == 200 and not response.is_streamed:
+                headers = [(k, v) for k, v in response.headers if k in CACHED_HEADERS]
+                response_cache.put(key, response.get_data(), response.mimetype, headers)
+            return response
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = store.etag()
+            validators = (int(store.last_modified), store.version, store.lineage)
+            if vary is not None:
+                etag += "-" + vary()
+
+            if request.if_none_match.contains_weak(etag):
+                return set_validators(app.response_class(status=304), etag, *validators)
+
+            key = (etag, request.full_path)
+            cached = response_cache.get(key) if memoize else None
+            if memoize and cached is None:
+                response, shared = coalescer.do(key, lambda: render(key, args, kwargs))
+                if shared:
+                    if METRICS_ENABLED:
+                        metrics.registry.inc(
+                            "media_requests_coalesced_total", (("endpoint", endpoint_label()),)
+                        )
+                    cached = response_cache.get(key)
+                    if cached is None:
+                        # Streamed, an error or too big to cache: not shareable
+                        response = render(key, args, kwargs)
+            elif not memoize:
+                response = render(key, args, kwargs)
+
+            if cached is not None:
+                body, mimetype, headers = cached
+                response = app.response_class(body, mimetype=mimetype, headers=headers)
+                return set_validators(response, etag, *validators)
+
+            if response.status_code != 200:
+                return response
+            if memoize and response.is_streamed:
+                headers = [(k, v) for k, v in response.headers if k in CACHED_HEADERS]
+                response.response = response_cache.tee(
+                    key, response.response, response.mimetype, headers
+                )
+            return set_validators(response, etag, *validators)
+        return wrapper
+    return decorator
+
+
+# ---------------------------------------------------------
+# LISTING HELPERS (pagination, projection, streaming)
+# ---------------------------------------------------------
+def encode_cursor(name):
+    return base64.urlsafe_b64encode(name.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return base64.b64decode(padded.encode(), altchars=b"-_", validate=True).decode()
+
+
+def parse_listing_args():
+    """
+    Read the listing options from the query string:
+
+        limit=N                  page size (all items if missing)
+        cursor=...               X-Next-Cursor value from the previous page
+        fields=name,status,...   only return these item fields
+        stream=1                 force a streamed response
+
+    Raises ValueError with a message for the client on bad input.
+    """
+    limit = request.args.get("limit")
+    if limit is not None:
+        if not limit.isdigit() or int(limit) == 0:
+            raise ValueError("limit must be a positive integer")
+        limit = int(limit)
+
+    after = request.args.get("cursor")
+    if after is not None:
+        try:
+            after = decode_cursor(after)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("Invalid cursor")
+
+    stream = request.args.get("stream", "0") not in ("0", "false", "")
+    return limit, after, fields_arg(), stream
+
+
+def fields_arg():
+    """The fields= projection, as a list of field names or None."""
+    fields = request.args.get("fields")
+    if fields is not None:
+        fields = [field for field in fields.split(",") if field]
+    return fields
+
+
+def project(item, fields):
+    if fields is None:
+        return item
+    return {field: item[field] for field in fields if field in item}
+
+
+def stream_items(pairs, fields):
+    """Yield a JSON object of the items chunk by chunk."""
+    yield "{"
+    separator = ""
+    chunk = []
+    for name, item in pairs:
+        chunk.append(
+            serialization.dumps(name) + ": "
+            + serialization.dumps(project(item, fields), sort_keys=True)
+        )
+        if len(chunk) == STREAM_CHUNK_ITEMS:
+            yield separator + ", ".join(chunk)
+            separator = ", "
+            chunk = []
+    if chunk:
+        yield separator + ", ".join(chunk)
+    yield "}"
+
+
+def listing_response(pairs, limit, fields, stream):
+    """
+    Build the response for a page of (name, item) pairs sorted by name.
+
+    `pairs` may hold one item more than `limit`; it only signals that
+    another page exists. The cursor for it is sent in X-Next-Cursor and
+    a Link header, so the body keeps the usual {name: item} shape.
+    """
+    next_cursor = None
+    if limit is not None and len(pairs) > limit:
+        pairs = pairs[:limit]
+        next_cursor = encode_cursor(pairs[-1][0])
+
+    if stream or len(pairs) > STREAM_MIN_ITEMS:
+        response = app.response_class(stream_items(pairs, fields), mimetype="application/json")
+    else:
+        response = jsonify({name: project(item, fields) for name, item in pairs})
+
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+        args = request.args.to_dict()
+        args["cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.path}?{urlencode(args)}>; rel="next"'
+    return response
+
+
+def page_of(items, after, limit):
+    """Slice a {name: item} dict into one sorted page (plus one look-ahead item)."""
+    names = sorted(items)
+    start = 0 if after is None else bisect_right(names, after)
+    end = None if limit is None else start + limit + 1
+    return [(name, items[name]) for name in names[start:end]]
 
 
 # ---------------------------------------------------------
 # 1. GET ALL MEDIA
 # ---------------------------------------------------------
 @app.route("/media", methods=["GET"])
+@conditional_get(memoize=True)
 def get_all_media():
     """
     Returns all media items.
     Used by the frontend to populate the main list.
+
+    Supports limit/cursor pagination, fields= projection and
+    streaming (see parse_listing_args).
     """
-    data = load_data()
-    return jsonify(data)
+    try:
+        limit, after, fields, stream = parse_listing_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    pairs = store.list_items(after, None if limit is None else limit + 1)
+    return listing_response(pairs, limit, fields, stream)
 
 
 # ---------------------------------------------------------
 # 2. GET MEDIA BY CATEGORY
 # ---------------------------------------------------------
 @app.route("/media/category/<category>", methods=["GET"])
+@conditional_get(memoize=True)
 def get_media_by_category(category):
     """
     Returns all media items of a specific category
     (Book, Film, Series).
+    Answered from the category index, not a scan, and supports
+    the same options as GET /media.
+    """
+    try:
+        limit, after, fields, stream = parse_listing_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    pairs = page_of(store.select("category", category), after, limit)
+    return listing_response(pairs, limit, fields, stream)
+
+
+# ---------------------------------------------------------
+# 2b. GET MEDIA BY STATUS / AUTHOR
+# ---------------------------------------------------------
+@app.route("/media/status/<status>", methods=["GET"])
+@conditional_get(memoize=True)
+def get_media_by_status(status):
+    """
+    Returns all media items with a given status
+    (available, borrowed).
+    """
+    return jsonify(store.select("status", status))
+
+
+@app.route("/media/author/<author>", methods=["GET"])
+@conditional_get()
+def get_media_by_author(author):
+    """
+    Returns all media items by an author (exact name).
     """
-    data = load_data()
-    filtered = {
+    return jsonify(store.select("author", author))
+
+
+# ---------------------------------------------------------
+# 2c. GET OVERDUE MEDIA
+# ---------------------------------------------------------
+# Items past their due date get "overdue": true through a normal
+# mutation, so it reaches clients in every response and as a "put" on
+# the change feed.
+overdue_scheduler = OverdueScheduler(store, today=today)
+overdue_scheduler.subscribe(
+    lambda names: app.logger.info("Now overdue: %s", ", ".join(names))
+)
+
+
+@app.route("/media/overdue", methods=["GET"])
+@conditional_get(memoize=True, vary=today)
+def get_overdue_media():
+    """
+    Returns borrowed items whose due date is before a given day.
+    For today these are the items the scheduler has flagged with
+    "overdue": true.
+
+    Optional query parameter:
+        as_of=YYYY-MM-DD   (defaults to today)
+    """
+    as_of = request.args.get("as_of")
+    if as_of is None:
+        as_of = today()
+    else:
+        try:
+            # Due dates compare as text, so "2026-2-1" must become "2026-02-01"
+            as_of = datetime.strptime(as_of, "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            return jsonify({"error": "as_of must be YYYY-MM-DD"}), 400
+
+    overdue = {
         name: item
-        for name, item in data.items()
-        if item.get("category") == category
+        for name, item in store.due_between(end=as_of).items()
+        if item.get("status") == "borrowed"
     }
-    return jsonify(filtered)
+    return jsonify(overdue)
 
 
 # ---------------------------------------------------------
 # 3. SEARCH MEDIA (PARTIAL MATCH)
 # ---------------------------------------------------------
 @app.route("/media/search/<query>", methods=["GET"])
+@conditional_get(memoize=True)
 def search_media(query):
     """
-    Search media items by partial name match (case-insensitive).
+    Search media items by partial name or author match
+    (case-insensitive), using the trigram index.
+
+    Optional query parameters:
+        rank=1          best matches first (exact, prefix, word, substring)
+        limit=N         return at most N items
+        format=ndjson   stream one item per line (JSON Lines), so a
+                        client can show results while they arrive
     """
-    data = load_data()
-    query = query.lower()
+    rank = request.args.get("rank", "0") not in ("0", "false", "")
+    limit = request.args.get("limit")
+    if limit is not None:
+        if not limit.isdigit() or int(limit) == 0:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        limit = int(limit)
 
-    results = {
-        name: item
-        for name, item in data.items()
-        if query in name.lower()
-    }
+    results = store.search(query, limit=limit, rank=rank)
+
+    if request.args.get("format") == "ndjson":
+        return app.response_class(
+            export_lines(list(results.items())), mimetype="application/x-ndjson"
+        )
+    if rank:
+        # jsonify sorts keys, which would undo the ranking
+        with metrics.phase("serialize"):
+            body = serialization.dumps_bytes(results)
+        return app.response_class(body, mimetype="application/json")
     return jsonify(results)
 
 
@@ -82,13 +621,13 @@ def search_media(query):
 # 4. GET SINGLE MEDIA ITEM
 # ---------------------------------------------------------
 @app.route("/media/<name>", methods=["GET"])
+@conditional_get()
 def get_single_media(name):
     """
     Returns full metadata for a single media item.
     Used for the details panel in the UI.
     """
-    data = load_data()
-    item = data.get(name)
+    item = store.get(name)
 
     if item is None:
         return jsonify({"error": "Media not found"}), 404
@@ -96,6 +635,40 @@ def get_single_media(name):
     return jsonify(item)
 
 
+# ---------------------------------------------------------
+# 4b. COVER IMAGE
+# ---------------------------------------------------------
+@app.route("/media/<name>/cover", methods=["GET"])
+def get_cover(name):
+    """
+    Returns the cover image of a media item.
+
+    Optional query parameter:
+        size=WxH   scaled to fit in WxH (generated once, then cached)
+
+    Supports If-None-Match / If-Modified-Since (304) and Range (206).
+    """
+    item = store.get(name)
+    if item is None:
+        return jsonify({"error": "Media not found"}), 404
+
+    size = request.args.get("size")
+    if size is not None:
+        try:
+            size = parse_size(size)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    try:
+        path, etag = cover_file(item.get("image"), size)
+    except FileNotFoundError:
+        return jsonify({"error": "Cover not found"}), 404
+
+    response = send_file(path, conditional=True, etag=etag, max_age=COVER_MAX_AGE)
+    response.cache_control.public = True
+    return response
+
+
 # ---------------------------------------------------------
 # 5. CREATE MEDIA ITEM (ADMIN / CODE USE)
 # ---------------------------------------------------------
@@ -106,22 +679,11 @@ def create_media():
     This endpoint exists for completeness, but the UI
     will not expose it.
     """
-    data = load_data()
-    new_item = request.get_json()
-
-    required_fields = ["name", "author", "publication_date", "category"]
-    for field in required_fields:
-        if field not in new_item:
-            return jsonify({"error": f"Missing field: {field}"}), 400
-
-    new_item.setdefault("status", "available")
-    new_item.setdefault("image", "")
-    new_item.setdefault("borrowed_by", None)
-    new_item.setdefault("borrow_date", None)
-    new_item.setdefault("due_date", None)
+    item, error = new_item(request.get_json())
+    if error:
+        return jsonify({"error": error}), 400
 
-    data[new_item["name"]] = new_item
-    save_data(data)
+    save_item(item["name"], item)
 
     return jsonify({"status": "created"}), 201
 
@@ -135,15 +697,13 @@ def delete_media(name):
     Delete a media item.
     Not exposed in the UI.
     """
-    data = load_data()
+    with store.transaction() as data:
+        if name not in data:
+            return jsonify({"error": "Media not found"}), 404
 
-    if name not in data:
-        return jsonify({"error": "Media not found"}), 404
-
-    data.pop(name)
-    save_data(data)
+        delete_item(name)
 
-    return jsonify({"status": "deleted"}), 200
+        return jsonify({"status": "deleted"}), 200
 
 
 # ---------------------------------------------------------
@@ -160,64 +720,773 @@ def borrow_media(name):
         "days": 7
     }
     """
-    data = load_data()
+    # Check and update under the catalog lock so concurrent requests
+    # (threads or worker processes) cannot both succeed
+    with store.transaction() as data:
+        item, error = borrowed(data, name, request.get_json(silent=True) or {})
+        if error:
+            message, status = error
+            return jsonify({"error": message}), status
 
-    if name not in data:
-        return jsonify({"error": "Media not found"}), 404
+        before = data[name]
+        save_item(name, item)
 
-    item = data[name]
+    # Outside the catalog lock: a slow history database must not hold up writers
+    record_history([(name, before, item)])
+    return jsonify({"status": "borrowed"}), 200
 
-    if item["status"] == "borrowed":
-        return jsonify({"error": "Media already borrowed"}), 400
 
-    payload = request.get_json()
-    borrower = payload.get("borrowed_by")
-    days = payload.get("days")
+# ---------------------------------------------------------
+# 8. RETURN MEDIA ITEM
+# ---------------------------------------------------------
+@app.route("/media/<name>/return", methods=["POST"])
+def return_media(name):
+    """
+    Return a borrowed media item.
+    """
+    with store.transaction() as data:
+        item, error = returned(data, name)
+        if error:
+            message, status = error
+            return jsonify({"error": message}), status
 
-    if not borrower or not isinstance(days, int):
-        return jsonify({"error": "Invalid borrow data"}), 400
+        before = data[name]
+        save_item(name, item)
 
-    borrow_date = datetime.now()
-    due_date = borrow_date + timedelta(days=days)
+    record_history([(name, before, item)])
+    return jsonify({"status": "returned"}), 200
 
-    item["status"] = "borrowed"
-    item["borrowed_by"] = borrower
-    item["borrow_date"] = borrow_date.strftime("%Y-%m-%d")
-    item["due_date"] = due_date.strftime("%Y-%m-%d")
 
-    save_data(data)
-    return jsonify({"status": "borrowed"}), 200
+# ---------------------------------------------------------
+# 8b. BATCH IMPORT / BORROW / RETURN AND EXPORT
+# ---------------------------------------------------------
+def apply_entries(entries, change, done, atomic=False, record=False):
+    """
+    Validate and apply a batch as one transaction.
+
+    `entries` are (name, payload) pairs and `change(view, name, payload)`
+    returns (item, error) like borrowed()/returned(). Each entry sees the
+    entries before it, so borrowing the same item twice fails the second
+    time. All successful changes are saved with a single write; with
+    atomic=True nothing is saved unless every entry succeeds. With
+    record=True the changes go into the borrowing history.
+
+    Returns {"applied": n, "failed": n, "results": [per-item results]}.
+    """
+    with store.transaction() as data:
+        changes = {}
+        view = ChainMap(changes, data)
+        results = []
+        recorded = []
+        failed = 0
+
+        for name, payload in entries:
+            item, error = change(view, name, payload)
+            if error:
+                message, status = error
+                results.append({"name": name, "error": message, "code": status})
+                failed += 1
+            else:
+                if record:
+                    recorded.append((name, view[name], item))
+                changes[name] = item
+                results.append({"name": name, "status": done})
+
+        if failed and atomic:
+            changes = {}
+        save_items(list(changes.items()))
+
+    # After the catalog lock is released, like the single endpoints
+    if changes:
+        record_history(recorded)
+    return {"applied": len(results) - failed if changes else 0, "failed": failed, "results": results}
+
+
+def apply_batch(entries, change, done, record=False):
+    """
+    Apply a batch (see apply_entries) for the current request; with
+    ?atomic=1 nothing is saved unless every entry succeeds.
+    Responds 200 (or 201 for imports) if all entries succeeded, 207 if
+    only some did and 400 if none were applied, with per-item results.
+    """
+    body = apply_entries(entries, change, done, atomic=flag_arg("atomic"), record=record)
+    if not body["failed"]:
+        return jsonify(body), 201 if done == "created" else 200
+    if body["applied"]:
+        return jsonify(body), 207
+    return jsonify(body), 400
+
+
+def flag_arg(name):
+    """True if query parameter `name` is set to something other than 0/false."""
+    return request.args.get(name, "0") not in ("0", "false", "")
+
+
+def batch_entries():
+    """Entries of a batch body: {"items": [...]} or a bare list."""
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get("items")
+    if not isinstance(payload, list):
+        raise ValueError('Expected a list of items or {"items": [...]}')
+    return payload
+
+
+def new_item_change(view, name, payload):
+    item, error = new_item(payload)
+    if error:
+        return None, (error, 400)
+    return item, None
+
+
+@app.route("/media/bulk", methods=["POST"])
+def bulk_import():
+    """
+    Create or replace many media items at once.
+
+    The body is either JSON Lines (Content-Type application/x-ndjson,
+    one item per line) or a JSON array of items; both are parsed as
+    they stream in. Every item is checked like POST /media.
+
+    With ?async=1 the items are only parsed here and imported by a
+    background job in chunks: responds 202 with the job (see GET
+    /jobs/<id>), whose result is the usual response body.
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        items = iter_ndjson(request.stream)
+    else:
+        items = iter_json_array(request.stream)
+
+    try:
+        entries = [
+            (item.get("name") if isinstance(item, dict) else None, item)
+            for item in items
+        ]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if flag_arg("async"):
+        return submit_job("bulk_import", {
+            "items": [item for _, item in entries],
+            "atomic": flag_arg("atomic"),
+        })
+    return apply_batch(entries, new_item_change, "created")
+
+
+@app.route("/media/borrow/batch", methods=["POST"])
+def borrow_batch():
+    """
+    Borrow many media items at once.
+
+    Expected JSON:
+    {
+        "items": [
+            {"name": "...", "borrowed_by": "Student Name", "days": 7},
+            ...
+        ]
+    }
+    """
+    try:
+        requested = batch_entries()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    entries = []
+    for entry in requested:
+        if not isinstance(entry, dict):
+            entry = {}
+        entries.append((entry.get("name"), entry))
+
+    return apply_batch(entries, borrowed, "borrowed", record=True)
+
+
+@app.route("/media/return/batch", methods=["POST"])
+def return_batch():
+    """
+    Return many borrowed media items at once.
+
+    Expected JSON: {"items": ["name", ...]} (or {"name": ...} objects)
+    """
+    try:
+        requested = batch_entries()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    entries = []
+    for entry in requested:
+        name = entry.get("name") if isinstance(entry, dict) else entry
+        entries.append((name, None))
+
+    return apply_batch(entries, lambda view, name, _: returned(view, name), "returned", record=True)
+
+
+def export_lines(pairs):
+    """Yield the items as JSON Lines, chunk by chunk."""
+    for start in range(0, len(pairs), STREAM_CHUNK_ITEMS):
+        chunk = pairs[start:start + STREAM_CHUNK_ITEMS]
+        yield "".join(serialization.dumps(item, sort_keys=True) + "\n" for _, item in chunk)
+
+
+@app.route("/media/export", methods=["GET"])
+@conditional_get()
+def export_media():
+    """
+    Stream the whole catalog as JSON Lines, one item per line, sorted
+    by name. The output can be fed straight back into POST /media/bulk.
+    """
+    pairs = store.list_items()
+    return app.response_class(
+        export_lines(pairs),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=media.jsonl"},
+    )
 
 
 # ---------------------------------------------------------
-# 8. RETURN MEDIA ITEM
+# 9. CHANGE FEED
 # ---------------------------------------------------------
-@app.route("/media/<name>/return", methods=["POST"])
-def return_media(name):
+def change_entries(names, fields):
+    """Current state of each changed item: a put with the item, or a delete."""
+    data = store.get_many(names)
+    entries = []
+    for name in names:
+        item = data.get(name)
+        if item is None:
+            entries.append({"op": "delete", "name": name})
+        else:
+            entries.append({"op": "put", "name": name, "item": project(item, fields)})
+    return entries
+
+
+def change_payload(since, lineage, fields):
+    version, names = store.changes_since(since, lineage)
+    return {
+        "version": version,
+        "lineage": store.lineage,
+        "reset": names is None,
+        "changes": [] if names is None else change_entries(names, fields),
+    }
+
+
+@app.route("/media/changes", methods=["GET"])
+def get_changes():
     """
-    Return a borrowed media item.
+    Returns the items created, updated or deleted since a version.
+
+    Query parameters:
+        since=N       version the client has (X-Catalog-Version header)
+        lineage=L     lineage of that version (X-Catalog-Lineage header)
+        wait=S        long-poll: wait up to S seconds for a change
+        fields=...    project changed items, like GET /media
+
+    Response:
+    {
+        "version": 42,
+        "lineage": "...",
+        "reset": false,
+        "changes": [
+            {"op": "put", "name": "...", "item": {...}},
+            {"op": "delete", "name": "..."}
+        ]
+    }
+
+    "reset": true means the changes are no longer known and the client
+    has to reload the catalog.
     """
-    data = load_data()
+    since = request.args.get("since", "")
+    wait = request.args.get("wait", "0")
+    if not since.isdigit() or not wait.isdigit():
+        return jsonify({"error": "since and wait must be non-negative integers"}), 400
+    since = int(since)
+    lineage = request.args.get("lineage")
+    fields = fields_arg()
 
-    if name not in data:
-        return jsonify({"error": "Media not found"}), 404
+    if int(wait) > 0 and store.version == since and lineage in (None, store.lineage):
+        store.wait_for_change(since, min(int(wait), MAX_WAIT_SECONDS))
 
-    item = data[name]
+    return jsonify(change_payload(since, lineage, fields))
 
-    if item["status"] != "borrowed":
-        return jsonify({"error": "Media is not borrowed"}), 400
 
-    item["status"] = "available"
-    item["borrowed_by"] = None
-    item["borrow_date"] = None
-    item["due_date"] = None
+@app.route("/media/changes/stream", methods=["GET"])
+def stream_changes():
+    """
+    Server-Sent Events version of /media/changes.
 
-    save_data(data)
-    return jsonify({"status": "returned"}), 200
+    Takes the same since / lineage / fields parameters (or resumes from
+    the Last-Event-ID header) and pushes one "change" event per batch,
+    or a "reset" event when the client has to reload everything.
+    """
+    since = request.args.get("since", "")
+    lineage = request.args.get("lineage")
+    last_event = request.headers.get("Last-Event-ID", "")
+    if ":" in last_event:
+        lineage, since = last_event.rsplit(":", 1)
+    if not since.isdigit():
+        return jsonify({"error": "since must be a non-negative integer"}), 400
+    fields = fields_arg()
+
+    def events(since, lineage):
+        yield "retry: 3000\n\n"
+        while True:
+            payload = change_payload(since, lineage, fields)
+            if payload["reset"] or payload["changes"]:
+                event = "reset" if payload["reset"] else "change"
+                yield (
+                    f"event: {event}\n"
+                    f"id: {payload['lineage']}:{payload['version']}\n"
+                    f"data: {serialization.dumps(payload)}\n\n"
+                )
+            since, lineage = payload["version"], payload["lineage"]
+
+            if store.wait_for_change(since, STREAM_HEARTBEAT_SECONDS) == since:
+                yield ": keep-alive\n\n"
+
+    return app.response_class(
+        events(int(since), lineage),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---------------------------------------------------------
+# 9b. BACKGROUND JOBS
+# ---------------------------------------------------------
+job_queue = JobQueue(JOBS_FILE)
+
+
+def bulk_import_job(job, params):
+    """POST /media/bulk?async=1: import in chunks, so other writes get in between."""
+    entries = [
+        (item.get("name") if isinstance(item, dict) else None, item)
+        for item in params["items"]
+    ]
+    if params.get("atomic"):
+        return apply_entries(entries, new_item_change, "created", atomic=True)
+
+    body = {"applied": 0, "failed": 0, "results": []}
+    for start in range(0, len(entries), JOB_CHUNK_ITEMS):
+        chunk = apply_entries(entries[start:start + JOB_CHUNK_ITEMS], new_item_change, "created")
+        body["applied"] += chunk["applied"]
+        body["failed"] += chunk["failed"]
+        body["results"].extend(chunk["results"])
+        job.progress(start + len(chunk["results"]), len(entries))
+    return body
+
+
+def thumbnails_job(job, params):
+    """Generate cover thumbnails for the whole catalog (params: {"sizes": ["WxH", ...]})."""
+    if covers.Image is None:
+        raise JobError("Pillow is not installed; covers are served at full size")
+    try:
+        sizes = [parse_size(size) for size in params.get("sizes") or covers.THUMBNAIL_SIZES]
+    except ValueError as e:
+        raise JobError(str(e))
+
+    # A copy: other threads' writes change the catalog dict in place
+    items = list(store.load().values())
+    generated, missing = covers.pregenerate(items, sizes, job.progress)
+    return {"generated": generated, "missing": missing}
+
+
+def compact_job(job, params):
+    """Fold the journal (JSON) or write-ahead log (SQLite) into the catalog file."""
+    if not store.compact():
+        raise RuntimeError("Compaction already running in another process")
+    return {"compacted": True}
+
+
+job_queue.register("bulk_import", bulk_import_job)
+job_queue.register("thumbnails", thumbnails_job, priority=-10)
+job_queue.register("compact", compact_job, priority=10)
+
+
+def submit_job(kind, params, priority=None):
+    """Queue a job and answer 202 pointing at GET /jobs/<id>."""
+    job = job_queue.submit(kind, params, priority)
+    response = jsonify(job)
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{job['id']}"
+    return response
+
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    """
+    Start a background job.
+
+    Expected JSON:
+    {
+        "kind": "thumbnails" | "compact" | "bulk_import"
+                | "rotate_history" | "backfill_history",
+        "params": {...},       (optional, e.g. {"sizes": ["300x420"]})
+        "priority": 0          (optional, higher runs first)
+    }
+    """
+    payload = request.get_json(silent=True) or {}
+    kind = payload.get("kind")
+    params = payload.get("params") or {}
+    priority = payload.get("priority")
+
+    if kind not in job_queue.kinds:
+        return jsonify({"error": f"kind must be one of: {', '.join(job_queue.kinds)}"}), 400
+    if not isinstance(params, dict) or (kind == "bulk_import" and not isinstance(params.get("items"), list)):
+        return jsonify({"error": "Invalid job params"}), 400
+    if priority is not None and not isinstance(priority, int):
+        return jsonify({"error": "priority must be an integer"}), 400
+
+    return submit_job(kind, params, priority)
+
+
+@app.route("/jobs", methods=["GET"])
+def list_jobs():
+    """
+    Returns the most recent jobs, newest first.
+
+    Query parameters:
+        status=...   only queued, running, done or failed jobs
+        limit=N      at most N jobs (default 50)
+    """
+    status = request.args.get("status")
+    limit = request.args.get("limit", "50")
+    if status is not None and status not in STATUSES:
+        return jsonify({"error": f"status must be one of: {', '.join(STATUSES)}"}), 400
+    if not limit.isdigit() or int(limit) == 0:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    return jsonify(job_queue.recent(status, int(limit)))
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """
+    Returns a job: its status (queued, running, done or failed),
+    progress {"done", "total"}, attempts, and its result or error.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+# ---------------------------------------------------------
+# 9c. BORROWING HISTORY AND STATS
+# ---------------------------------------------------------
+# URL name -> (history dimension, field holding the key in responses)
+STATS = {
+    "items": ("item", "name"),
+    "borrowers": ("borrower", "borrower"),
+    "categories": ("category", "category"),
+    "days": ("day", "day"),
+}
+
+
+def rotate_history_job(job, params):
+    """Archive events older than params["keep_days"] (default KEEP_DAYS)."""
+    keep_days = params.get("keep_days", KEEP_DAYS)
+    if not isinstance(keep_days, int) or keep_days < 0:
+        raise JobError("keep_days must be a non-negative integer")
+    path, moved = history.rotate(keep_days)
+    return {"archive": os.path.basename(path) if path else None, "moved": moved}
+
+
+def backfill_history_job(job, params):
+    """Rebuild the /stats rollups from all events, archived or not."""
+    return {"events": history.backfill(job.progress)}
+
+
+if history is not None:
+    job_queue.register("rotate_history", rotate_history_job, priority=-10)
+    job_queue.register("backfill_history", backfill_history_job, priority=-10)
+
+
+def stats_row(row, field=None):
+    """A rollup with its key under `field` (dropped if None)."""
+    row = dict(row)
+    key = row.pop("key")
+    if field is not None:
+        row[field] = key
+    return row
+
+
+def month_arg():
+    """?month=YYYY-MM, or None for all time. Raises ValueError if malformed."""
+    month = request.args.get("month")
+    if month is None:
+        return None
+    try:
+        datetime.strptime(month, "%Y-%m")
+    except ValueError:
+        raise ValueError("month must look like YYYY-MM")
+    return month
+
+
+def history_disabled():
+    return jsonify({"error": "Borrowing history is disabled"}), 404
+
+
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    """
+    Borrowing totals: all time, this month and today. Every figure has
+    borrows, returns, loans (returns with a known borrow date) and
+    average_loan_days.
+    """
+    if history is None:
+        return history_disabled()
+    day = today()
+    month = day[:7]
+    return jsonify({
+        "all_time": stats_row(history.get("all", "")),
+        "month": dict(stats_row(history.get("all", "", month)), month=month),
+        "today": stats_row(history.get("day", day), "day"),
+    })
+
+
+@app.route("/stats/<kind>", methods=["GET"])
+def get_stats_list(kind):
+    """
+    Rollups of items, borrowers, categories or days.
+
+    Query parameters (items, borrowers, categories):
+        month=YYYY-MM   only that month (default: all time)
+        limit=N         the N borrowed most, most first (default 10)
+    Query parameters (days):
+        start=, end=    YYYY-MM-DD range, inclusive (default: the last
+                        STATS_DAYS days)
+
+    E.g. the most borrowed items this month: /stats/items?month=2026-10,
+    the average loan length per category: /stats/categories?limit=100
+    """
+    if history is None:
+        return history_disabled()
+    if kind not in STATS:
+        return jsonify({"error": f"Stats are kept for: {', '.join(STATS)}"}), 404
+    dimension, field = STATS[kind]
+
+    if dimension == "day":
+        try:
+            end = datetime.strptime(request.args.get("end") or today(), "%Y-%m-%d")
+            start = request.args.get("start")
+            start = (
+                datetime.strptime(start, "%Y-%m-%d") if start
+                else end - timedelta(days=STATS_DAYS - 1)
+            )
+        except ValueError:
+            return jsonify({"error": "start and end must look like YYYY-MM-DD"}), 400
+        rows = history.between("day", start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+    else:
+        limit = request.args.get("limit", "10")
+        if not limit.isdigit() or int(limit) == 0:
+            return jsonify({"error": "limit must be a positive integer"}), 400
+        try:
+            month = month_arg()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        rows = history.top(dimension, month, int(limit))
+    return jsonify([stats_row(row, field) for row in rows])
+
+
+@app.route("/stats/<kind>/<key>", methods=["GET"])
+def get_stats_entry(kind, key):
+    """
+    The rollup of one item, borrower, category or day
+    (?month=YYYY-MM for one month; zeros if it was never borrowed).
+    """
+    if history is None:
+        return history_disabled()
+    if kind not in STATS:
+        return jsonify({"error": f"Stats are kept for: {', '.join(STATS)}"}), 404
+    dimension, field = STATS[kind]
+    try:
+        month = month_arg() if dimension != "day" else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(stats_row(history.get(dimension, key, month), field))
+
+
+@app.route("/media/<name>/history", methods=["GET"])
+def get_media_history(name):
+    """
+    The newest borrow and return events of an item (?limit=N, default
+    50). Events moved to the archive by rotate_history are not listed.
+    """
+    if history is None:
+        return history_disabled()
+    limit = request.args.get("limit", "50")
+    if not limit.isdigit() or int(limit) == 0:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    return jsonify(history.events(name, int(limit)))
+
+
+# ---------------------------------------------------------
+# 10. METRICS AND PROFILING
+# ---------------------------------------------------------
+class TimedJSONProvider(JSONProvider):
+    """Charges JSON encoding and decoding to the "serialize" phase."""
+
+    def dumps(self, obj, **kwargs):
+        with metrics.phase("serialize"):
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        with metrics.phase("serialize"):
+            return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        with metrics.phase("serialize"):
+            return super().response(*args, **kwargs)
+
+
+def endpoint_label():
+    """The route pattern, so /media/<name> is one series, not one per item."""
+    rule = request.url_rule
+    return rule.rule if rule is not None else "unmatched"
+
+
+def record_metrics(response):
+    metrics.finish_request(request.method, endpoint_label(), response.status_code)
+    return response
+
+
+def start_profile():
+    token = profiler.start()
+    if token is not None:
+        g.profile = token
+
+
+def stop_profile(response):
+    token = g.pop("profile", None)
+    if token is not None:
+        label = f"{request.method} {request.full_path.rstrip('?')} -> {response.status_code}"
+        profiler.stop(token, label)
+    return response
+
+
+if METRICS_ENABLED:
+    app.json = TimedJSONProvider(app)
+    app.before_request(metrics.start_request)
+    app.after_request(record_metrics)
+
+if profiler is not None:
+    app.before_request(start_profile)
+    app.after_request(stop_profile)
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """
+    Prometheus text format: request counts, latency histograms per
+    endpoint and phase (load / compute / serialize / persist), store
+    writes and catalog size. Under serve.py these cover all worker
+    processes. 404 when MEDIA_METRICS=0.
+    """
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+
+    gauges = [
+        ("media_catalog_items", (), store.count()),
+        ("media_catalog_version", (), store.version),
+    ]
+    gauges.extend(
+        ("media_jobs", (("status", status),), count)
+        for status, count in job_queue.counts().items()
+    )
+    return app.response_class(
+        metrics.render(gauges), mimetype="text/plain; version=0.0.4"
+    )
+
+
+# ---------------------------------------------------------
+# 11. RATE LIMITING AND ADMISSION CONTROL
+# ---------------------------------------------------------
+def load_limits():
+    """
+    LIMITS with the MEDIA_LIMITS overrides, as {endpoint: (RateLimiter,
+    AdmissionGate)}; empty unless MEDIA_LIMITS turns them on.
+    """
+    raw = os.environ.get("MEDIA_LIMITS", "").strip()
+    if raw.lower() in ("", "0", "off", "false"):
+        return {}
+    config = dict(LIMITS)
+    if raw.lower() not in ("1", "on", "true"):
+        config.update(serialization.loads(raw))
+
+    limits = {}
+    for endpoint, limit in config.items():
+        limit = limit or {}
+        limiter = gate = None
+        if limit.get("rate"):
+            limiter = RateLimiter(limit["rate"], limit.get("burst"))
+        if limit.get("concurrency"):
+            gate = AdmissionGate(limit["concurrency"], limit.get("queue", 0), ADMISSION_TIMEOUT_SECONDS)
+        if limiter is not None or gate is not None:
+            limits[endpoint] = (limiter, gate)
+    return limits
+
+
+limits = load_limits()
+
+
+def error_response(message, status, retry_after):
+    response = jsonify({"error": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def admit():
+    """Apply the endpoint's rate limit, then wait for a turn through its gate."""
+    limiter, gate = limits.get(f"{request.method} {endpoint_label()}", (None, None))
+    if limiter is not None:
+        wait = limiter.acquire(request.remote_addr)
+        if wait:
+            return error_response("Too many requests", 429, math.ceil(wait))
+    if gate is not None:
+        if not gate.enter():
+            return error_response("Server busy, try again", 503, SHED_RETRY_SECONDS)
+        g.admitted = gate
+
+
+def hold_until_sent(response):
+    """
+    Keep the request's turn until its body has been sent: streamed
+    responses (export, ndjson search, the change stream) are generated
+    after the request has been torn down.
+    """
+    gate = g.pop("admitted", None)
+    if gate is not None:
+        response.call_on_close(gate.leave)
+    return response
+
+
+def leave(error=None):
+    # Only left over if no response was made (an error before one)
+    gate = g.pop("admitted", None)
+    if gate is not None:
+        gate.leave()
+
+
+if limits:
+    app.before_request(admit)
+    app.after_request(hold_until_sent)
+    app.teardown_request(leave)
 
 
 # ---------------------------------------------------------
 # RUN SERVER
 # ---------------------------------------------------------
+def start_background():
+    """
+    Start the overdue scheduler and the job workers of this process.
+    Called by the servers (python app.py, serve.py), never on import,
+    so scripts and tests can use the app and its store without them.
+    """
+    if OVERDUE_SCHEDULER_ENABLED:
+        overdue_scheduler.start()
+    if JOB_WORKERS > 0:
+        job_queue.start(JOB_WORKERS)
+
+
 if __name__ == "__main__":
+    start_background()
     app.run(debug=True)
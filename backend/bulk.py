@@ -0,0 +1,144 @@
+"""
+Streaming parsers for bulk request bodies.
+
+Both read the request stream in chunks and yield one decoded value at
+a time, so an import never needs the raw body and the parsed list in
+memory together. Malformed input, or a single value longer than
+MAX_VALUE_SIZE, raises ValueError with a message for the client.
+
+    iter_ndjson        one JSON value per line (JSON Lines / NDJSON)
+    iter_json_array    the elements of a single top-level JSON array
+"""
+import codecs
+import json
+
+
+# Bytes read from the request stream at a time
+READ_CHUNK = 64 * 1024
+
+# Largest single value of a bulk body (a line, or an element of a JSON
+# array, which is re-decoded after each chunk until it is complete)
+MAX_VALUE_SIZE = 1024 * 1024
+
+
+def iter_ndjson(stream):
+    """Yield the value on each non-empty line of a JSON Lines body."""
+    pending = b""
+    line_no = 0
+    while True:
+        chunk = stream.read(READ_CHUNK)
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop() if chunk else b""
+        if len(pending) > MAX_VALUE_SIZE:
+            raise ValueError(f"Line {line_no + len(lines) + 1}: longer than {MAX_VALUE_SIZE} bytes")
+
+        for line in lines:
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Line {line_no}: invalid JSON ({e})")
+
+        if not chunk:
+            return
+
+
+class _Reader:
+    """Text buffer over a byte stream, refilled on demand."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Append the next chunk to the buffer; False at end of stream."""
+        if self.eof:
+            return False
+
+        chunk = self.stream.read(READ_CHUNK)
+        if not chunk:
+            self.eof = True
+        text = self.utf8.decode(chunk, final=not chunk)
+
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, or None at end of stream."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return None
+
+    def value(self, decoder):
+        """Decode the JSON value at the current position."""
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if _cut_short(e) and self.more():
+                    continue
+                raise ValueError(f"Invalid JSON: {e.msg}")
+
+            # A value that runs up to the end of the buffer may be cut
+            # short (e.g. "1e5" read as 1), so only take it once more
+            # input follows or the stream has ended.
+            if (end == len(self.buffer) or self.buffer[end] in ".eE") and self.more():
+                continue
+
+            self.pos = end
+            return value
+
+    def more(self):
+        """fill() for the value being decoded, which must stay under MAX_VALUE_SIZE."""
+        if len(self.buffer) - self.pos > MAX_VALUE_SIZE:
+            raise ValueError(f"JSON value longer than {MAX_VALUE_SIZE} characters")
+        return self.fill()
+
+
+def _cut_short(error):
+    """
+    True if a decode error may only mean that the buffer ends inside
+    the value; anything else is invalid however much input follows.
+    """
+    if error.msg.startswith("Unterminated string"):
+        return True
+    # e.g. "tru", a "\u00" escape or an object missing its next key
+    return len(error.doc) - error.pos <= 6
+
+
+def iter_json_array(stream):
+    """Yield the elements of a JSON array body one by one."""
+    reader = _Reader(stream)
+    decoder = json.JSONDecoder()
+
+    if reader.peek() != "[":
+        raise ValueError("Expected a JSON array")
+    reader.pos += 1
+
+    if reader.peek() == "]":
+        reader.pos += 1
+    else:
+        while True:
+            if reader.peek() is None:
+                raise ValueError("Unexpected end of JSON array")
+            yield reader.value(decoder)
+
+            char = reader.peek()
+            reader.pos += 1
+            if char == "]":
+                break
+            if char != ",":
+                raise ValueError("Expected ',' or ']' in JSON array")
+
+    if reader.peek() is not None:
+        raise ValueError("Unexpected data after JSON array")
@@ -0,0 +1,176 @@
+"""
+Cover images for GET /media/<name>/cover.
+
+Covers are the files in picss/ named by an item's "image" field.
+Resized variants (?size=WxH) are generated on first request with
+Pillow and kept in a content-addressed cache: the file name is the
+SHA-256 of the source image plus the size, so a replaced cover gets a
+new name (and a new ETag) and stale variants are never served.
+
+Pillow is optional. Without it every request gets the original file.
+
+Fill the cache for the whole catalog ahead of time with:
+    python backend/covers.py [--sizes 300x420,100x140]
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+
+from werkzeug.security import safe_join
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # covers are served at full size
+    Image = None
+
+
+# Where the original covers live (MEDIA_IMAGE_DIR overrides it)
+IMAGE_DIR = os.environ.get(
+    "MEDIA_IMAGE_DIR", os.path.join(os.path.dirname(__file__), "..", "picss")
+)
+
+# Generated variants (MEDIA_COVER_CACHE overrides it)
+CACHE_DIR = os.environ.get(
+    "MEDIA_COVER_CACHE", os.path.join(os.path.dirname(__file__), "cover_cache")
+)
+
+# Sizes generated by the pre-generation command by default (the
+# frontend's cover panel)
+THUMBNAIL_SIZES = ("300x420",)
+
+# Largest width/height a client may ask for
+MAX_DIMENSION = 2000
+
+JPEG_QUALITY = 85
+
+# (path, mtime, size) -> SHA-256 of the file, so a source is hashed once
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def parse_size(text):
+    """"WxH" -> (width, height); raises ValueError with a message for the client."""
+    try:
+        width, height = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise ValueError("size must be WIDTHxHEIGHT, e.g. 300x420")
+    if not (0 < width <= MAX_DIMENSION and 0 < height <= MAX_DIMENSION):
+        raise ValueError(f"size must be between 1x1 and {MAX_DIMENSION}x{MAX_DIMENSION}")
+    return width, height
+
+
+def source_path(filename):
+    """Path of a cover in IMAGE_DIR, or None if it is missing or outside it."""
+    if not filename:
+        return None
+    path = safe_join(IMAGE_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return path
+
+
+def source_digest(path):
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    digest = _digests.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        with _digests_lock:
+            _digests[key] = digest
+    return digest
+
+
+def cover_file(filename, size=None):
+    """
+    File to send for a cover, as (path, etag). With a size and Pillow
+    available this is the cached variant, generated if needed;
+    otherwise the original. Raises FileNotFoundError.
+    """
+    path = source_path(filename)
+    if path is None:
+        raise FileNotFoundError(filename)
+
+    digest = source_digest(path)
+    if size is None or Image is None:
+        return path, digest
+
+    width, height = size
+    name = f"{digest}-{width}x{height}"
+    variant = os.path.join(CACHE_DIR, digest[:2], name + ".jpg")
+    if not os.path.exists(variant):
+        render(path, variant, size)
+    return variant, name
+
+
+def render(source, target, size):
+    """Write a JPEG of source scaled to fit in size (never enlarged)."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size, Image.LANCZOS)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+        # Atomic: concurrent requests may render the same variant, and
+        # a reader must never get half a file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, "JPEG", quality=JPEG_QUALITY, optimize=True)
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def pregenerate(items, sizes, progress=None):
+    """
+    Generate every size of every item's cover. Returns (generated, missing).
+    progress(done, total) is called after each cover if given.
+    """
+    filenames = list(dict.fromkeys(item.get("image") for item in items if item.get("image")))
+    generated = missing = 0
+    for done, filename in enumerate(filenames, 1):
+        for size in sizes:
+            try:
+                cover_file(filename, size)
+                generated += 1
+            except FileNotFoundError:
+                missing += 1
+                break
+        if progress is not None:
+            progress(done, len(filenames))
+    return generated, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate cover thumbnails for the catalog.")
+    parser.add_argument("--sizes", default=",".join(THUMBNAIL_SIZES),
+                        help="comma-separated WxH sizes (default: %(default)s)")
+    args = parser.parse_args()
+
+    if Image is None:
+        sys.exit("Pillow is not installed; covers are served at full size")
+    try:
+        sizes = [parse_size(size) for size in args.sizes.split(",") if size]
+    except ValueError as e:
+        sys.exit(str(e))
+
+    # Same catalog as the server (MEDIA_STORAGE / MEDIA_DATA_FILE)
+    from app import store
+
+    # A copy: writes change the catalog dict in place
+    generated, missing = pregenerate(list(store.load().values()), sizes)
+    print(f"Generated {generated} thumbnails in {CACHE_DIR} ({missing} covers missing)")
+
+
+if __name__ == "__main__":
+    main()
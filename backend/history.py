@@ -0,0 +1,385 @@
+"""
+Borrowing history.
+
+A borrow or return used to only overwrite the item's borrowed_by,
+borrow_date and due_date, so nothing was left of it afterwards. The
+EventLog records each one as an append-only event and keeps rollups
+next to the events, updated in the same transaction:
+
+    dimension   key                 periods
+    all         ""                  all time ("") and per month ("2026-10")
+    item        item name           all time and per month
+    borrower    borrower name       all time and per month
+    category    category            all time and per month
+    day         "YYYY-MM-DD"        all time
+
+Every rollup row counts borrows, returns and loans (returns whose
+borrow date is known) with their total length in days. The /stats
+endpoints read a few rows of it and never the events: "most borrowed
+this month" walks an index of the month's item rows by borrows, and
+"average loan length per category" is one row per category.
+
+Events and rollups live in an SQLite database (history.sqlite3 next to
+the catalog) shared by all server processes, like the job table.
+
+rotate() moves old events out of the table into gzipped JSON Lines
+files in an archive directory, named by the range of event ids they
+hold; the rollups keep counting them. backfill() rebuilds every rollup
+from the archives and the table (e.g. after rollups were added or
+lost), streaming the events through an aggregate that is written out
+whenever it grows past FLUSH_KEYS rows. Events recorded during a
+backfill are added before the new rollups replace the old ones.
+"""
+import gzip
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from datetime import date, timedelta
+
+import sqlite_db
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    category TEXT,
+    borrower TEXT,
+    days INTEGER,
+    loan_days INTEGER
+);
+CREATE INDEX IF NOT EXISTS events_name ON events (name, id);
+CREATE INDEX IF NOT EXISTS events_day ON events (day);
+CREATE INDEX IF NOT EXISTS rollups_top ON rollups (dimension, period, borrows DESC, key);
+"""
+
+ROLLUP_TABLE = """
+CREATE TABLE IF NOT EXISTS {table} (
+    dimension TEXT NOT NULL,
+    period TEXT NOT NULL,
+    key TEXT NOT NULL,
+    borrows INTEGER NOT NULL,
+    returns INTEGER NOT NULL,
+    loans INTEGER NOT NULL,
+    loan_days INTEGER NOT NULL,
+    PRIMARY KEY (dimension, period, key)
+)
+"""
+
+UPSERT_ROLLUP = """
+INSERT INTO {table} (dimension, period, key, borrows, returns, loans, loan_days)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (dimension, period, key) DO UPDATE SET
+    borrows = borrows + excluded.borrows,
+    returns = returns + excluded.returns,
+    loans = loans + excluded.loans,
+    loan_days = loan_days + excluded.loan_days
+"""
+
+EVENT_COLUMNS = ("ts", "day", "kind", "name", "category", "borrower", "days", "loan_days")
+INSERT_EVENT = (
+    f"INSERT INTO events ({', '.join(EVENT_COLUMNS)})"
+    f" VALUES ({', '.join('?' * len(EVENT_COLUMNS))})"
+)
+
+DIMENSIONS = ("all", "item", "borrower", "category", "day")
+
+# Events younger than this stay in the table when the log is rotated
+KEEP_DAYS = 90
+
+# Rollup rows a backfill aggregates in memory before writing them out
+FLUSH_KEYS = 50_000
+
+ARCHIVE_NAME = re.compile(r"^events-(\d+)-(\d+)\.jsonl\.gz$")
+
+
+# ---------------------------------------------------------
+# EVENTS
+# ---------------------------------------------------------
+def days_between(start, end):
+    """Whole days from one "YYYY-MM-DD" date to another, or None."""
+    try:
+        return (date.fromisoformat(end) - date.fromisoformat(start)).days
+    except (TypeError, ValueError):
+        return None
+
+
+def change_event(name, before, after, day):
+    """
+    The event of a catalog change: a borrow if `after` is borrowed and
+    `before` was not, a return if it is the other way round. None for
+    any other change.
+    """
+    was_borrowed = before is not None and before.get("status") == "borrowed"
+    is_borrowed = after is not None and after.get("status") == "borrowed"
+    if is_borrowed and not was_borrowed:
+        return {
+            "ts": time.time(),
+            "day": after.get("borrow_date") or day,
+            "kind": "borrow",
+            "name": name,
+            "category": after.get("category"),
+            "borrower": after.get("borrowed_by"),
+            "days": days_between(after.get("borrow_date"), after.get("due_date")),
+            "loan_days": None,
+        }
+    if was_borrowed and not is_borrowed:
+        return {
+            "ts": time.time(),
+            "day": day,
+            "kind": "return",
+            "name": name,
+            "category": before.get("category"),
+            "borrower": before.get("borrowed_by"),
+            "days": None,
+            "loan_days": days_between(before.get("borrow_date"), day),
+        }
+    return None
+
+
+def rollup_rows(event):
+    """(dimension, period, key, borrows, returns, loans, loan_days) rows an event adds."""
+    borrow = event["kind"] == "borrow"
+    loan_days = event.get("loan_days")
+    loan = not borrow and loan_days is not None
+    counts = (int(borrow), int(not borrow), int(loan), loan_days if loan else 0)
+
+    keys = [("all", ""), ("item", event["name"])]
+    if event.get("borrower") is not None:
+        keys.append(("borrower", event["borrower"]))
+    if event.get("category") is not None:
+        keys.append(("category", event["category"]))
+
+    month = event["day"][:7]
+    rows = [(dimension, period, key) + counts for dimension, key in keys for period in ("", month)]
+    rows.append(("day", "", event["day"]) + counts)
+    return rows
+
+
+def describe(row):
+    """A rollup row as returned by the /stats endpoints."""
+    key, borrows, returns, loans, loan_days = row
+    return {
+        "key": key,
+        "borrows": borrows,
+        "returns": returns,
+        "loans": loans,
+        "average_loan_days": round(loan_days / loans, 1) if loans else None,
+    }
+
+
+# ---------------------------------------------------------
+# EVENT LOG
+# ---------------------------------------------------------
+class EventLog:
+    """Append-only borrow/return events plus their rollups."""
+
+    def __init__(self, path, archive_dir=None):
+        self.path = path
+        self.archive_dir = archive_dir or os.path.splitext(path)[0] + "-archive"
+
+        sqlite_db.create(self.path, ROLLUP_TABLE.format(table="rollups") + ";" + SCHEMA)
+
+    def _transaction(self, write=True):
+        """One transaction on this database (see sqlite_db.transaction())."""
+        return sqlite_db.transaction(self.path, write)
+
+    def record(self, events):
+        """Append events and add them to the rollups, in one transaction."""
+        if not events:
+            return
+        with self._transaction() as db:
+            db.executemany(INSERT_EVENT, [
+                tuple(event.get(column) for column in EVENT_COLUMNS) for event in events
+            ])
+            db.executemany(UPSERT_ROLLUP.format(table="rollups"), [
+                row for event in events for row in rollup_rows(event)
+            ])
+
+    # -----------------------------------------------------
+    # ROLLUPS
+    # -----------------------------------------------------
+    def get(self, dimension, key, month=None):
+        """The rollup of one key, all time or for one month ("YYYY-MM")."""
+        with self._transaction(write=False) as db:
+            row = db.execute(
+                "SELECT key, borrows, returns, loans, loan_days FROM rollups"
+                " WHERE dimension = ? AND period = ? AND key = ?",
+                (dimension, month or "", key),
+            ).fetchone()
+        return describe(row or (key, 0, 0, 0, 0))
+
+    def top(self, dimension, month=None, limit=10):
+        """The keys borrowed most (all time or in one month), most first."""
+        with self._transaction(write=False) as db:
+            rows = db.execute(
+                "SELECT key, borrows, returns, loans, loan_days FROM rollups"
+                " WHERE dimension = ? AND period = ? ORDER BY borrows DESC, key LIMIT ?",
+                (dimension, month or "", limit),
+            ).fetchall()
+        return [describe(row) for row in rows]
+
+    def between(self, dimension, start, end, month=None):
+        """The rollups of the keys from start to end (inclusive), in key order."""
+        with self._transaction(write=False) as db:
+            rows = db.execute(
+                "SELECT key, borrows, returns, loans, loan_days FROM rollups"
+                " WHERE dimension = ? AND period = ? AND key BETWEEN ? AND ? ORDER BY key",
+                (dimension, month or "", start, end),
+            ).fetchall()
+        return [describe(row) for row in rows]
+
+    def events(self, name, limit=50):
+        """The newest events of one item still in the table, newest first."""
+        with self._transaction(write=False) as db:
+            rows = db.execute(
+                f"SELECT id, {', '.join(EVENT_COLUMNS)} FROM events"
+                " WHERE name = ? ORDER BY id DESC LIMIT ?",
+                (name, limit),
+            ).fetchall()
+        return [dict(zip(("id",) + EVENT_COLUMNS, row)) for row in rows]
+
+    # -----------------------------------------------------
+    # ROTATION
+    # -----------------------------------------------------
+    def archives(self):
+        """(first id, last id, path) of every archive file, oldest first."""
+        try:
+            names = os.listdir(self.archive_dir)
+        except FileNotFoundError:
+            return []
+        found = []
+        for name in names:
+            match = ARCHIVE_NAME.match(name)
+            if match:
+                found.append((int(match[1]), int(match[2]), os.path.join(self.archive_dir, name)))
+        return sorted(found)
+
+    def _archived_through(self):
+        archives = self.archives()
+        return archives[-1][1] if archives else 0
+
+    def rotate(self, keep_days=KEEP_DAYS, today=None):
+        """
+        Move the events older than keep_days (and any recorded before
+        them) into a new archive file. Returns (path, events moved);
+        path is None if there was nothing to move.
+        """
+        cutoff = ((today or date.today()) - timedelta(days=keep_days)).isoformat()
+        archived = self._archived_through()
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.archive_dir, suffix=".tmp")
+        first = last = None
+        moved = 0
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+                with self._transaction(write=False) as db:
+                    rows = db.execute(
+                        f"SELECT id, {', '.join(EVENT_COLUMNS)} FROM events"
+                        " WHERE id > ? AND id <= (SELECT MAX(id) FROM events WHERE day < ?)"
+                        " ORDER BY id",
+                        (archived, cutoff),
+                    )
+                    for row in rows:
+                        f.write(json.dumps(dict(zip(("id",) + EVENT_COLUMNS, row))) + "\n")
+                        first = row[0] if first is None else first
+                        last = row[0]
+                        moved += 1
+            if not moved:
+                os.remove(tmp_path)
+                return None, 0
+            path = os.path.join(self.archive_dir, f"events-{first:012d}-{last:012d}.jsonl.gz")
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        # Also drops events a rotation cut short had archived already
+        with self._transaction() as db:
+            db.execute("DELETE FROM events WHERE id <= ?", (last,))
+        return path, moved
+
+    # -----------------------------------------------------
+    # BACKFILL
+    # -----------------------------------------------------
+    def stream(self):
+        """Every event, archived or not, oldest first."""
+        with self._transaction(write=False) as db:
+            # Start reading before looking for archives: this snapshot
+            # still has any events a rotation moves meanwhile
+            db.execute("SELECT 1 FROM events LIMIT 1").fetchall()
+            archived = 0
+            for _, last, path in self.archives():
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        yield json.loads(line)
+                archived = last
+
+            rows = db.execute(
+                f"SELECT id, {', '.join(EVENT_COLUMNS)} FROM events WHERE id > ? ORDER BY id",
+                (archived,),
+            )
+            for row in rows:
+                yield dict(zip(("id",) + EVENT_COLUMNS, row))
+
+    def _flush(self, table, totals):
+        if not totals:
+            return
+        with self._transaction() as db:
+            db.executemany(UPSERT_ROLLUP.format(table=table), [
+                key + tuple(counts) for key, counts in totals.items()
+            ])
+        totals.clear()
+
+    def backfill(self, progress=None, flush_keys=FLUSH_KEYS):
+        """
+        Rebuild all rollups from the events. progress(events read) is
+        called now and then. Returns the number of events read.
+        """
+        table = f"rollups_rebuild_{uuid.uuid4().hex[:8]}"
+        with self._transaction() as db:
+            db.execute(ROLLUP_TABLE.format(table=table))
+
+        try:
+            totals = {}
+            read = upto = 0
+            for event in self.stream():
+                upto = event["id"]
+                for row in rollup_rows(event):
+                    counts = totals.get(row[:3])
+                    if counts is None:
+                        totals[row[:3]] = list(row[3:])
+                    else:
+                        for i, value in enumerate(row[3:]):
+                            counts[i] += value
+                read += 1
+                if len(totals) >= flush_keys:
+                    self._flush(table, totals)
+                if progress is not None and read % 1000 == 0:
+                    progress(read)
+            self._flush(table, totals)
+
+            with self._transaction() as db:
+                # Events recorded while the others were read
+                tail = db.execute(
+                    f"SELECT {', '.join(EVENT_COLUMNS)} FROM events WHERE id > ? ORDER BY id", (upto,)
+                ).fetchall()
+                db.executemany(UPSERT_ROLLUP.format(table=table), [
+                    row for values in tail for row in rollup_rows(dict(zip(EVENT_COLUMNS, values)))
+                ])
+                db.execute("DELETE FROM rollups")
+                db.execute(f"INSERT INTO rollups SELECT * FROM {table}")
+            if progress is not None:
+                progress(read)
+            return read + len(tail)
+        finally:
+            with self._transaction() as db:
+                db.execute(f"DROP TABLE IF EXISTS {table}")
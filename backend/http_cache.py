@@ -0,0 +1,68 @@
+"""
+Memoized serialized responses for the read endpoints.
+
+Entries are keyed by (catalog ETag, request path + query string), so a
+mutation never has to invalidate anything: the ETag changes and old
+entries simply stop being hit and age out of the LRU.
+"""
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """Thread-safe LRU of response bodies with an entry and byte budget."""
+
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (body, mimetype, headers) or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, mimetype, headers):
+        if len(body) > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+
+            self._entries[key] = (body, mimetype, headers)
+            self._bytes += len(body)
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def tee(self, key, chunks, mimetype, headers):
+        """
+        Pass a streamed body through unchanged and store the complete
+        body once the stream finishes (unless it outgrows the budget).
+        """
+        parts = []
+        size = 0
+        for chunk in chunks:
+            yield chunk
+            if parts is not None:
+                data = chunk.encode() if isinstance(chunk, str) else chunk
+                parts.append(data)
+                size += len(data)
+                if size > self.max_bytes:
+                    parts = None
+
+        if parts is not None:
+            self.put(key, b"".join(parts), mimetype, headers)
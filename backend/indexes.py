@@ -0,0 +1,99 @@
+"""
+In-memory secondary indexes over the catalog.
+
+The store keeps these up to date on every create/delete/borrow/return,
+so lookups by category, status or author cost O(result) instead of a
+scan over the whole catalog. Borrowed items are also kept in a list
+ordered by due date, which turns "what is overdue on day X" into a
+binary search plus a range scan, and all names are kept sorted for
+cursor-based pagination.
+"""
+from bisect import bisect_left, bisect_right, insort
+
+
+# Item fields with an exact-match index: field -> {value -> set of names}
+INDEXED_FIELDS = ("category", "status", "author")
+
+
+class CatalogIndexes:
+    """Secondary indexes for one catalog dict."""
+
+    def __init__(self, data=None):
+        self._by_field = {field: {} for field in INDEXED_FIELDS}
+        # Sorted (due_date, name) pairs. Dates are "YYYY-MM-DD" strings,
+        # so string order is date order.
+        self._due = []
+        self._names = sorted(data or ())
+
+        for name, item in (data or {}).items():
+            self.add(name, item)
+
+    # -----------------------------------------------------
+    # MAINTENANCE
+    # -----------------------------------------------------
+    def update(self, name, old, new):
+        """Reflect a change of one item (old or new may be None)."""
+        if old is not None:
+            self.remove(name, old)
+        if new is not None:
+            self.add(name, new)
+
+        # The sorted name list only changes on create and delete
+        if old is None and new is not None:
+            insort(self._names, name)
+        elif old is not None and new is None:
+            i = bisect_left(self._names, name)
+            if i < len(self._names) and self._names[i] == name:
+                del self._names[i]
+
+    def add(self, name, item):
+        for field, index in self._by_field.items():
+            value = item.get(field)
+            if value is not None:
+                index.setdefault(value, set()).add(name)
+
+        if item.get("due_date"):
+            insort(self._due, (item["due_date"], name))
+
+    def remove(self, name, item):
+        for field, index in self._by_field.items():
+            names = index.get(item.get(field))
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del index[item.get(field)]
+
+        if item.get("due_date"):
+            key = (item["due_date"], name)
+            i = bisect_left(self._due, key)
+            if i < len(self._due) and self._due[i] == key:
+                del self._due[i]
+
+    # -----------------------------------------------------
+    # LOOKUPS
+    # -----------------------------------------------------
+    def names_with(self, field, value):
+        """Names of the items whose `field` equals `value`."""
+        return list(self._by_field[field].get(value, ()))
+
+    def values(self, field):
+        """Distinct values of an indexed field."""
+        return list(self._by_field[field])
+
+    def due_between(self, start=None, end=None):
+        """
+        Names of the items due on or after `start` and strictly before
+        `end` (either bound may be None), ordered by due date.
+        """
+        lo = 0 if start is None else bisect_left(self._due, (start,))
+        hi = len(self._due) if end is None else bisect_left(self._due, (end,))
+        return [name for _, name in self._due[lo:hi]]
+
+    def names_after(self, after=None, limit=None):
+        """
+        Up to `limit` names in sorted order, starting after `after`
+        (from the beginning if None).
+        """
+        start = 0 if after is None else bisect_right(self._names, after)
+        end = None if limit is None else start + limit
+        return self._names[start:end]
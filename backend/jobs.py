@@ -0,0 +1,349 @@
+"""
+Background jobs.
+
+Work that does not have to finish inside the request (bulk imports,
+cover thumbnails, journal compaction) is handed to a JobQueue: the
+endpoint records a job and answers 202 with its id, a few worker
+threads run it, and GET /jobs/<id> reports its status and progress.
+Jobs that write to the catalog do so in small transactions, so borrows
+and returns are not held up behind them.
+
+Jobs are rows of an SQLite table (jobs.sqlite3 next to the catalog),
+so they survive a restart and every server process sees all of them.
+A worker claims the queued job with the highest priority (oldest
+first) inside a write transaction, so with several processes each job
+still runs once. A job that raises is retried with exponential backoff
+until its kind's attempts are used up and then marked failed; raising
+JobError fails it at once. Workers heartbeat their running jobs, and a
+job whose process died is put back in the queue.
+
+Handlers are registered per kind and called as fn(job, params) with
+the JSON params the job was submitted with. job.progress(done, total)
+reports progress; the return value (JSON) becomes the job's result.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import sqlite_db
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    run_after REAL NOT NULL,
+    heartbeat REAL,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created_at);
+"""
+
+STATUSES = ("queued", "running", "done", "failed")
+
+# Worker threads per process
+DEFAULT_WORKERS = 2
+
+# Attempts of a job whose handler keeps raising, and the wait before
+# the first retry (doubled for every further one)
+DEFAULT_ATTEMPTS = 3
+RETRY_SECONDS = 2.0
+
+# Idle workers look for jobs of other processes (and due retries) this often
+POLL_SECONDS = 1.0
+
+# Running jobs are heartbeated this often; one whose heartbeat is older
+# than STALE_SECONDS lost its process and is queued again
+HEARTBEAT_SECONDS = 5.0
+STALE_SECONDS = 30.0
+
+# Progress is written at most this often (and when a job reaches its total)
+PROGRESS_SECONDS = 0.5
+
+# Finished jobs are kept this long for GET /jobs/<id>
+KEEP_SECONDS = 7 * 24 * 60 * 60
+
+log = logging.getLogger(__name__)
+
+
+class JobError(Exception):
+    """Raised by a handler to fail its job without retrying."""
+
+
+def iso(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds")
+
+
+class Job:
+    """The running job, as seen by its handler."""
+
+    def __init__(self, queue, job_id, kind, attempt):
+        self.queue = queue
+        self.id = job_id
+        self.kind = kind
+        self.attempt = attempt
+        self._reported = 0.0
+
+    def progress(self, done, total=None):
+        """Report that `done` of `total` units of work are finished."""
+        now = time.monotonic()
+        if now - self._reported < PROGRESS_SECONDS and done != total:
+            return
+        self._reported = now
+        with self.queue._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET done = ?, total = COALESCE(?, total), heartbeat = ? WHERE id = ?",
+                (done, total, time.time(), self.id),
+            )
+
+
+class JobQueue:
+    """Persistent job table plus the worker threads of this process."""
+
+    def __init__(self, path, workers=DEFAULT_WORKERS, poll=POLL_SECONDS):
+        self.path = path
+        self.workers = workers
+        self.poll = poll
+        self.owner = uuid.uuid4().hex[:12]
+        self._handlers = {}
+        self._wakeup = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+
+        sqlite_db.create(self.path, SCHEMA)
+
+    def _transaction(self, write=True):
+        """One transaction on this database (see sqlite_db.transaction())."""
+        return sqlite_db.transaction(self.path, write)
+
+    def _select(self, sql, params=()):
+        """Rows of a query as dicts."""
+        with self._transaction(write=False) as db:
+            cursor = db.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def register(self, kind, fn, priority=0, attempts=DEFAULT_ATTEMPTS):
+        """Run jobs of `kind` with fn(job, params); priority is the default for submit()."""
+        self._handlers[kind] = (fn, priority, attempts)
+
+    @property
+    def kinds(self):
+        return sorted(self._handlers)
+
+    # -----------------------------------------------------
+    # SUBMITTING AND STATUS
+    # -----------------------------------------------------
+    def submit(self, kind, params=None, priority=None):
+        """Queue a job (higher priority runs first). Returns it as a dict."""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        _, default_priority, attempts = self._handlers[kind]
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO jobs (id, kind, priority, status, params, max_attempts, created_at, run_after)"
+                " VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, default_priority if priority is None else priority,
+                 json.dumps(params), attempts, now, now),
+            )
+        with self._wakeup:
+            self._wakeup.notify()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """The job as a dict, or None if it does not exist (or was cleaned up)."""
+        rows = self._select("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._describe(rows[0]) if rows else None
+
+    def recent(self, status=None, limit=50):
+        """Newest jobs first, optionally only those with one status."""
+        sql = "SELECT * FROM jobs"
+        params = []
+        if status is not None:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        return [self._describe(row) for row in self._select(sql, params)]
+
+    def counts(self):
+        """{status: number of jobs}."""
+        with self._transaction(write=False) as db:
+            found = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        return {status: found.get(status, 0) for status in STATUSES}
+
+    @staticmethod
+    def _describe(row):
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "priority": row["priority"],
+            "attempts": row["attempts"],
+            "max_attempts": row["max_attempts"],
+            "progress": {"done": row["done"], "total": row["total"]},
+            "result": json.loads(row["result"]) if row["result"] is not None else None,
+            "error": row["error"],
+            "created_at": iso(row["created_at"]),
+            "started_at": iso(row["started_at"]),
+            "finished_at": iso(row["finished_at"]),
+        }
+
+    # -----------------------------------------------------
+    # RUNNING
+    # -----------------------------------------------------
+    def _claim(self):
+        """Mark the next due job running for this process. Returns (id, kind, params, attempt) or None."""
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT id, kind, params, attempts FROM jobs"
+                " WHERE status = 'queued' AND run_after <= ?"
+                " ORDER BY priority DESC, created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, kind, params, attempts = row
+            db.execute(
+                "UPDATE jobs SET status = 'running', attempts = ?, started_at = ?,"
+                " heartbeat = ?, owner = ? WHERE id = ?",
+                (attempts + 1, now, now, self.owner, job_id),
+            )
+        return job_id, kind, json.loads(params), attempts + 1
+
+    def run_next(self):
+        """Run the next due job in this thread. Returns False if there was none."""
+        claimed = self._claim()
+        if claimed is None:
+            return False
+        job_id, kind, params, attempt = claimed
+
+        try:
+            if kind not in self._handlers:
+                raise JobError(f"No handler for job kind {kind}")
+            fn = self._handlers[kind][0]
+            result = fn(Job(self, job_id, kind, attempt), params)
+        except Exception as e:
+            self._failed(job_id, attempt, e)
+        else:
+            with self._transaction() as db:
+                db.execute(
+                    "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ?,"
+                    " done = COALESCE(total, done) WHERE id = ?",
+                    (json.dumps(result), time.time(), job_id),
+                )
+        return True
+
+    def _failed(self, job_id, attempt, error):
+        with self._transaction() as db:
+            max_attempts = db.execute(
+                "SELECT max_attempts FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()[0]
+            if isinstance(error, JobError) or attempt >= max_attempts:
+                log.warning("Job %s failed: %s", job_id, error)
+                db.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                    (str(error), time.time(), job_id),
+                )
+            else:
+                log.info("Job %s failed (attempt %d), retrying: %s", job_id, attempt, error)
+                db.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, run_after = ? WHERE id = ?",
+                    (str(error), time.time() + RETRY_SECONDS * 2 ** (attempt - 1), job_id),
+                )
+
+    def run_pending(self):
+        """Run every job that is due now, in this thread. Returns how many ran."""
+        ran = 0
+        while self.run_next():
+            ran += 1
+        return ran
+
+    # -----------------------------------------------------
+    # HOUSEKEEPING
+    # -----------------------------------------------------
+    def maintain(self):
+        """Heartbeat this process's running jobs, requeue orphaned ones, drop old ones."""
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE status = 'running' AND owner = ?",
+                (now, self.owner),
+            )
+            db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,"
+                " error = 'Worker process stopped', run_after = ?,"
+                " finished_at = CASE WHEN attempts >= max_attempts THEN ? END"
+                " WHERE status = 'running' AND heartbeat < ?",
+                (now, now, now - STALE_SECONDS),
+            )
+            db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (now - KEEP_SECONDS,),
+            )
+
+    # -----------------------------------------------------
+    # LIFECYCLE
+    # -----------------------------------------------------
+    def start(self, workers=None):
+        """Start the worker threads (and the heartbeat) of this process."""
+        if workers is not None:
+            self.workers = workers
+        # Forked server workers start with the master's queue object;
+        # each needs its own id to heartbeat only its own jobs
+        self.owner = uuid.uuid4().hex[:12]
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop after the running jobs finish."""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                if self.run_next():
+                    continue
+            except Exception:
+                log.exception("Job worker failed")
+            with self._wakeup:
+                self._wakeup.wait(self.poll)
+
+    def _heartbeat(self):
+        while not self._stop.is_set():
+            try:
+                self.maintain()
+            except Exception:
+                log.exception("Job heartbeat failed")
+            self._stop.wait(HEARTBEAT_SECONDS)
@@ -0,0 +1,460 @@
+"""
+Request metrics and a sampling profiler.
+
+Every request is split into four phases:
+
+    load        reading the catalog (store reads, taking the lock)
+    persist     writing it (store writes, committing a transaction)
+    serialize   encoding JSON responses and decoding request bodies
+    compute     everything else: validation, filtering, the handler
+
+instrument() wraps the store's methods so their time is charged to
+the current request; the app wraps its JSON provider with phase().
+Phases do not nest: a store call made inside another one (e.g. load()
+inside transaction()) counts once, for the outer phase.
+
+Metrics are kept per process. When several worker processes serve
+the app (serve.py), MEDIA_METRICS_DIR names a directory they share:
+each process writes its metrics there every FLUSH_SECONDS and
+GET /metrics adds up all the files, so any worker answers for all.
+
+The profiler is opt-in (MEDIA_PROFILE=cprofile or tracemalloc). It
+profiles one request in every MEDIA_PROFILE_EVERY and writes a report
+per sampled request to MEDIA_PROFILE_DIR. Only one request is profiled
+at a time. tracemalloc is process-wide, so other threads' allocations
+during the sample show up too.
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PHASES = ("load", "compute", "serialize", "persist")
+
+# Store methods charged to the "load" and "persist" phases
+READ_METHODS = (
+    "load", "get", "get_many", "select", "due_between", "list_items",
+    "search", "etag", "count", "changes_since",
+)
+WRITE_METHODS = ("save", "put", "put_many", "delete")
+
+# Directory shared by the worker processes of one server, or None
+SHARED_DIR = os.environ.get("MEDIA_METRICS_DIR") or None
+# How often a process writes its metrics to SHARED_DIR
+FLUSH_SECONDS = 1.0
+
+# Sampling profiler: "cprofile", "tracemalloc" or "" (off)
+PROFILE_MODE = os.environ.get("MEDIA_PROFILE", "")
+PROFILE_EVERY = int(os.environ.get("MEDIA_PROFILE_EVERY", "100"))
+PROFILE_DIR = os.environ.get(
+    "MEDIA_PROFILE_DIR", os.path.join(os.path.dirname(__file__), "profiles")
+)
+# Lines in a written report
+PROFILE_TOP = 40
+
+HELP = {
+    "media_requests_total": ("counter", "Requests handled, by endpoint and status."),
+    "media_request_duration_seconds": ("histogram", "Time to build a response."),
+    "media_request_phase_seconds": ("histogram", "Time spent per request phase."),
+    "media_requests_coalesced_total": ("counter", "Reads answered with another request's result."),
+    "media_store_writes_total": ("counter", "Store write calls, by operation."),
+    "media_store_items_written_total": ("counter", "Items written to the store."),
+    "media_catalog_items": ("gauge", "Items in the catalog."),
+    "media_catalog_version": ("gauge", "Current catalog version."),
+    "media_jobs": ("gauge", "Background jobs, by status."),
+    "media_history_events_total": ("counter", "Borrow and return events recorded, by kind."),
+    "media_profiles_written_total": ("counter", "Profiler reports written."),
+}
+
+log = logging.getLogger(__name__)
+
+
+class _State(threading.local):
+    """Per-thread state of the request being handled."""
+    start = None
+    phases = None
+    busy = False  # inside a phase
+
+
+_local = _State()
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Counters and histograms keyed by (metric name, label pairs)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self.dirty = False  # changed since the last snapshot()
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self.dirty = True
+
+    def observe(self, name, labels, value):
+        self.observe_many([(name, labels, value)])
+
+    def observe_many(self, observations):
+        """Record several (name, labels, value) under one lock."""
+        with self._lock:
+            for name, labels, value in observations:
+                key = (name, labels)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram()
+                histogram.observe(value)
+            self.dirty = True
+
+    # -----------------------------------------------------
+    # SHARING BETWEEN PROCESSES
+    # -----------------------------------------------------
+    def snapshot(self):
+        """JSON-serializable copy of everything recorded."""
+        with self._lock:
+            self.dirty = False
+            return {
+                "counters": [
+                    [name, labels, value] for (name, labels), value in self._counters.items()
+                ],
+                "histograms": [
+                    [name, labels, histogram.counts, histogram.sum, histogram.count]
+                    for (name, labels), histogram in self._histograms.items()
+                ],
+            }
+
+    def merge(self, snapshot):
+        """Add a snapshot (possibly from another process) to these metrics."""
+        with self._lock:
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, labels, counts, total, count in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram()
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+
+    def render(self, gauges=()):
+        """Prometheus text exposition format; gauges are (name, labels, value)."""
+        samples = {}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                samples.setdefault(name, []).append(sample(name, labels, value))
+
+            for (name, labels), histogram in self._histograms.items():
+                lines = samples.setdefault(name, [])
+                total = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                    total += count
+                    lines.append(sample(name + "_bucket", labels + (("le", str(bound)),), total))
+                lines.append(sample(name + "_sum", labels, histogram.sum))
+                lines.append(sample(name + "_count", labels, histogram.count))
+
+        for name, labels, value in gauges:
+            samples.setdefault(name, []).append(sample(name, labels, value))
+
+        out = []
+        for name in sorted(samples):
+            kind, text = HELP.get(name, ("untyped", ""))
+            out.append(f"# HELP {name} {text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(sorted(samples[name]))
+        return "\n".join(out) + "\n"
+
+
+def sample(name, labels, value):
+    if labels:
+        pairs = ",".join(f'{key}="{escape(value)}"' for key, value in labels)
+        name = f"{name}{{{pairs}}}"
+    return f"{name} {value}"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Metrics()
+
+# Process whose flusher thread is running (a forked worker starts its own)
+_flusher_pid = None
+
+
+def render(gauges=()):
+    """Prometheus text for this process, or for all of them with SHARED_DIR."""
+    if SHARED_DIR is None:
+        return registry.render(gauges)
+
+    write_shared()
+    combined = Metrics()
+    for filename in os.listdir(SHARED_DIR):
+        if filename.startswith("metrics-") and filename.endswith(".json"):
+            try:
+                with open(os.path.join(SHARED_DIR, filename), encoding="utf-8") as f:
+                    combined.merge(json.load(f))
+            except (OSError, ValueError):
+                pass  # a process that just exited; its numbers are lost
+    return combined.render(gauges)
+
+
+def write_shared():
+    """Write this process's metrics to SHARED_DIR (atomically)."""
+    path = os.path.join(SHARED_DIR, f"metrics-{os.getpid()}.json")
+    fd, tmp_path = tempfile.mkstemp(dir=SHARED_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _flush_forever():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        if registry.dirty:
+            try:
+                write_shared()
+            except OSError:
+                log.exception("Could not write metrics to %s", SHARED_DIR)
+
+
+def _start_flusher():
+    global _flusher_pid
+    _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_forever, name="metrics-flusher", daemon=True).start()
+
+
+# ---------------------------------------------------------
+# REQUEST PHASES
+# ---------------------------------------------------------
+def start_request():
+    _local.start = time.perf_counter()
+    _local.phases = {}
+
+
+def finish_request(method, endpoint, status):
+    """Record the current request's duration and phases."""
+    start = _local.start
+    if start is None:
+        return
+    total = time.perf_counter() - start
+    phases = _local.phases
+    _local.start = _local.phases = None
+
+    labels = (("method", method), ("endpoint", endpoint))
+    registry.inc("media_requests_total", labels + (("status", str(status)),))
+
+    phases["compute"] = max(0.0, total - sum(phases.values()))
+    observations = [("media_request_duration_seconds", labels, total)]
+    for name in PHASES:
+        observations.append(
+            ("media_request_phase_seconds", labels + (("phase", name),), phases.get(name, 0.0))
+        )
+    registry.observe_many(observations)
+
+    if SHARED_DIR is not None and _flusher_pid != os.getpid():
+        _start_flusher()
+
+
+class _Phase:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if not _local.busy:
+            _local.busy = True
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.start is None:
+            return
+        _local.busy = False
+        phases = _local.phases
+        if phases is not None:
+            phases[self.name] = phases.get(self.name, 0.0) + time.perf_counter() - self.start
+
+
+def phase(name):
+    """Context manager charging its block to a phase of the current request."""
+    return _Phase(name)
+
+
+def instrument(store):
+    """Wrap the store's reads and writes with phase timers and write counters."""
+    for method in READ_METHODS:
+        setattr(store, method, _timed(getattr(store, method), "load"))
+    for method in WRITE_METHODS:
+        setattr(store, method, _counted(getattr(store, method), method))
+    store.transaction = _timed_transaction(store.transaction)
+    return store
+
+
+def _timed(method, name):
+    def wrapper(*args, **kwargs):
+        with phase(name):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def _counted(method, op):
+    def wrapper(*args, **kwargs):
+        outer = not _local.busy
+        with phase("persist"):
+            result = method(*args, **kwargs)
+        if outer:
+            registry.inc("media_store_writes_total", (("op", op),))
+            registry.inc("media_store_items_written_total", (), written(op, args))
+        return result
+    return wrapper
+
+
+def written(op, args):
+    """Items touched by a write call."""
+    if op in ("save", "put_many"):
+        try:
+            return len(args[0])
+        except TypeError:  # a generator: unknown
+            return 0
+    return 1
+
+
+def _timed_transaction(transaction):
+    @contextmanager
+    def wrapper():
+        with phase("load"):
+            manager = transaction()
+            data = manager.__enter__()
+        try:
+            yield data
+        except BaseException as e:
+            if not manager.__exit__(type(e), e, e.__traceback__):
+                raise
+        else:
+            with phase("persist"):
+                manager.__exit__(None, None, None)
+    return wrapper
+
+
+# ---------------------------------------------------------
+# SAMPLING PROFILER
+# ---------------------------------------------------------
+class Profiler:
+    """Profiles one request in `every` and writes a report for each."""
+
+    def __init__(self, mode, every=PROFILE_EVERY, directory=PROFILE_DIR):
+        if mode not in ("cprofile", "tracemalloc"):
+            raise ValueError(f"Unknown profiler {mode!r} (use cprofile or tracemalloc)")
+        self.mode = mode
+        self.every = max(1, every)
+        self.directory = directory
+        self._seen = 0
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+
+    def start(self):
+        """Start profiling this request if it is sampled; returns a token or None."""
+        with self._lock:
+            self._seen += 1
+            if self._seen % self.every:
+                return None
+        if not self._busy.acquire(blocking=False):
+            return None  # another request is being profiled
+
+        if self.mode == "cprofile":
+            profile = cProfile.Profile()
+            profile.enable()
+            return profile
+
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        return started, tracemalloc.take_snapshot()
+
+    def stop(self, token, label):
+        """Stop the sample started with start() and write its report."""
+        try:
+            if self.mode == "cprofile":
+                token.disable()
+            else:
+                token = token + (tracemalloc.take_snapshot(), tracemalloc.get_traced_memory())
+            os.makedirs(self.directory, exist_ok=True)
+            base = os.path.join(
+                self.directory,
+                f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._seen}-{slug(label)}",
+            )
+            if self.mode == "cprofile":
+                self._write_cprofile(token, base, label)
+            else:
+                self._write_tracemalloc(token, base, label)
+            registry.inc("media_profiles_written_total", (("mode", self.mode),))
+        except OSError:
+            log.exception("Could not write profile report")  # never fail the request
+        finally:
+            self._busy.release()
+
+    def _write_cprofile(self, profile, base, label):
+        profile.dump_stats(base + ".prof")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(f"{label}\n\n")
+            stats = pstats.Stats(profile, stream=f)
+            stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+
+    def _write_tracemalloc(self, token, base, label):
+        started, before, after, (current, peak) = token
+        if started:
+            tracemalloc.stop()
+
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(f"{label}\n")
+            f.write(f"traced: {current / 1024:.1f} KiB, peak: {peak / 1024:.1f} KiB\n\n")
+            # Leave out the snapshots' own bookkeeping
+            ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+            after, before = after.filter_traces(ignore), before.filter_traces(ignore)
+            for stat in after.compare_to(before, "lineno")[:PROFILE_TOP]:
+                f.write(f"{stat}\n")
+
+
+def slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_")[:60]
+
+
+def profiler_from_env():
+    """The profiler configured by MEDIA_PROFILE, or None."""
+    return Profiler(PROFILE_MODE) if PROFILE_MODE else None
@@ -0,0 +1,48 @@
+"""
+Convert the media catalog between storage backends.
+
+The backend of each file is taken from its extension (.sqlite3, .sqlite
+or .db for SQLite, anything else is a JSON file) unless given with
+--from / --to. A JSON source is read together with its journal, so
+changes not yet compacted into database.json are carried over.
+
+Usage:
+    python backend/migrate.py backend/database.json backend/database.sqlite3
+    python backend/migrate.py backend/database.sqlite3 backend/database.json
+"""
+import argparse
+import os
+import sys
+
+from storage import backend_for_path, open_store
+
+
+def migrate(source, target, source_backend=None, target_backend=None):
+    """Copy every item from `source` into `target`, replacing its contents."""
+    source_store = open_store(source, source_backend or backend_for_path(source), journal=True)
+    target_store = open_store(target, target_backend or backend_for_path(target), journal=True)
+
+    data = source_store.load()
+    target_store.save(dict(data))
+    return len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("source")
+    parser.add_argument("target")
+    parser.add_argument("--from", dest="source_backend", choices=("json", "sqlite"))
+    parser.add_argument("--to", dest="target_backend", choices=("json", "sqlite"))
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        sys.exit(f"{args.source} does not exist")
+    if os.path.abspath(args.source) == os.path.abspath(args.target):
+        sys.exit("source and target must be different files")
+
+    count = migrate(args.source, args.target, args.source_backend, args.target_backend)
+    print(f"Copied {count} items from {args.source} to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Overdue scheduler.
+
+Borrowed items carry an "overdue" flag that the backend sets itself, so
+clients read it from the item instead of comparing dates on every row.
+The scheduler keeps a min-heap of (due_date, name) for borrowed items
+that are not overdue yet. Once the date passes an entry's due date, the
+item is marked through a normal store mutation, so the change shows up
+in responses, ETags and the change feed like any other change.
+
+The heap learns about new borrows from the store's change feed, so it
+works for both storage backends and for borrows made by other server
+processes. Several processes may run a scheduler on the same catalog:
+marking re-checks the item under the store's lock, so each item is
+only marked once.
+
+Callbacks registered with subscribe() are called with the names of the
+items that just became overdue.
+"""
+import heapq
+import logging
+import threading
+from datetime import date
+
+
+# Longest the scheduler sleeps between checks when nothing changes
+POLL_SECONDS = 60
+
+log = logging.getLogger(__name__)
+
+
+def iso_today():
+    return date.today().isoformat()
+
+
+def is_pending(item, today=None):
+    """True if a borrowed item is not marked overdue yet (and is past due on `today`)."""
+    if item.get("status") != "borrowed" or not item.get("due_date") or item.get("overdue"):
+        return False
+    return today is None or item["due_date"] < today
+
+
+class OverdueScheduler:
+    """Marks borrowed items overdue once their due date has passed."""
+
+    def __init__(self, store, today=iso_today, poll=POLL_SECONDS):
+        self.store = store
+        self.today = today
+        self.poll = poll
+        self._heap = []
+        self._version = None
+        self._lineage = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        """Call callback(names) whenever items become overdue."""
+        self._callbacks.append(callback)
+
+    # -----------------------------------------------------
+    # LIFECYCLE
+    # -----------------------------------------------------
+    def start(self):
+        """Mark what is overdue already, then keep watching in the background."""
+        self.run_due()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="overdue-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.store.wait_for_change(self._version, self.poll)
+                self.run_due()
+            except Exception:
+                log.exception("Overdue check failed")
+                self._stop.wait(self.poll)
+
+    # -----------------------------------------------------
+    # HEAP
+    # -----------------------------------------------------
+    def _rebuild(self):
+        """Refill the heap from the due-date index (caller holds _lock)."""
+        self.store.etag()  # catch up with the storage first
+        self._version, self._lineage = self.store.version, self.store.lineage
+        self._heap = [
+            (item["due_date"], name)
+            for name, item in self.store.due_between().items()
+            if is_pending(item)
+        ]
+        heapq.heapify(self._heap)
+
+    def _track_changes(self):
+        """Push the due dates of items borrowed since the last look (caller holds _lock)."""
+        if self._version is None:
+            self._rebuild()
+            return
+
+        version, names = self.store.changes_since(self._version, self._lineage)
+        if names is None:
+            self._rebuild()
+            return
+
+        self._version = version
+        for name, item in self.store.get_many(names).items():
+            if is_pending(item):
+                heapq.heappush(self._heap, (item["due_date"], name))
+
+    # -----------------------------------------------------
+    # MARKING
+    # -----------------------------------------------------
+    def run_due(self):
+        """Mark every item whose due date has passed. Returns their names."""
+        today = self.today()
+        with self._lock:
+            self._track_changes()
+
+            # Entries may be stale (returned, re-borrowed); they are
+            # checked against the current item below
+            due = []
+            while self._heap and self._heap[0][0] < today:
+                due.append(heapq.heappop(self._heap)[1])
+            if not due:
+                return []
+
+            updates = []
+            with self.store.transaction() as data:
+                for name in dict.fromkeys(due):
+                    item = data.get(name)
+                    if item is not None and is_pending(item, today):
+                        item = dict(item)
+                        item["overdue"] = True
+                        updates.append((name, item))
+                self.store.put_many(updates)
+
+        names = [name for name, _ in updates]
+        if names:
+            for callback in self._callbacks:
+                try:
+                    callback(names)
+                except Exception:
+                    log.exception("Overdue callback failed")
+        return names
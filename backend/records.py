@@ -0,0 +1,288 @@
+"""
+Compact media item records.
+
+The catalog used to keep every item as a dict of ten string keys, which
+costs several hundred bytes per item before counting the values. A
+MediaItem keeps the same fields in __slots__ instead:
+
+    - category, status, author and publication_date are interned, so
+      the few distinct values are stored once and shared by all items
+    - borrow_date and due_date are kept as date ordinals (ints, shared
+      between items due on the same day) instead of "YYYY-MM-DD" strings
+    - fields the schema does not know are kept in a small `extra` dict,
+      so nothing in a hand-edited catalog is lost
+
+A MediaItem is a read-only Mapping with the same keys and values as the
+dict it was made from (dates come back as "YYYY-MM-DD"), so indexes,
+filters and dict(item) work on it unchanged. JSON encoders turn it into
+that dict through serialization.to_plain().
+
+Validation happens once, where data enters the backend: parse() for a
+new item and parse_borrow() for a borrow request. Items read from the
+catalog files are trusted and only converted (from_dict()).
+"""
+import sys
+from collections.abc import Mapping
+from datetime import date
+
+
+FIELDS = (
+    "name", "author", "publication_date", "category", "status",
+    "image", "borrowed_by", "borrow_date", "due_date", "overdue",
+)
+REQUIRED_FIELDS = ("name", "author", "publication_date", "category")
+DEFAULTS = {
+    "status": "available",
+    "image": "",
+    "borrowed_by": None,
+    "borrow_date": None,
+    "due_date": None,
+    "overdue": False,
+}
+STATUSES = ("available", "borrowed")
+# Longest loan parse_borrow() accepts, in days
+MAX_BORROW_DAYS = 366 * 10
+INTERNED_FIELDS = frozenset({"author", "publication_date", "category", "status"})
+DATE_FIELDS = frozenset({"borrow_date", "due_date"})
+
+_FIELD_SET = frozenset(FIELDS)
+_MISSING = object()
+
+# "YYYY-MM-DD" -> ordinal, and the reverse, so every item due on the
+# same day shares one int and one string; bounded for odd catalogs
+_CACHE_SIZE = 100_000
+_ordinals = {}
+_isodates = {}
+
+
+class ValidationError(ValueError):
+    """Invalid item or request data; the message is meant for the client."""
+
+
+def to_ordinal(value):
+    """Date ordinal of a "YYYY-MM-DD" string; anything else is returned as is."""
+    if not isinstance(value, str):
+        return value
+    ordinal = _ordinals.get(value)
+    if ordinal is None:
+        try:
+            ordinal = date.fromisoformat(value).toordinal()
+        except ValueError:
+            return value
+        # fromisoformat() also reads "20261017"; only "2026-10-17" is
+        # stored as an ordinal, so the text comes back unchanged
+        if to_isodate(ordinal) != value:
+            return value
+        if len(_ordinals) < _CACHE_SIZE:
+            ordinal = _ordinals.setdefault(sys.intern(value), ordinal)
+    return ordinal
+
+
+def to_isodate(value):
+    """Reverse of to_ordinal()."""
+    if type(value) is not int:
+        return value
+    text = _isodates.get(value)
+    if text is None:
+        text = date.fromordinal(value).isoformat()
+        if len(_isodates) < _CACHE_SIZE:
+            _isodates[value] = text
+    return text
+
+
+class MediaItem(Mapping):
+    """
+    One catalog item. Treat it as immutable: changes go through a new
+    item (replace()), never by assigning to a field.
+    """
+
+    # Fields the item does not have hold _MISSING
+    __slots__ = FIELDS + ("extra",)
+
+    def __init__(self, fields=None, **values):
+        """MediaItem(dict) or MediaItem(name=..., ...), without validation."""
+        if fields is None:
+            fields = values
+        elif values:
+            fields = {**fields, **values}
+        get = fields.get
+        intern = sys.intern
+        self.name = get("name", _MISSING)
+        author = get("author", _MISSING)
+        self.author = intern(author) if type(author) is str else author
+        publication_date = get("publication_date", _MISSING)
+        self.publication_date = (
+            intern(publication_date) if type(publication_date) is str else publication_date
+        )
+        category = get("category", _MISSING)
+        self.category = intern(category) if type(category) is str else category
+        status = get("status", _MISSING)
+        self.status = intern(status) if type(status) is str else status
+        self.image = get("image", _MISSING)
+        self.borrowed_by = get("borrowed_by", _MISSING)
+        borrow_date = get("borrow_date", _MISSING)
+        self.borrow_date = borrow_date if borrow_date is None else to_ordinal(borrow_date)
+        due_date = get("due_date", _MISSING)
+        self.due_date = due_date if due_date is None else to_ordinal(due_date)
+        self.overdue = get("overdue", _MISSING)
+        # None for the usual item with exactly the known fields, else
+        # the unknown ones (possibly none, if some fields are missing)
+        self.extra = None
+        if len(fields) != len(FIELDS) or not _FIELD_SET.issuperset(fields):
+            self.extra = {key: value for key, value in fields.items() if key not in _FIELD_SET}
+
+    @classmethod
+    def from_dict(cls, data):
+        """A trusted item (e.g. from the catalog file); records are returned as is."""
+        if isinstance(data, cls):
+            return data
+        return cls(data)
+
+    def to_dict(self):
+        """The item as a plain dict, in field order."""
+        borrow_date = self.borrow_date
+        if type(borrow_date) is int:
+            borrow_date = to_isodate(borrow_date)
+        due_date = self.due_date
+        if type(due_date) is int:
+            due_date = to_isodate(due_date)
+        item = {
+            "name": self.name,
+            "author": self.author,
+            "publication_date": self.publication_date,
+            "category": self.category,
+            "status": self.status,
+            "image": self.image,
+            "borrowed_by": self.borrowed_by,
+            "borrow_date": borrow_date,
+            "due_date": due_date,
+            "overdue": self.overdue,
+        }
+        if self.extra is not None:
+            item = {key: value for key, value in item.items() if value is not _MISSING}
+            item.update(self.extra)
+        return item
+
+    # ujson looks for this itself; through its default= hook the dict
+    # would come out empty with sort_keys=True
+    toDict = to_dict
+
+    def replace(self, **changes):
+        """A copy with some fields changed."""
+        return MediaItem(self.to_dict(), **changes)
+
+    # -----------------------------------------------------
+    # MAPPING
+    # -----------------------------------------------------
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            value = getattr(self, key)
+            if value is _MISSING:
+                raise KeyError(key)
+            return to_isodate(value) if key in DATE_FIELDS else value
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in _FIELD_SET:
+            value = getattr(self, key)
+            if value is _MISSING:
+                return default
+            return to_isodate(value) if key in DATE_FIELDS else value
+        if self.extra:
+            return self.extra.get(key, default)
+        return default
+
+    def __contains__(self, key):
+        if key in _FIELD_SET:
+            return getattr(self, key) is not _MISSING
+        return bool(self.extra) and key in self.extra
+
+    def __iter__(self):
+        for field in FIELDS:
+            if getattr(self, field) is not _MISSING:
+                yield field
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __eq__(self, other):
+        if isinstance(other, MediaItem):
+            return all(
+                getattr(self, field) == getattr(other, field)
+                for field in self.__slots__
+            )
+        return super().__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"MediaItem({self.to_dict()!r})"
+
+    def __reduce__(self):
+        return (MediaItem, (self.to_dict(),))
+
+
+def catalog(data):
+    """{name: MediaItem} for a catalog of plain dicts (or records)."""
+    return {name: MediaItem.from_dict(item) for name, item in data.items()}
+
+
+# ---------------------------------------------------------
+# VALIDATION
+# ---------------------------------------------------------
+def _check(valid, field):
+    if not valid:
+        raise ValidationError(f"Invalid field: {field}")
+
+
+def _is_date(value):
+    return value is None or type(to_ordinal(value)) is int
+
+
+def parse(payload):
+    """
+    A new item from a client, with the default fields filled in.
+    Raises ValidationError if it is not a valid item.
+    """
+    if not isinstance(payload, dict):
+        raise ValidationError("Invalid media data")
+
+    for field in REQUIRED_FIELDS:
+        if field not in payload:
+            raise ValidationError(f"Missing field: {field}")
+
+    values = {**DEFAULTS, **payload}
+    for field in ("name", "author", "category"):
+        _check(isinstance(values[field], str) and values[field], field)
+    # Usually just a year; numbers are accepted and stored as text
+    _check(isinstance(values["publication_date"], (str, int))
+           and not isinstance(values["publication_date"], bool), "publication_date")
+    values["publication_date"] = str(values["publication_date"])
+    _check(values["status"] in STATUSES, "status")
+    _check(isinstance(values["image"], str), "image")
+    _check(values["borrowed_by"] is None or isinstance(values["borrowed_by"], str), "borrowed_by")
+    _check(_is_date(values["borrow_date"]), "borrow_date")
+    _check(_is_date(values["due_date"]), "due_date")
+    _check(isinstance(values["overdue"], bool), "overdue")
+    return MediaItem(values)
+
+
+def parse_borrow(payload):
+    """
+    (borrower, days) of a borrow request.
+    Raises ValidationError if either is missing or of the wrong type,
+    or days is outside 0..MAX_BORROW_DAYS.
+    """
+    if not isinstance(payload, dict):
+        raise ValidationError("Invalid borrow data")
+    borrower = payload.get("borrowed_by")
+    days = payload.get("days")
+    if not borrower or not isinstance(borrower, str):
+        raise ValidationError("Invalid borrow data")
+    if not isinstance(days, int) or isinstance(days, bool) or not 0 <= days <= MAX_BORROW_DAYS:
+        raise ValidationError("Invalid borrow data")
+    return borrower, days
@@ -0,0 +1,187 @@
+"""
+Inverted trigram index for substring search over name and author.
+
+Every item gets a small integer id. For each three-character sequence
+("trigram") of its lower-cased name and author, the id is appended to
+that trigram's posting list. A substring query can only match items
+that contain *all* of the query's trigrams, so:
+
+    1. take the posting lists of the query's trigrams, shortest first
+    2. intersect them while that is cheap (short lists only)
+    3. verify the remaining candidates with a plain substring check
+
+Verifying a candidate is a C-level substring test, about as cheap as
+one step of a set intersection, so long lists are verified directly
+instead of intersected. With a limit and no ranking, candidates are
+verified straight off the shortest list and the search stops as soon
+as enough matches are found.
+
+Queries shorter than three characters have no trigrams and fall back to
+a scan. Posting lists are append-only arrays of ids; removed or renamed
+items just leave stale ids behind, which step 3 filters out, and the
+postings are rebuilt once stale ids outnumber live ones.
+"""
+from array import array
+
+
+# Rebuild the postings once this many ids are stale (and they outnumber live ones)
+REBUILD_AFTER = 1000
+
+# Only intersect posting lists when the shortest one is at most this long
+INTERSECT_MAX = 20000
+
+
+def trigrams(text):
+    """Set of all three-character substrings of text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def search_fields(item):
+    """(lower-cased name, lower-cased author) of an item, the text a query is matched against."""
+    return (
+        (item.get("name") or "").lower(),
+        (item.get("author") or "").lower(),
+    )
+
+
+def match_rank(query, entry):
+    """
+    Sort key of a match for rank=True, given (name, *search_fields()):
+    exact > prefix > word prefix > substring, name before author.
+    """
+    _, name_text, author_text = entry
+    if name_text == query:
+        rank = 0
+    elif name_text.startswith(query):
+        rank = 1
+    elif (" " + query) in name_text:
+        rank = 2
+    elif query in name_text:
+        rank = 3
+    elif author_text.startswith(query) or (" " + query) in author_text:
+        rank = 4
+    else:
+        rank = 5
+    return (rank, len(name_text), name_text)
+
+
+class TrigramIndex:
+    """Trigram posting lists over the name and author of every item."""
+
+    def __init__(self, data=None):
+        self._ids = {}        # name -> id
+        self._entries = []    # id -> (name, lower name, lower author), None once stale
+        self._postings = {}   # trigram -> array of ids, ascending
+        self._stale = 0
+
+        for name, item in (data or {}).items():
+            self._add(name, item)
+
+    # -----------------------------------------------------
+    # MAINTENANCE
+    # -----------------------------------------------------
+    def update(self, name, old, new):
+        """Reflect a change of one item (old or new may be None)."""
+        if old is not None and new is not None and search_fields(old) == search_fields(new):
+            return  # borrow/return: nothing searchable changed
+        if old is not None:
+            self._remove(name)
+        if new is not None:
+            self._add(name, new)
+
+        if self._stale > REBUILD_AFTER and self._stale > len(self._ids):
+            self._rebuild()
+
+    def _add(self, name, item):
+        item_id = len(self._entries)
+        name_text, author_text = search_fields(item)
+        name_text = name_text or name.lower()
+
+        self._ids[name] = item_id
+        self._entries.append((name, name_text, author_text))
+
+        for gram in trigrams(name_text) | trigrams(author_text):
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array("I")
+            posting.append(item_id)
+
+    def _remove(self, name):
+        item_id = self._ids.pop(name, None)
+        if item_id is not None:
+            self._entries[item_id] = None
+            self._stale += 1
+
+    def _rebuild(self):
+        fresh = TrigramIndex()
+        for entry in self._entries:
+            if entry is not None:
+                name, name_text, author_text = entry
+                fresh._add(name, {"name": name_text, "author": author_text})
+
+        # A search running concurrently may mix old ids with new entries;
+        # it then misses some results but never returns a wrong one,
+        # since every candidate is verified against its own entry.
+        self._postings = fresh._postings
+        self._entries = fresh._entries
+        self._ids = fresh._ids
+        self._stale = 0
+
+    # -----------------------------------------------------
+    # SEARCH
+    # -----------------------------------------------------
+    def search(self, query, limit=None, rank=False):
+        """
+        Names of the items whose name or author contains `query`
+        (case-insensitive). Results are in insertion order, or best
+        match first with rank=True, and cut to `limit` if given.
+        """
+        if limit == 0:
+            return []
+        query = query.lower()
+        entries = self._entries
+
+        matches = []
+        lazy = limit is not None and not rank
+        for item_id in self._candidates(query, len(entries), lazy):
+            entry = entries[item_id] if item_id < len(entries) else None
+            if entry is None:
+                continue
+            if query in entry[1] or query in entry[2]:
+                matches.append(entry)
+                if not rank and limit is not None and len(matches) >= limit:
+                    break
+
+        if rank:
+            matches.sort(key=lambda entry: match_rank(query, entry))
+            if limit is not None:
+                matches = matches[:limit]
+
+        return [entry[0] for entry in matches]
+
+    def _candidates(self, query, size, lazy=False):
+        """Ids that may contain query, ascending."""
+        grams = trigrams(query)
+        if not grams:
+            return range(size)
+
+        postings = []
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if not posting:
+                return ()
+            postings.append(posting)
+        postings.sort(key=len)
+
+        candidates = postings[0]
+        if lazy or len(postings) == 1 or len(candidates) > INTERSECT_MAX:
+            return candidates
+
+        # Stop once the remaining lists are much longer than the
+        # candidate set: verifying beats walking them.
+        candidates = set(candidates)
+        for posting in postings[1:]:
+            if len(posting) > 4 * len(candidates):
+                break
+            candidates.intersection_update(posting)
+        return sorted(candidates)
@@ -0,0 +1,126 @@
+"""
+JSON and snapshot encoding.
+
+JSON goes through the fastest library installed: orjson, then ujson,
+then the standard library (MEDIA_JSON=orjson|ujson|stdlib picks one).
+All of them write compact UTF-8 without extra whitespace, and
+dumps() / loads() behave the same whichever is used.
+
+Snapshots of the JSON store (database.json) are written compactly
+instead of with indent=4, which made the file about twice as big and
+slower to write. They can also be written as MessagePack (a binary
+format that is smaller and faster to parse; needs the msgpack package).
+The format is detected from the first byte when a snapshot is read, so
+switching formats never needs a conversion step.
+"""
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack snapshots are unavailable
+    msgpack = None
+
+
+# ---------------------------------------------------------
+# JSON LIBRARIES
+# ---------------------------------------------------------
+def to_plain(obj):
+    """
+    default= hook of every encoder: objects with a to_dict() method
+    (records.MediaItem) are written as that dict.
+    """
+    to_dict = getattr(obj, "to_dict", None)
+    if to_dict is None:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return to_dict()
+
+
+def _stdlib_dumps(obj, sort_keys=False, indent=None, default=None):
+    separators = None if indent else (",", ":")
+    return json.dumps(
+        obj, sort_keys=sort_keys, indent=indent, separators=separators,
+        ensure_ascii=False, default=default or to_plain,
+    ).encode()
+
+
+def _orjson_dumps(obj, sort_keys=False, indent=None, default=None):
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, default=default or to_plain, option=option)
+
+
+def _ujson_dumps(obj, sort_keys=False, indent=None, default=None):
+    return ujson.dumps(
+        obj, sort_keys=sort_keys, indent=indent or 0, ensure_ascii=False,
+        escape_forward_slashes=False, default=default or to_plain,
+    ).encode()
+
+
+# name -> (dumps to bytes, loads from str or bytes), fastest first
+LIBRARIES = {}
+if orjson is not None:
+    LIBRARIES["orjson"] = (_orjson_dumps, orjson.loads)
+if ujson is not None:
+    LIBRARIES["ujson"] = (_ujson_dumps, ujson.loads)
+LIBRARIES["stdlib"] = (_stdlib_dumps, json.loads)
+
+JSON_LIBRARY = os.environ.get("MEDIA_JSON") or next(iter(LIBRARIES))
+if JSON_LIBRARY not in LIBRARIES:
+    raise ImportError(
+        f"MEDIA_JSON={JSON_LIBRARY} is not installed (available: {', '.join(LIBRARIES)})"
+    )
+
+dumps_bytes, loads = LIBRARIES[JSON_LIBRARY]
+
+
+def dumps(obj, sort_keys=False, indent=None, default=None):
+    """Compact JSON text (indent=2 for a readable version)."""
+    return dumps_bytes(obj, sort_keys, indent, default).decode()
+
+
+# ---------------------------------------------------------
+# SNAPSHOT FORMATS
+# ---------------------------------------------------------
+SNAPSHOT_FORMATS = ("json", "msgpack")
+MSGPACK_EXTENSIONS = (".msgpack", ".mpk")
+
+
+def format_for_path(path):
+    """Snapshot format implied by a file name."""
+    if os.path.splitext(path)[1].lower() in MSGPACK_EXTENSIONS:
+        return "msgpack"
+    return "json"
+
+
+def encode_snapshot(data, fmt="json"):
+    if fmt == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("MessagePack snapshots need the msgpack package")
+        return msgpack.packb(data, use_bin_type=True, default=to_plain)
+    if fmt != "json":
+        raise ValueError(f"Unknown snapshot format {fmt!r}")
+    return dumps_bytes(data)
+
+
+def decode_snapshot(raw):
+    """Parse a snapshot in either format, telling them apart by the first byte."""
+    start = raw[:64].lstrip()[:1]
+    if start in (b"{", b"[") or not start:
+        return loads(raw)
+    if msgpack is None:
+        raise RuntimeError("This snapshot is MessagePack; install msgpack to read it")
+    return msgpack.unpackb(raw, raw=False)
@@ -0,0 +1,214 @@
+"""
+Production entry point for the Media Library API.
+
+    python backend/serve.py [--bind 0.0.0.0:5000] [--workers N] [--threads N]
+
+app.py's own `python app.py` starts Flask's single-process development
+server (debugger and reloader on) and should only be used while
+developing. This runs the same app under a real server:
+
+    gunicorn   (Linux/macOS) a master process and N prefork workers,
+               each with a few threads. By default the app is imported
+               and the catalog loaded in the master before forking
+               (--no-preload turns this off), so workers start at once
+               and share the parsed catalog and its indexes
+               copy-on-write instead of each holding its own copy.
+    waitress   (Windows, or when gunicorn is not installed) a single
+               multi-threaded process.
+
+Background jobs (jobs.py) run in every worker (MEDIA_JOB_WORKERS threads
+each); they share one job table, so each job runs once.
+
+Both storage backends stay correct across worker processes: the JSON
+store serializes writers with a file lock and every process picks up
+the others' changes from the journal; SQLite does the same with its own
+locking. Response caches and the profiler are per process; metrics are
+pooled in a directory shared by the workers (MEDIA_METRICS_DIR, a
+temporary one by default), so GET /metrics covers all of them.
+
+Reload gracefully by sending SIGHUP to the master (see --pidfile). It
+re-reads the catalog and starts fresh workers; the old ones finish
+their in-flight requests (up to --graceful-timeout seconds) before
+exiting. With preloading the master keeps the code it started with;
+deploy new code with SIGUSR2 (start a new master) followed by SIGQUIT
+to the old one.
+
+Settings can also come from the environment: MEDIA_BIND, MEDIA_WORKERS,
+MEDIA_THREADS, MEDIA_SERVER (auto, gunicorn or waitress).
+"""
+import argparse
+import atexit
+import gc
+import glob
+import os
+import shutil
+import sys
+import tempfile
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # Windows, or not installed: waitress
+    BaseApplication = object
+    gunicorn_available = False
+else:
+    gunicorn_available = True
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+
+DEFAULT_BIND = "127.0.0.1:5000"
+# Threads per worker: long-polls and change streams each hold one
+DEFAULT_THREADS = 4
+GRACEFUL_TIMEOUT = 30
+# A worker that stops reporting to the master for this long is restarted
+WORKER_TIMEOUT = 60
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def shared_metrics_dir():
+    """Directory where the worker processes pool their metrics (see metrics.py)."""
+    directory = os.environ.get("MEDIA_METRICS_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        # Counts of an earlier run of the server
+        for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+            os.remove(path)
+        return directory
+
+    directory = tempfile.mkdtemp(prefix="media-metrics-")
+    master = os.getpid()
+    # Workers inherit atexit handlers; only the master cleans up
+    atexit.register(lambda: os.getpid() == master and shutil.rmtree(directory, True))
+    return directory
+
+
+def warm(store):
+    """Load the catalog (and for JSON its indexes) so forked workers share it."""
+    store.etag()
+    store.load()
+
+
+# ---------------------------------------------------------
+# GUNICORN (PREFORK)
+# ---------------------------------------------------------
+class PreforkServer(BaseApplication):
+    """Runs the app in gunicorn with settings from the command line."""
+
+    def __init__(self, options, preload=True):
+        self.options = options
+        self.preload = preload
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set("preload_app", self.preload)
+        self.cfg.set("post_fork", self.post_fork)
+
+    def load(self):
+        from app import app, store
+
+        if self.preload:
+            warm(store)
+            # Keep the garbage collector from touching (and so copying)
+            # the shared catalog's pages in every worker
+            gc.freeze()
+        return app
+
+    def reload(self):
+        """SIGHUP: re-read the settings and the catalog before new workers fork."""
+        super().reload()
+        if self.preload:
+            from app import store
+
+            gc.unfreeze()
+            warm(store)
+            gc.freeze()
+
+    def post_fork(self, server, worker):
+        # A thread does not survive fork(), and a lock it holds at that
+        # moment stays locked in the worker: the overdue scheduler and
+        # the job workers start in each worker, never in the master
+        from app import start_background
+
+        start_background()
+
+
+def serve_gunicorn(args):
+    options = {
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": "gthread",
+        "threads": args.threads,
+        "graceful_timeout": args.graceful_timeout,
+        "timeout": WORKER_TIMEOUT,
+        "pidfile": args.pidfile,
+        "accesslog": args.access_log,
+    }
+    os.environ["MEDIA_METRICS_DIR"] = shared_metrics_dir()
+    PreforkServer(options, preload=not args.no_preload).run()
+
+
+# ---------------------------------------------------------
+# WAITRESS (SINGLE PROCESS)
+# ---------------------------------------------------------
+def serve_waitress(args):
+    from app import app, start_background, store
+
+    warm(store)
+    start_background()
+    host, _, port = args.bind.rpartition(":")
+    waitress.serve(app, host=host or "0.0.0.0", port=int(port), threads=args.threads)
+
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+def pick_server(name):
+    if name == "auto":
+        if gunicorn_available:
+            return "gunicorn"
+        if waitress is not None:
+            return "waitress"
+        sys.exit("Install gunicorn (Linux/macOS) or waitress to serve the app")
+    if name == "gunicorn" and not gunicorn_available:
+        sys.exit("gunicorn is not installed (it does not run on Windows; use waitress)")
+    if name == "waitress" and waitress is None:
+        sys.exit("waitress is not installed")
+    return name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Media Library API in production.")
+    parser.add_argument("--bind", default=os.environ.get("MEDIA_BIND", DEFAULT_BIND),
+                        help="HOST:PORT to listen on (default: %(default)s)")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("MEDIA_WORKERS", default_workers())),
+                        help="worker processes, gunicorn only (default: CPU count, %(default)s)")
+    parser.add_argument("--threads", type=int,
+                        default=int(os.environ.get("MEDIA_THREADS", DEFAULT_THREADS)),
+                        help="threads per worker (default: %(default)s)")
+    parser.add_argument("--server", choices=["auto", "gunicorn", "waitress"],
+                        default=os.environ.get("MEDIA_SERVER", "auto"))
+    parser.add_argument("--no-preload", action="store_true",
+                        help="import the app in every worker instead of once before forking")
+    parser.add_argument("--graceful-timeout", type=int, default=GRACEFUL_TIMEOUT,
+                        help="seconds old workers get to finish on reload/stop (default: %(default)s)")
+    parser.add_argument("--pidfile", help="write the master's pid here (for kill -HUP)")
+    parser.add_argument("--access-log", help="access log file, or - for stdout")
+    args = parser.parse_args()
+
+    if pick_server(args.server) == "gunicorn":
+        serve_gunicorn(args)
+    else:
+        serve_waitress(args)
+
+
+if __name__ == "__main__":
+    main()
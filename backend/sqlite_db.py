@@ -0,0 +1,47 @@
+"""
+Small SQLite databases shared by all server processes.
+
+The job table (jobs.py) and the borrowing history (history.py) each
+live in their own SQLite file in WAL mode and open a connection per
+transaction, so any thread of any process can use them:
+
+    create(path, schema)        switch the file to WAL and create the tables
+    transaction(path, write)    one transaction on a fresh connection
+"""
+import sqlite3
+from contextlib import contextmanager
+
+
+# Seconds to wait for another connection's write lock
+BUSY_TIMEOUT = 30
+
+
+def create(path, schema):
+    """Switch the database at `path` to WAL mode and run `schema` (a script)."""
+    db = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    try:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(schema)
+    finally:
+        db.close()
+
+
+@contextmanager
+def transaction(path, write=True):
+    """
+    A connection for one transaction, holding SQLite's write lock
+    unless write=False; committed (or rolled back) and closed after.
+    """
+    db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    try:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+    finally:
+        db.close()
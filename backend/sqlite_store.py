@@ -0,0 +1,441 @@
+"""
+SQLite storage backend for the media catalog (the "sqlite" backend,
+see storage.py).
+
+Each item is one row: the item itself as JSON, plus copies of the
+fields that queries filter on (category, status, author, due date) in
+indexed columns, and lower-cased name/author for substring search.
+Lookups therefore run in SQLite instead of over a full in-memory copy.
+
+The database runs in WAL mode, so readers never block the writer and
+any number of threads and server processes can share one file. Every
+thread uses its own connection; when the thread ends, the connection
+goes back to a small pool for the next one (a forked worker starts
+with an empty pool, never with its parent's connections). Writes use
+BEGIN IMMEDIATE, which takes SQLite's write lock up front, so a
+read-check-write sequence inside transaction() is atomic across all
+threads and processes.
+
+The version, lineage and change feed live in the database too: every
+mutation bumps meta.version and records (version, name) in the changes
+table, which keeps the last CHANGELOG_SIZE entries.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+import serialization
+from indexes import INDEXED_FIELDS
+from search_index import match_rank, search_fields
+from storage import CHANGELOG_SIZE, CatalogStorage
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    name TEXT PRIMARY KEY,
+    category TEXT,
+    status TEXT,
+    author TEXT,
+    due_date TEXT,
+    search_name TEXT NOT NULL,
+    search_author TEXT NOT NULL,
+    item TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_category ON items (category);
+CREATE INDEX IF NOT EXISTS items_status ON items (status);
+CREATE INDEX IF NOT EXISTS items_author ON items (author);
+CREATE INDEX IF NOT EXISTS items_due_date ON items (due_date) WHERE due_date IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL,
+    lineage TEXT NOT NULL,
+    changes_floor INTEGER NOT NULL,
+    last_modified REAL NOT NULL
+);
+"""
+
+UPSERT = """
+INSERT INTO items (name, category, status, author, due_date, search_name, search_author, item)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (name) DO UPDATE SET
+    category = excluded.category,
+    status = excluded.status,
+    author = excluded.author,
+    due_date = excluded.due_date,
+    search_name = excluded.search_name,
+    search_author = excluded.search_author,
+    item = excluded.item
+"""
+
+# Names per "WHERE name IN (...)" query (SQLite caps bound parameters)
+IN_BATCH = 500
+
+# Idle connections kept for reuse by new threads
+POOL_SIZE = 16
+
+
+def item_row(name, item):
+    """Column values for one item, in UPSERT order."""
+    search_name, search_author = search_fields(item)
+    return (
+        name,
+        item.get("category"),
+        item.get("status"),
+        item.get("author"),
+        item.get("due_date") or None,
+        search_name or name.lower(),
+        search_author,
+        serialization.dumps(item),
+    )
+
+
+class _ItemsView(Mapping):
+    """Read-only {name: item} view of the items table, for transaction()."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getitem__(self, name):
+        row = self._conn.execute("SELECT item FROM items WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return serialization.loads(row[0])
+
+    def __contains__(self, name):
+        row = self._conn.execute("SELECT 1 FROM items WHERE name = ?", (name,)).fetchone()
+        return row is not None
+
+    def __iter__(self):
+        for (name,) in self._conn.execute("SELECT name FROM items ORDER BY rowid"):
+            yield name
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+
+class _Checkout:
+    """
+    A pooled connection held by one thread. It lives in the thread's
+    local storage, so it is dropped when the thread ends and hands the
+    connection back to the pool.
+    """
+
+    def __init__(self, store, conn):
+        self.store = store
+        self.conn = conn
+        self.depth = 0
+        self.pid = os.getpid()
+
+    def __del__(self):
+        if self.pid == os.getpid():
+            self.store._release(self.conn)
+
+
+class SQLiteStore(CatalogStorage):
+    """Catalog stored in an SQLite database."""
+
+    def __init__(self, path, timeout=30.0):
+        super().__init__()
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._pool = []
+        self._pool_lock = threading.Lock()
+        self._pool_pid = os.getpid()
+        # Connections inherited through fork(): never used or closed
+        self._inherited = []
+        # ((lineage, version), {name: item}) of the last load()
+        self._cache = None
+
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        with self.transaction():
+            conn.execute(
+                "INSERT OR IGNORE INTO meta VALUES (0, 0, ?, 0, ?)",
+                (self.lineage, time.time()),
+            )
+        self._current_version()
+
+    # -----------------------------------------------------
+    # CONNECTIONS
+    # -----------------------------------------------------
+    def _checkout(self):
+        """This thread's connection, taken from the pool or opened."""
+        checkout = getattr(self._local, "checkout", None)
+        if checkout is not None and checkout.pid == os.getpid():
+            return checkout
+
+        conn = None
+        with self._pool_lock:
+            if self._pool_pid != os.getpid():
+                self._inherited.extend(self._pool)
+                self._pool = []
+                self._pool_pid = os.getpid()
+            if self._pool:
+                conn = self._pool.pop()
+
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+
+        if checkout is not None:
+            self._inherited.append(checkout)
+        checkout = self._local.checkout = _Checkout(self, conn)
+        return checkout
+
+    def _connection(self):
+        return self._checkout().conn
+
+    def _release(self, conn):
+        with self._pool_lock:
+            if len(self._pool) < POOL_SIZE and self._pool_pid == os.getpid():
+                self._pool.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Hold SQLite's write lock (threads and processes) for a
+        read-check-write sequence. Yields a read-only {name: item}
+        view; writes inside it commit together at the end.
+        """
+        checkout = self._checkout()
+        conn = checkout.conn
+        if checkout.depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+        checkout.depth += 1
+        try:
+            yield _ItemsView(conn)
+        except BaseException:
+            checkout.depth -= 1
+            if checkout.depth == 0:
+                conn.execute("ROLLBACK")
+            raise
+
+        checkout.depth -= 1
+        if checkout.depth == 0:
+            conn.execute("COMMIT")
+            self._current_version()
+
+    @contextmanager
+    def _snapshot(self):
+        """Run several reads against one consistent state of the database."""
+        checkout = self._checkout()
+        conn = checkout.conn
+        if checkout.depth > 0:
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def _meta(self, conn):
+        return conn.execute(
+            "SELECT version, lineage, changes_floor, last_modified FROM meta"
+        ).fetchone()
+
+    def _current_version(self):
+        version, lineage, _, last_modified = self._meta(self._connection())
+        self.lineage = lineage
+        if version != self.version:
+            self._set_version(version, last_modified)
+        return version
+
+    def etag(self):
+        """Validator for the current catalog state."""
+        version = self._current_version()
+        return f"{self.lineage}-{version}"
+
+    # -----------------------------------------------------
+    # READS
+    # -----------------------------------------------------
+    def load(self):
+        """
+        The whole catalog as {name: item}. The dict is kept until the
+        version changes, so callers must not modify it.
+        """
+        with self._snapshot() as conn:
+            version, lineage, _, _ = self._meta(conn)
+            cache = self._cache
+            if cache is None or cache[0] != (lineage, version):
+                rows = conn.execute("SELECT name, item FROM items ORDER BY rowid")
+                cache = ((lineage, version), {name: serialization.loads(item) for name, item in rows})
+                if self._checkout().depth == 0:
+                    self._cache = cache
+        return cache[1]
+
+    def get(self, name):
+        """A single item, or None."""
+        row = self._connection().execute(
+            "SELECT item FROM items WHERE name = ?", (name,)
+        ).fetchone()
+        return None if row is None else serialization.loads(row[0])
+
+    def get_many(self, names):
+        """The existing items among `names`, as {name: item}."""
+        names = list(names)
+        found = {}
+        with self._snapshot() as conn:
+            for start in range(0, len(names), IN_BATCH):
+                batch = names[start:start + IN_BATCH]
+                rows = conn.execute(
+                    f"SELECT name, item FROM items WHERE name IN ({', '.join('?' * len(batch))})",
+                    batch,
+                )
+                found.update(rows)
+        return {name: serialization.loads(found[name]) for name in names if name in found}
+
+    def count(self):
+        """Number of items in the catalog."""
+        return self._connection().execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def _query(self, sql, params=()):
+        rows = self._connection().execute(sql, params)
+        return {name: serialization.loads(item) for name, item in rows}
+
+    def select(self, field, value):
+        """Items whose indexed `field` equals `value`, as {name: item}."""
+        if field not in INDEXED_FIELDS:
+            raise KeyError(field)
+        return self._query(f"SELECT name, item FROM items WHERE {field} = ?", (value,))
+
+    def due_between(self, start=None, end=None):
+        """Items due in [start, end), ordered by due date, as {name: item}."""
+        sql = "SELECT name, item FROM items WHERE due_date IS NOT NULL"
+        params = []
+        if start is not None:
+            sql += " AND due_date >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND due_date < ?"
+            params.append(end)
+        return self._query(sql + " ORDER BY due_date, name", params)
+
+    def list_items(self, after=None, limit=None):
+        """One page of (name, item) pairs in name order, starting after `after`."""
+        sql = "SELECT name, item FROM items"
+        params = []
+        if after is not None:
+            sql += " WHERE name > ?"
+            params.append(after)
+        sql += " ORDER BY name LIMIT ?"
+        params.append(-1 if limit is None else limit)
+        return list(self._query(sql, params).items())
+
+    def search(self, query, limit=None, rank=False):
+        """Items whose name or author contains query, as {name: item}."""
+        query = query.lower()
+        sql = (
+            "SELECT name, search_name, search_author, item FROM items"
+            " WHERE instr(search_name, ?) > 0 OR instr(search_author, ?) > 0"
+            " ORDER BY rowid"
+        )
+        params = [query, query]
+        if limit is not None and not rank:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        rows = self._connection().execute(sql, params).fetchall()
+        if rank:
+            rows.sort(key=lambda row: match_rank(query, row[:3]))
+            if limit is not None:
+                rows = rows[:limit]
+        return {name: serialization.loads(item) for name, _, _, item in rows}
+
+    # -----------------------------------------------------
+    # WRITES
+    # -----------------------------------------------------
+    def save(self, data):
+        """
+        Replace the whole catalog. Clients of the change feed are told
+        to reload, since the individual changes are not recorded.
+        """
+        with self.transaction():
+            conn = self._connection()
+            version = self._meta(conn)[0] + 1
+            conn.execute("DELETE FROM items")
+            conn.execute("DELETE FROM changes")
+            conn.executemany(UPSERT, (item_row(name, item) for name, item in data.items()))
+            conn.execute(
+                "UPDATE meta SET version = ?, changes_floor = ?, last_modified = ?",
+                (version, version, time.time()),
+            )
+
+    def put(self, name, item):
+        """Create or replace a single item."""
+        self._apply_mutations([(name, item)])
+
+    def put_many(self, items):
+        """Create or replace several (name, item) pairs in one transaction."""
+        self._apply_mutations(list(items))
+
+    def delete(self, name):
+        """Remove a single item."""
+        self._apply_mutations([(name, None)])
+
+    def compact(self):
+        """Copy the write-ahead log into the database file and truncate it."""
+        busy, _, _ = self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        return not busy
+
+    def _apply_mutations(self, changes):
+        """Write (name, item) pairs, deleting where item is None."""
+        if not changes:
+            return
+
+        with self.transaction():
+            conn = self._connection()
+            version, _, floor, _ = self._meta(conn)
+            for name, item in changes:
+                version += 1
+                if item is None:
+                    conn.execute("DELETE FROM items WHERE name = ?", (name,))
+                else:
+                    conn.execute(UPSERT, item_row(name, item))
+                conn.execute("INSERT INTO changes (version, name) VALUES (?, ?)", (version, name))
+
+            if version - floor > CHANGELOG_SIZE:
+                floor = version - CHANGELOG_SIZE
+                conn.execute("DELETE FROM changes WHERE version <= ?", (floor,))
+            conn.execute(
+                "UPDATE meta SET version = ?, changes_floor = ?, last_modified = ?",
+                (version, floor, time.time()),
+            )
+
+    # -----------------------------------------------------
+    # CHANGE FEED
+    # -----------------------------------------------------
+    def changes_since(self, since, lineage=None):
+        """
+        Names of the items changed after version `since`, as
+        (current version, names). names is None when the caller has to
+        refetch everything: unknown lineage, a version from the future,
+        or changes older than the ones still recorded.
+        """
+        with self._snapshot() as conn:
+            version, current_lineage, floor, _ = self._meta(conn)
+            if (lineage is not None and lineage != current_lineage) or since > version or since < floor:
+                return version, None
+
+            rows = conn.execute(
+                "SELECT name FROM changes WHERE version > ? ORDER BY version", (since,)
+            )
+            names = {}
+            for (name,) in rows:
+                names[name] = True
+        return version, list(names)
@@ -0,0 +1,195 @@
+"""
+Storage interface for the media catalog.
+
+app.py only talks to the catalog through the methods of
+CatalogStorage, so it can live in either backend:
+
+    json     the JSON file database.json, served from memory with an
+             optional journal (store.CatalogStore)
+    sqlite   an SQLite database in WAL mode with indexed columns
+             (sqlite_store.SQLiteStore)
+
+open_store() builds the configured one; migrate.py converts between them.
+"""
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+
+# Backend name -> default file name next to app.py
+DEFAULT_FILES = {
+    "json": "database.json",
+    "sqlite": "database.sqlite3",
+}
+
+SQLITE_EXTENSIONS = (".sqlite3", ".sqlite", ".db")
+
+# Number of (version, name) changes remembered for the change feed
+CHANGELOG_SIZE = 10000
+
+
+def backend_for_path(path):
+    """Guess the backend of a catalog file from its extension."""
+    if os.path.splitext(path)[1].lower() in SQLITE_EXTENSIONS:
+        return "sqlite"
+    return "json"
+
+
+def open_store(path, backend="json", journal=False, snapshot_format=None):
+    """
+    Open the catalog at `path` with the named storage backend.
+    snapshot_format ("json" or "msgpack") only applies to the JSON
+    backend; by default it follows the file extension.
+    """
+    if backend == "json":
+        from store import CatalogStore
+        return CatalogStore(path, journal=journal, snapshot_format=snapshot_format)
+    if backend == "sqlite":
+        from sqlite_store import SQLiteStore
+        return SQLiteStore(path)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+class CatalogStorage(ABC):
+    """
+    Interface shared by the storage backends.
+
+    Items are read-only Mappings keyed by name (records.MediaItem in the
+    JSON backend, plain dicts in SQLite). Returned items must not be
+    modified in place; mutations go through put() / put_many() /
+    delete(), or save() for the whole catalog.
+
+    Attributes kept up to date by every backend:
+        version        mutation counter, the basis of ETags and the change feed
+        lineage        id of the version history (changes if it restarts)
+        last_modified  time of the last change seen by this process
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.lineage = uuid.uuid4().hex[:12]
+        self.last_modified = time.time()
+        self._changed = threading.Condition()
+
+    # -----------------------------------------------------
+    # READS
+    # -----------------------------------------------------
+    @abstractmethod
+    def load(self):
+        """The whole catalog as {name: item}."""
+
+    @abstractmethod
+    def get(self, name):
+        """A single item, or None."""
+
+    @abstractmethod
+    def get_many(self, names):
+        """The existing items among `names`, as {name: item}."""
+
+    @abstractmethod
+    def select(self, field, value):
+        """Items whose indexed `field` equals `value`, as {name: item}."""
+
+    @abstractmethod
+    def due_between(self, start=None, end=None):
+        """Items due in [start, end), ordered by due date, as {name: item}."""
+
+    @abstractmethod
+    def list_items(self, after=None, limit=None):
+        """One page of (name, item) pairs in name order, starting after `after`."""
+
+    @abstractmethod
+    def search(self, query, limit=None, rank=False):
+        """Items whose name or author contains query, as {name: item}."""
+
+    def count(self):
+        """Number of items in the catalog."""
+        return len(self.load())
+
+    @abstractmethod
+    def etag(self):
+        """Validator for the current catalog state."""
+
+    # -----------------------------------------------------
+    # WRITES
+    # -----------------------------------------------------
+    @abstractmethod
+    def transaction(self):
+        """
+        Context manager holding the write lock for a read-check-write
+        sequence. Yields a read-only {name: item} mapping of the
+        up-to-date catalog; writes made inside it commit together.
+        """
+
+    @abstractmethod
+    def save(self, data):
+        """Replace the whole catalog."""
+
+    @abstractmethod
+    def put(self, name, item):
+        """Create or replace a single item."""
+
+    @abstractmethod
+    def put_many(self, items):
+        """Create or replace several (name, item) pairs in one write."""
+
+    @abstractmethod
+    def delete(self, name):
+        """Remove a single item."""
+
+    def compact(self):
+        """
+        Fold pending writes into the main file, so reopening it is
+        quick. Returns False if that is already under way elsewhere.
+        """
+        return True
+
+    # -----------------------------------------------------
+    # CHANGE FEED
+    # -----------------------------------------------------
+    @abstractmethod
+    def changes_since(self, since, lineage=None):
+        """
+        Names of the items changed after version `since`, as
+        (current version, names); names is None when the caller has
+        to refetch everything.
+        """
+
+    @abstractmethod
+    def _current_version(self):
+        """Catch up with changes made elsewhere and return the version."""
+
+    def wait_for_change(self, since, timeout, poll=1.0):
+        """
+        Block until the version moves past `since` or `timeout` seconds
+        pass. Re-checks storage every `poll` seconds, so writes made by
+        other processes wake the wait too.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            version = self._current_version()
+            remaining = deadline - time.monotonic()
+            if version != since or remaining <= 0:
+                return version
+            with self._changed:
+                if self.version == since:
+                    self._changed.wait(min(poll, remaining))
+
+    def _set_version(self, version, last_modified=None):
+        # Always called after the data it describes is in place
+        with self._changed:
+            self.version = version
+            self.last_modified = time.time() if last_modified is None else last_modified
+            self._changed.notify_all()
+
+    @staticmethod
+    def _pick(data, names):
+        # Skip names that vanished between an index and the dict lookup
+        picked = {}
+        for name in names:
+            item = data.get(name)
+            if item is not None:
+                picked[name] = item
+        return picked
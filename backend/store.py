@@ -0,0 +1,692 @@
+"""
+In-memory catalog store for the JSON "database" (the "json" storage
+backend, see storage.py).
+
+The catalog is parsed once and then served from memory. Every access
+only does a cheap os.stat() on the file and re-parses it when the file
+actually changed on disk (e.g. someone edited database.json by hand).
+
+In journaled mode single-item mutations are not written by rewriting
+database.json. Each one is appended as a JSON line to a write-ahead log
+next to it (database.log). Once the log grows past a threshold a
+background thread folds it into a new snapshot:
+
+    1. database.log is renamed to database.log.1 (new writes start a
+       fresh log straight away)
+    2. snapshot + database.log.1 are replayed from disk and written to
+       a temp file
+    3. under the lock, a {"op": "compacted"} record naming the new
+       snapshot file is appended to the log, the temp file replaces
+       database.json and database.log.1 is removed
+
+Other processes notice the new log and snapshot, but do not reload:
+they finish reading database.log.1, check that the new log starts at
+the version they are at, and replay it. The "compacted" record tells
+them the new snapshot holds nothing they do not have, so they keep
+their catalog and indexes. Any other change of the files (save(), a
+hand edit, a log they cannot follow) still means a full reload.
+
+Snapshots are compact JSON, or MessagePack with snapshot_format=
+"msgpack" (the default for a .msgpack file); either is read back
+whatever the setting (serialization.py). Journal lines are always JSON.
+
+Loading replays snapshot, database.log.1 (if a compaction was cut short)
+and database.log, in that order. Records hold the full item, so
+replaying an already folded record is harmless. A batch of mutations is
+written as a single {"op": "batch"} line, so after a crash it is either
+replayed completely or not at all.
+
+Concurrency
+-----------
+Every write happens under a lock that is both a thread lock and an
+flock() on database.lock, so it excludes other threads *and* other
+server processes. Before writing, the store catches up with whatever
+other processes wrote, so a read-check-write sequence inside
+store.transaction() (e.g. "borrow if available") is atomic across all
+workers. Compaction takes a second lock (database.compact.lock) so only
+one process folds the journal at a time. Snapshots are always written
+to a temp file and renamed over database.json, so readers never see a
+truncated file.
+
+Readers do not lock. Items are held as records.MediaItem, which are
+immutable: writers put a new one, so a reader holding an item always
+sees a consistent version of it. Files and journal records still hold
+plain JSON objects; items are converted when they are loaded or put.
+
+Secondary indexes (indexes.py) and the trigram search index
+(search_index.py) are updated together with the in-memory catalog, and
+rebuilt whenever it is reloaded from disk.
+
+Versioning
+----------
+store.version counts mutations. In journaled mode it is shared by all
+processes: every record carries its version ("v"), and every journal
+file starts with a {"op": "begin"} header holding the version it starts
+from and the catalog's lineage (a random id that only changes if the
+journal is lost). In plain mode the counter is per process, with a
+per-process lineage. store.etag() combines lineage, version and the
+snapshot's file signature, so it changes whenever the catalog changes,
+including hand edits of database.json.
+
+The store also remembers which item changed in which version (the last
+CHANGELOG_SIZE changes), so clients can ask for "everything since
+version N" instead of refetching the catalog. Changes picked up by a
+full reload are found by diffing the old and new catalog.
+"""
+import os
+import tempfile
+import threading
+import zlib
+from collections import deque
+from contextlib import contextmanager
+
+import records
+import serialization
+from indexes import CatalogIndexes
+from search_index import TrigramIndex
+from storage import CHANGELOG_SIZE, CatalogStorage
+
+try:
+    import fcntl
+except ImportError:  # Windows: locking is limited to threads of one process
+    fcntl = None
+
+
+# Fold the journal into the snapshot after this many records
+COMPACT_EVERY = 1000
+
+
+# ---------------------------------------------------------
+# LOCKING
+# ---------------------------------------------------------
+class FileLock:
+    """
+    Re-entrant lock shared by the threads of this process and, through
+    flock() on a lock file, by all processes using the same catalog.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        self._pid = None
+
+    def _lock_fd(self):
+        # A forked worker must not share the parent's open file
+        # description, or flock() would not exclude the two.
+        if self._pid != os.getpid():
+            if self._fd is not None:
+                os.close(self._fd)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    def acquire(self, blocking=True):
+        if not self._thread_lock.acquire(blocking):
+            return False
+
+        if self._depth == 0 and fcntl is not None:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(self._lock_fd(), flags)
+            except BlockingIOError:
+                self._thread_lock.release()
+                return False
+
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# ---------------------------------------------------------
+# CATALOG STORE
+# ---------------------------------------------------------
+class CatalogStore(CatalogStorage):
+    """Process-resident copy of the catalog backed by a JSON file."""
+
+    def __init__(self, path, journal=False, compact_every=COMPACT_EVERY, fsync=False,
+                 snapshot_format=None):
+        super().__init__()
+        self.path = path
+        self.journal = journal
+        self.snapshot_format = snapshot_format or serialization.format_for_path(path)
+        self.compact_every = compact_every
+        self.fsync = fsync
+
+        base = os.path.splitext(path)[0]
+        self.log_path = base + ".log"
+        self.rotated_log_path = self.log_path + ".1"
+
+        self._data = None
+        self._changes = deque(maxlen=CHANGELOG_SIZE)
+        self._changes_floor = 0
+        self.indexes = CatalogIndexes()
+        self.search_index = TrigramIndex()
+        self._signature = None
+        # File signature of the snapshot the last "compacted" record named
+        self._compacted_snapshot = None
+        self._log_file = None
+        self._log_offset = 0
+        self._log_records = 0
+        self._lock = FileLock(base + ".lock")
+        self._compact_lock = FileLock(base + ".compact.lock")
+        self._compactor = None
+
+    # -----------------------------------------------------
+    # FILE SIGNATURE
+    # -----------------------------------------------------
+    @staticmethod
+    def _stat(path):
+        """Return (mtime, size, inode) of a file, or None if it is missing."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _file_signature(self):
+        """Signature of the snapshot, plus the journal inode in journaled mode."""
+        snapshot = self._stat(self.path)
+        if not self.journal:
+            return snapshot
+        log = self._stat(self.log_path)
+        return (snapshot, log[2] if log else None)
+
+    def _log_size(self):
+        try:
+            return os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return 0
+
+    def _is_current(self):
+        """True if the in-memory copy already reflects everything on disk."""
+        if self._data is None or self._file_signature() != self._signature:
+            return False
+        return not self.journal or self._log_size() == self._log_offset
+
+    def etag(self):
+        """Validator for the current catalog state; no serialization needed."""
+        self.load()
+        # Read the version before the caller reads any data, so a
+        # response is never tagged newer than its body.
+        version = self.version
+        snapshot = self._signature[0] if self.journal else self._signature
+        checksum = zlib.crc32(repr(snapshot).encode())
+        return f"{self.lineage}-{version}-{checksum:08x}"
+
+    # -----------------------------------------------------
+    # LOAD / SAVE
+    # -----------------------------------------------------
+    def load(self):
+        """
+        Return the catalog, {name: records.MediaItem}.
+
+        The same dict is returned on every call until the files change,
+        so callers must not modify it; use put() / delete() or hand a
+        new dict to save().
+        """
+        if not self._is_current():
+            with self._lock:
+                self._refresh()
+        return self._data
+
+    @contextmanager
+    def transaction(self):
+        """
+        Hold the catalog lock (threads and processes) for a
+        read-check-write sequence. Yields the up-to-date catalog.
+        """
+        with self._lock:
+            self._refresh()
+            yield self._data
+
+    def save(self, data):
+        """Write the whole catalog to disk and keep it as the in-memory copy."""
+        data = records.catalog(data)
+        with self._compact_lock, self._lock:
+            self._refresh()
+            self._write_snapshot(data)
+            version = self.version + 1
+            if self.journal:
+                self._close_log()
+                for path in (self.rotated_log_path, self.log_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._log_offset = 0
+                self._log_records = 0
+                self._open_log(version)
+
+            self._replace_data(data, version, self.lineage)
+            self._signature = self._file_signature()
+
+    def _write_snapshot(self, data):
+        """Atomically replace the snapshot: write a temp file, then rename."""
+        tmp_path = self._write_temp(data)
+        try:
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _write_temp(self, data):
+        """Write data to a temp file next to the snapshot; returns its path."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(serialization.encode_snapshot(data, self.snapshot_format))
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    def _read_snapshot(self):
+        with open(self.path, "rb") as f:
+            return serialization.decode_snapshot(f.read())
+
+    def _refresh(self):
+        """Catch up with the files on disk (caller holds the lock)."""
+        if not os.path.exists(self.path):
+            self._write_snapshot({})
+
+        if self._data is None:
+            self._reload()
+            return
+        signature = self._file_signature()
+        if signature != self._signature:
+            if not (self.journal and self._follow_compaction(signature)):
+                self._reload()
+        elif self.journal and self._log_size() != self._log_offset:
+            self._replay_tail()
+
+    def _follow_compaction(self, signature):
+        """
+        Catch up with a compaction by another process without reloading
+        (caller holds the lock). Returns False if a reload is needed.
+        """
+        snapshot, log_inode = signature
+        old_snapshot, old_log_inode = self._signature
+
+        if log_inode != old_log_inode:
+            # Finish the log we were reading, now database.log.1
+            rotated = self._stat(self.rotated_log_path)
+            if rotated is not None and rotated[2] == old_log_inode:
+                self._log_offset, _ = self._replay_file(
+                    self.rotated_log_path, self._data, self._log_offset, apply=self._apply_in_memory
+                )
+            header = self._read_header()
+            if header is None or (header["lineage"], header["v"]) != (self.lineage, self.version):
+                return False
+            self._close_log()
+            self._log_offset = 0
+            self._log_records = 0
+
+        self._replay_tail()
+        if snapshot != old_snapshot and snapshot != self._compacted_snapshot:
+            return False
+        self._signature = signature
+        return True
+
+    def _read_header(self):
+        """The {"op": "begin"} record the journal starts with, or None."""
+        try:
+            with open(self.log_path, "rb") as f:
+                line = f.readline()
+        except FileNotFoundError:
+            return None
+        try:
+            record = serialization.loads(line)
+        except ValueError:
+            return None
+        return record if isinstance(record, dict) and record.get("op") == "begin" else None
+
+    def _reload(self):
+        """Re-read the snapshot and replay any journal on top of it."""
+        signature = self._file_signature()
+        data = self._read_snapshot()
+        # Plain mode: any reload is a new version of this process' catalog
+        meta = {"v": self.version + 1 if self._data is not None else 0}
+
+        if self.journal:
+            def apply(record):
+                self._apply_record(data, record)
+                meta["v"] = record.get("v", meta["v"] + 1)
+                if record["op"] == "begin":
+                    meta["lineage"] = record["lineage"]
+
+            self._close_log()
+            if os.path.exists(self.rotated_log_path):
+                self._replay_file(self.rotated_log_path, data, apply=apply)
+                self._start_compaction()
+            self._log_offset, self._log_records = self._replay_file(
+                self.log_path, data, apply=apply
+            )
+            self._truncate_torn_tail()
+
+        data = records.catalog(data)
+        self._replace_data(data, meta["v"], meta.get("lineage", self.lineage))
+        self._signature = signature
+
+    def _replace_data(self, data, version, lineage):
+        """Swap in a whole new catalog, recording what changed."""
+        old = self._data
+        self._data = data
+        self._build_indexes(data)
+
+        if old is None or lineage != self.lineage:
+            self._changes.clear()
+            self._changes_floor = version
+        else:
+            changed = [name for name in old.keys() | data.keys() if old.get(name) != data.get(name)]
+            if changed and version <= self.version:
+                # Hand edit that no journal record accounts for
+                version = self.version + 1
+            for name in changed:
+                self._changes.append((version, name))
+
+        self.lineage = lineage
+        self._set_version(version)
+
+    # -----------------------------------------------------
+    # CHANGE FEED
+    # -----------------------------------------------------
+    def changes_since(self, since, lineage=None):
+        """
+        Names of the items changed after version `since`, as
+        (current version, names). names is None when the caller has to
+        refetch everything: unknown lineage, a version from the future,
+        or changes older than the ones still remembered.
+        """
+        self.load()
+        with self._changed:
+            version = self.version
+            changes = list(self._changes)
+            floor = self._changes_floor
+            if len(changes) == self._changes.maxlen:
+                # Entries of the oldest version may already be dropped
+                floor = max(floor, changes[0][0])
+
+        if (lineage is not None and lineage != self.lineage) or since > version or since < floor:
+            return version, None
+
+        names = {}
+        for changed_version, name in changes:
+            if since < changed_version <= version:
+                names[name] = True
+        return version, list(names)
+
+    def _current_version(self):
+        self.load()
+        return self.version
+
+    # -----------------------------------------------------
+    # INDEXED LOOKUPS
+    # -----------------------------------------------------
+    def get(self, name):
+        """A single item, or None."""
+        return self.load().get(name)
+
+    def get_many(self, names):
+        """The existing items among `names`, as {name: item}."""
+        return self._pick(self.load(), names)
+
+    def select(self, field, value):
+        """Items whose indexed `field` equals `value`, as {name: item}."""
+        data = self.load()
+        return self._pick(data, self.indexes.names_with(field, value))
+
+    def due_between(self, start=None, end=None):
+        """Items due in [start, end), ordered by due date, as {name: item}."""
+        data = self.load()
+        return self._pick(data, self.indexes.due_between(start, end))
+
+    def list_items(self, after=None, limit=None):
+        """One page of (name, item) pairs in name order, starting after `after`."""
+        data = self.load()
+        return list(self._pick(data, self.indexes.names_after(after, limit)).items())
+
+    def search(self, query, limit=None, rank=False):
+        """Items whose name or author contains query, as {name: item}."""
+        data = self.load()
+        return self._pick(data, self.search_index.search(query, limit, rank))
+
+    # -----------------------------------------------------
+    # MUTATIONS
+    # -----------------------------------------------------
+    def put(self, name, item):
+        """Create or replace a single item."""
+        self._apply_mutation({"op": "put", "name": name, "item": item})
+
+    def delete(self, name):
+        """Remove a single item."""
+        self._apply_mutation({"op": "delete", "name": name})
+
+    def put_many(self, items):
+        """
+        Create or replace several (name, item) pairs as one batch: a
+        single journal line (or snapshot write) for all of them.
+        """
+        records = [{"op": "put", "name": name, "item": item} for name, item in items]
+        if records:
+            self._apply_mutation({"op": "batch", "records": records})
+
+    def _apply_mutation(self, record):
+        with self._lock:
+            self._refresh()
+
+            if record["op"] == "batch":
+                for i, sub_record in enumerate(record["records"], 1):
+                    sub_record["v"] = self.version + i
+                record["v"] = self.version + len(record["records"])
+            else:
+                record["v"] = self.version + 1
+
+            if not self.journal:
+                data = dict(self._data)
+                self._apply_record(data, record)
+                self._write_snapshot(data)
+                self._signature = self._file_signature()
+
+            else:
+                self._append(record)
+
+            self._apply_in_memory(record)
+
+        if self._log_records >= self.compact_every:
+            self._start_compaction()
+
+    @staticmethod
+    def _apply_record(data, record):
+        if record["op"] == "put":
+            data[record["name"]] = record["item"]
+        elif record["op"] == "delete":
+            data.pop(record["name"], None)
+        elif record["op"] == "batch":
+            for sub_record in record["records"]:
+                CatalogStore._apply_record(data, sub_record)
+
+    def _apply_in_memory(self, record):
+        """Apply a record to the in-memory catalog and its indexes."""
+        if record["op"] == "begin":
+            self.lineage = record["lineage"]
+            return
+        if record["op"] == "compacted":
+            self._compacted_snapshot = tuple(record["snapshot"])
+            return
+        if record["op"] == "batch":
+            for sub_record in record["records"]:
+                self._apply_in_memory(sub_record)
+            return
+
+        name = record["name"]
+        old = self._data.get(name)
+        if record["op"] == "put":
+            self._data[name] = records.MediaItem.from_dict(record["item"])
+        else:
+            self._data.pop(name, None)
+        new = self._data.get(name)
+
+        self.indexes.update(name, old, new)
+        self.search_index.update(name, old, new)
+
+        version = record.get("v", self.version + 1)
+        self._changes.append((version, name))
+        self._set_version(version)
+
+    def _build_indexes(self, data):
+        self.indexes = CatalogIndexes(data)
+        self.search_index = TrigramIndex(data)
+
+    # -----------------------------------------------------
+    # JOURNAL
+    # -----------------------------------------------------
+    def _open_log(self, version=None):
+        """
+        Open the journal for appending (caller holds the lock). A new
+        journal starts with a header carrying the version and lineage.
+        """
+        if self._log_file is None:
+            self._log_file = open(self.log_path, "ab")
+            if self._log_file.tell() == 0:
+                self._write_line({
+                    "op": "begin",
+                    "v": self.version if version is None else version,
+                    "lineage": self.lineage,
+                })
+            self._signature = self._file_signature()
+
+    def _append(self, record):
+        """Append one record to the journal (caller holds the lock)."""
+        self._open_log()
+        self._write_line(record)
+        self._log_records += 1
+
+    def _write_line(self, record):
+        line = serialization.dumps_bytes(record) + b"\n"
+        self._log_file.write(line)
+        self._log_file.flush()
+        if self.fsync:
+            os.fsync(self._log_file.fileno())
+        self._log_offset += len(line)
+
+    def _close_log(self):
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+    def _replay_file(self, path, data, offset=0, apply=None):
+        """
+        Apply journal records from path (starting at offset) onto data,
+        or hand each one to `apply` if given.
+
+        Returns (offset after the last complete record, records applied).
+        A torn last line from an interrupted write is left for later.
+        """
+        applied = 0
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return offset, applied
+
+        with f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = serialization.loads(line)
+                except ValueError:
+                    break
+                if apply is None:
+                    self._apply_record(data, record)
+                else:
+                    apply(record)
+                offset += len(line)
+                applied += 1
+
+        return offset, applied
+
+    def _truncate_torn_tail(self):
+        """Drop a half-written last record so new appends start on a fresh line."""
+        if self._log_size() > self._log_offset:
+            with open(self.log_path, "r+b") as f:
+                f.truncate(self._log_offset)
+
+    def _replay_tail(self):
+        """Pick up records appended to the journal by another process."""
+        self._log_offset, applied = self._replay_file(
+            self.log_path, self._data, self._log_offset, apply=self._apply_in_memory
+        )
+        self._log_records += applied
+
+    # -----------------------------------------------------
+    # COMPACTION
+    # -----------------------------------------------------
+    def _start_compaction(self):
+        """Fold the journal into the snapshot on a background thread."""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, daemon=True)
+        self._compactor.start()
+
+    def compact(self):
+        """
+        Fold the journal into a new snapshot.
+
+        Only the rename happens under the catalog lock; the snapshot is
+        rebuilt from the files on disk, so writers are never blocked by
+        it. Returns False if another process is already compacting.
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            return False
+
+        try:
+            with self._lock:
+                if not os.path.exists(self.rotated_log_path):
+                    if not os.path.exists(self.log_path):
+                        return True
+                    self._refresh()
+                    self._close_log()
+                    os.replace(self.log_path, self.rotated_log_path)
+                    self._log_offset = 0
+                    self._log_records = 0
+                    # Start the new journal right away, so the version
+                    # survives even if nothing is written before a restart
+                    self._open_log()
+
+            data = self._read_snapshot()
+            self._replay_file(self.rotated_log_path, data)
+            tmp_path = self._write_temp(data)
+
+            try:
+                with self._lock:
+                    self._refresh()
+                    # A rename keeps inode, size and mtime, so other
+                    # processes can recognise the file the record names
+                    record = {"op": "compacted", "v": self.version, "snapshot": list(self._stat(tmp_path))}
+                    self._append(record)
+                    self._apply_in_memory(record)
+                    os.replace(tmp_path, self.path)
+                    os.remove(self.rotated_log_path)
+                    self._signature = self._file_signature()
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            return True
+        finally:
+            self._compact_lock.release()
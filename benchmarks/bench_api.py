@@ -0,0 +1,469 @@
+"""
+Benchmark: latency and throughput of the REST API under a mixed workload.
+
+Generates a synthetic catalog (benchmarks/catalog_gen.py), then runs
+worker threads that pick requests at random from a weighted mix for a
+fixed time and reports p50/p95/p99 latency and requests/sec per
+endpoint:
+
+    read     GET  /media/<name>
+    list     GET  /media?limit=50
+    search   GET  /media/search/<word>?limit=50
+    borrow   POST /media/<name>/borrow
+    return   POST /media/<name>/return
+
+Borrows only pick available items and returns only borrowed ones, so a
+run should report no errors.
+
+Modes:
+    inprocess   Flask test client in this process (no sockets; measures
+                the app and the storage, default)
+    server      a real server over HTTP: started on --port with the
+                generated catalog (the development server, or
+                backend/serve.py with --workers N), or an already
+                running one with --url (careful: borrows and returns
+                change its catalog)
+
+Results are written as JSON (benchmarks/results/ by default) together
+with the commit and settings, so runs can be compared across commits:
+    python benchmarks/bench_api.py --items 100000 --baseline old.json
+
+Usage:
+    python benchmarks/bench_api.py [--items N] [--backend json|sqlite]
+        [--mode inprocess|server] [--concurrency N] [--duration S]
+        [--mix read=50,list=10,search=24,borrow=8,return=8]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import requests
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+from catalog_gen import ADJECTIVES, LAST_NAMES, NOUNS, write_catalog  # noqa: E402
+
+
+DEFAULT_MIX = "read=50,list=10,search=24,borrow=8,return=8"
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+DATA_EXTENSIONS = {"json": ".json", "sqlite": ".sqlite3"}
+
+# Words searched for: common and rare title words and author names
+SEARCH_WORDS = [word.lower() for word in ADJECTIVES + NOUNS + LAST_NAMES]
+
+PAGE_SIZE = 50
+# Longest a spawned server may take to load the catalog
+SERVER_START_TIMEOUT = 600
+
+
+# ---------------------------------------------------------
+# CLIENTS
+# ---------------------------------------------------------
+class TestClient:
+    """The Flask app in this process, through its test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+
+class HttpClient:
+    """A running server, over one keep-alive connection per worker."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+
+    def request(self, method, path, body=None):
+        response = self.session.request(method, self.url + path, json=body, timeout=60)
+        return response.status_code
+
+
+# ---------------------------------------------------------
+# WORKLOAD
+# ---------------------------------------------------------
+class Pool:
+    """Names of available and borrowed items, shared by the workers."""
+
+    def __init__(self, statuses):
+        self._names = {"available": [], "borrowed": []}
+        for name, status in statuses:
+            self._names["borrowed" if status == "borrowed" else "available"].append(name)
+        self._all = self._names["available"] + self._names["borrowed"]
+        self._lock = threading.Lock()
+
+    def any(self, rng):
+        return rng.choice(self._all)
+
+    def take(self, status, rng):
+        """Remove and return a random name with this status, or None."""
+        with self._lock:
+            names = self._names[status]
+            if not names:
+                return None
+            i = rng.randrange(len(names))
+            names[i], names[-1] = names[-1], names[i]
+            return names.pop()
+
+    def give(self, name, status):
+        with self._lock:
+            self._names[status].append(name)
+
+
+def op_read(client, pool, rng):
+    return "GET /media/<name>", client.request("GET", "/media/" + quote(pool.any(rng), safe=""))
+
+
+def op_list(client, pool, rng):
+    return "GET /media?limit", client.request("GET", f"/media?limit={PAGE_SIZE}")
+
+
+def op_search(client, pool, rng):
+    word = rng.choice(SEARCH_WORDS)
+    return "GET /media/search", client.request("GET", f"/media/search/{quote(word)}?limit={PAGE_SIZE}")
+
+
+def op_borrow(client, pool, rng):
+    name = pool.take("available", rng)
+    if name is None:
+        return op_read(client, pool, rng)
+    status = client.request(
+        "POST", f"/media/{quote(name, safe='')}/borrow", {"borrowed_by": "Bench", "days": 14}
+    )
+    pool.give(name, "borrowed" if status == 200 else "available")
+    return "POST /media/<name>/borrow", status
+
+
+def op_return(client, pool, rng):
+    name = pool.take("borrowed", rng)
+    if name is None:
+        return op_read(client, pool, rng)
+    status = client.request("POST", f"/media/{quote(name, safe='')}/return")
+    pool.give(name, "available" if status == 200 else "borrowed")
+    return "POST /media/<name>/return", status
+
+
+OPERATIONS = {
+    "read": op_read,
+    "list": op_list,
+    "search": op_search,
+    "borrow": op_borrow,
+    "return": op_return,
+}
+
+
+def parse_mix(text):
+    """"read=50,search=25" -> ([op, ...], [weight, ...])."""
+    ops, weights = [], []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"unknown operation {name!r} (choose from {', '.join(OPERATIONS)})")
+        ops.append(OPERATIONS[name])
+        weights.append(float(weight or 1))
+    return ops, weights
+
+
+def worker(client, pool, ops, weights, deadline, seed, samples, errors):
+    rng = random.Random(seed)
+    while True:
+        op = rng.choices(ops, weights)[0]
+        start = time.perf_counter()
+        endpoint, status = op(client, pool, rng)
+        end = time.perf_counter()
+        if end > deadline:
+            return
+        samples.setdefault(endpoint, []).append(end - start)
+        if status >= 400:
+            errors[endpoint] = errors.get(endpoint, 0) + 1
+
+
+def run(make_client, pool, mix, concurrency, duration, seed=0):
+    """Run the mix on `concurrency` threads for `duration` seconds."""
+    ops, weights = parse_mix(mix)
+    deadline = time.perf_counter() + duration
+    results = [({}, {}) for _ in range(concurrency)]
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(make_client(), pool, ops, weights, deadline, seed + i, *results[i]),
+        )
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = min(time.perf_counter(), deadline) - start
+
+    samples, errors = {}, {}
+    for worker_samples, worker_errors in results:
+        for endpoint, latencies in worker_samples.items():
+            samples.setdefault(endpoint, []).extend(latencies)
+        for endpoint, count in worker_errors.items():
+            errors[endpoint] = errors.get(endpoint, 0) + count
+    return samples, errors, elapsed
+
+
+# ---------------------------------------------------------
+# REPORT
+# ---------------------------------------------------------
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(p / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]) if latencies else 0.0,
+    }
+
+
+def report(samples, errors, elapsed):
+    endpoints = {
+        endpoint: summarize(latencies, errors.get(endpoint, 0), elapsed)
+        for endpoint, latencies in sorted(samples.items())
+    }
+    total = summarize(
+        [latency for latencies in samples.values() for latency in latencies],
+        sum(errors.values()),
+        elapsed,
+    )
+    return endpoints, total
+
+
+def print_table(endpoints, total, baseline=None):
+    header = (f"{'endpoint':<28}{'requests':>9}{'errors':>8}{'req/s':>9}"
+              f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    if baseline:
+        header += f"{'p50 Δ':>9}{'req/s Δ':>9}"
+    print(header)
+    print("-" * len(header))
+
+    rows = list(endpoints.items()) + [("total", total)]
+    for endpoint, row in rows:
+        line = (f"{endpoint:<28}{row['requests']:>9,}{row['errors']:>8}{row['rps']:>9,.0f}"
+                f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}")
+        if baseline:
+            old = baseline["total"] if endpoint == "total" else baseline["endpoints"].get(endpoint)
+            if old:
+                line += f"{change(old['p50_ms'], row['p50_ms']):>9}{change(old['rps'], row['rps']):>9}"
+        print(line)
+
+
+def change(old, new):
+    if not old:
+        return "-"
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(__file__) or ".",
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------------------------------------------------------
+# SETUP
+# ---------------------------------------------------------
+def prepare_catalog(args, tmp_dir):
+    """Path of the catalog to benchmark, generated unless --data exists."""
+    path = args.data or os.path.join(tmp_dir, "catalog" + DATA_EXTENSIONS[args.backend])
+    if not os.path.exists(path):
+        print(f"Generating {args.items:,} items ({args.backend})...")
+        start = time.perf_counter()
+        write_catalog(path, args.items, args.backend)
+        print(f"Catalog written in {time.perf_counter() - start:.1f} s")
+    return path
+
+
+def server_env(args, path):
+    env = dict(os.environ)
+    env.update(
+        MEDIA_STORAGE=args.backend,
+        MEDIA_DATA_FILE=os.path.abspath(path),
+        # Keep background writes out of the measurements
+        MEDIA_OVERDUE_SCHEDULER="0",
+    )
+    # All load comes from one address: per-client limits would only
+    # measure 429s (set MEDIA_LIMITS to benchmark with them)
+    env.setdefault("MEDIA_LIMITS", "off")
+    return env
+
+
+def inprocess_setup(args, path):
+    os.environ.update(server_env(args, path))
+    from app import app, store
+
+    statuses = [(name, item.get("status")) for name, item in store.load().items()]
+    return (lambda: TestClient(app)), statuses, None
+
+
+def server_command(port, workers=None, threads=None):
+    """Flask's development server, or serve.py with `workers` processes."""
+    if workers is None:
+        return [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port)]
+    command = [sys.executable, "serve.py", "--bind", f"127.0.0.1:{port}", "--workers", str(workers)]
+    if threads is not None:
+        command += ["--threads", str(threads)]
+    return command
+
+
+def start_server(command, env, port):
+    """Start a server process and wait until it answers; returns (process, url)."""
+    process = subprocess.Popen(
+        command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"Server exited with code {process.returncode}")
+        try:
+            requests.get(url + "/media?limit=1", timeout=SERVER_START_TIMEOUT)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    sys.exit("Server did not start in time")
+
+
+def server_statuses(url):
+    """(name, status) of every item, streamed from GET /media/export."""
+    with requests.get(url + "/media/export", stream=True, timeout=SERVER_START_TIMEOUT) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                item = json.loads(line)
+                yield item["name"], item.get("status")
+
+
+def server_setup(args, path):
+    process = None
+    url = args.url
+    if url is None:
+        command = server_command(args.port, args.workers)
+        process, url = start_server(command, server_env(args, path), args.port)
+    return (lambda: HttpClient(url)), list(server_statuses(url)), process
+
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--mode", choices=["inprocess", "server"], default="inprocess")
+    parser.add_argument("--url", help="benchmark this running server (server mode)")
+    parser.add_argument("--port", type=int, default=5050, help="port of the spawned server")
+    parser.add_argument("--workers", type=int,
+                        help="spawn backend/serve.py with this many workers instead of the dev server")
+    parser.add_argument("--data", help="catalog file to use, generated there if missing")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds run before measuring")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--out", help="JSON results file (default: benchmarks/results/...)")
+    parser.add_argument("--baseline", help="earlier JSON results to compare with")
+    args = parser.parse_args()
+
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.url:
+        args.mode = "server"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = None if args.url else prepare_catalog(args, tmp_dir)
+
+        start = time.perf_counter()
+        setup = server_setup if args.mode == "server" else inprocess_setup
+        make_client, statuses, process = setup(args, path)
+        load_seconds = time.perf_counter() - start
+        print(f"Loaded {len(statuses):,} items in {load_seconds:.1f} s")
+
+        try:
+            pool = Pool(statuses)
+            if args.warmup > 0:
+                run(make_client, pool, args.mix, args.concurrency, args.warmup, seed=1000)
+            print(f"Running {args.mix} on {args.concurrency} threads for {args.duration:g} s...\n")
+            samples, errors, elapsed = run(make_client, pool, args.mix, args.concurrency, args.duration)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    endpoints, total = report(samples, errors, elapsed)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(endpoints, total, baseline)
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "mode": args.mode,
+            "backend": args.backend,
+            "items": len(statuses),
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": args.mix,
+            "url": args.url,
+            "workers": args.workers,
+        },
+        "load_seconds": round(load_seconds, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "endpoints": endpoints,
+        "total": total,
+    }
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"{commit or 'local'}-{args.mode}-{args.backend}-{len(statuses)}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
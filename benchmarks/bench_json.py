@@ -0,0 +1,97 @@
+"""
+Benchmark: catalog snapshot formats and JSON libraries.
+
+Encodes and parses a synthetic catalog (100k items by default) with
+every JSON library serialization.py can use, plus the old
+json.dump(indent=4) format and MessagePack, and reports encode time,
+parse time and size. Results are written as JSON like bench_api.py.
+
+Usage:
+    python benchmarks/bench_json.py [--items N] [--repeat N]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+import serialization  # noqa: E402
+from bench_api import RESULTS_DIR, git_commit  # noqa: E402
+from catalog_gen import generate_catalog  # noqa: E402
+
+
+def formats():
+    """name -> (encode to bytes, decode from bytes)."""
+    found = {
+        # What database.json used to be written as
+        "stdlib indent=4": (lambda data: json.dumps(data, indent=4).encode(), json.loads),
+    }
+    for name, (dumps_bytes, loads) in serialization.LIBRARIES.items():
+        found[f"{name} compact"] = (dumps_bytes, loads)
+    if serialization.msgpack is not None:
+        found["msgpack"] = (
+            lambda data: serialization.encode_snapshot(data, "msgpack"),
+            serialization.decode_snapshot,
+        )
+    return found
+
+
+def time_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", help="JSON results file (default: benchmarks/results/...)")
+    args = parser.parse_args()
+
+    print(f"Generating {args.items:,} items...")
+    data = generate_catalog(args.items)
+
+    header = f"{'format':<20}{'size MB':>10}{'encode ms':>12}{'parse ms':>12}"
+    print(header)
+    print("-" * len(header))
+
+    rows = {}
+    for name, (encode, decode) in formats().items():
+        raw = encode(data)
+        assert decode(raw) == data, f"{name} does not round-trip"
+        rows[name] = {
+            "bytes": len(raw),
+            "encode_ms": round(time_ms(lambda: encode(data), args.repeat), 1),
+            "parse_ms": round(time_ms(lambda: decode(raw), args.repeat), 1),
+        }
+        row = rows[name]
+        print(f"{name:<20}{row['bytes'] / 1e6:>10.1f}{row['encode_ms']:>12.1f}{row['parse_ms']:>12.1f}")
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"items": args.items, "repeat": args.repeat},
+        "default_library": serialization.JSON_LIBRARY,
+        "formats": rows,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"{commit or 'local'}-json-{args.items}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: memory of the in-memory catalog, dicts vs records.MediaItem.
+
+Parses a synthetic catalog (1M items by default) from its snapshot the
+way the JSON store loads it, once kept as plain dicts (the old layout)
+and once converted to MediaItem records, and reports the memory held
+per item (tracemalloc), the load time and the time to encode the
+catalog back to JSON. Results are written as JSON like bench_api.py.
+
+Usage:
+    python benchmarks/bench_memory.py [--items N]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+import records  # noqa: E402
+import serialization  # noqa: E402
+from bench_api import RESULTS_DIR, git_commit  # noqa: E402
+from catalog_gen import generate_catalog  # noqa: E402
+
+
+def layouts():
+    """name -> function building the in-memory catalog from a snapshot."""
+    return {
+        "dict": serialization.decode_snapshot,
+        "MediaItem": lambda raw: records.catalog(serialization.decode_snapshot(raw)),
+    }
+
+
+def held_memory(build, raw):
+    """(catalog, bytes still allocated once it is built, peak bytes)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        data = build(raw)
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return data, current, peak
+
+
+def seconds(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--out", help="JSON results file (default: benchmarks/results/...)")
+    args = parser.parse_args()
+
+    print(f"Generating {args.items:,} items...")
+    raw = serialization.encode_snapshot(generate_catalog(args.items))
+
+    header = f"{'layout':<12}{'MB':>10}{'bytes/item':>12}{'peak MB':>10}{'load s':>9}{'encode s':>10}"
+    print(header)
+    print("-" * len(header))
+
+    rows = {}
+    for name, build in layouts().items():
+        data, current, peak = held_memory(build, raw)
+        assert serialization.loads(serialization.dumps_bytes(data)) == serialization.loads(raw), \
+            f"{name} does not round-trip"
+        rows[name] = {
+            "bytes": current,
+            "bytes_per_item": round(current / args.items),
+            "peak_bytes": peak,
+            # Timed without tracemalloc, which slows allocation down
+            "load_s": round(seconds(lambda: build(raw)), 2),
+            "encode_s": round(seconds(lambda: serialization.dumps_bytes(data)), 2),
+        }
+        data = None  # let it go before the next layout is measured
+        row = rows[name]
+        print(f"{name:<12}{row['bytes'] / 1e6:>10.1f}{row['bytes_per_item']:>12,}"
+              f"{row['peak_bytes'] / 1e6:>10.1f}{row['load_s']:>9.2f}{row['encode_s']:>10.2f}")
+
+    saved = 1 - rows["MediaItem"]["bytes"] / rows["dict"]["bytes"]
+    print(f"\nMediaItem records hold {saved:.0%} less memory than dicts")
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"items": args.items},
+        "json_library": serialization.JSON_LIBRARY,
+        "layouts": rows,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"{commit or 'local'}-memory-{args.items}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark: throughput of backend/serve.py as worker processes are added.
+
+Starts the production server (gunicorn, catalog preloaded) with 1, 2,
+4, ... workers up to the CPU count on the same generated catalog and
+drives it with the bench_api.py workload for a fixed time. Load comes
+from several client processes, each with its own share of the items,
+because one Python process cannot keep many workers busy. Reports
+requests/sec, latency and the speedup over one worker, and writes the
+results as JSON like bench_api.py.
+
+Run it on a machine with several cores and keep --clients x
+--concurrency well above the largest worker count.
+
+Usage:
+    python benchmarks/bench_scaling.py [--items N] [--workers 1,2,4]
+        [--clients N] [--concurrency N] [--duration S]
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from bench_api import (
+    DEFAULT_MIX, RESULTS_DIR, HttpClient, Pool, git_commit, prepare_catalog, report, run,
+    server_command, server_env, server_statuses, start_server,
+)
+
+
+def default_worker_counts():
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+def client_process(url, statuses, mix, concurrency, duration, warmup, seed):
+    """One load-generating process: bench_api's threads on its share of the items."""
+    pool = Pool(statuses)
+    make_client = lambda: HttpClient(url)  # noqa: E731
+    if warmup > 0:
+        run(make_client, pool, mix, concurrency, warmup, seed=seed + 1000)
+    return run(make_client, pool, mix, concurrency, duration, seed=seed)
+
+
+def measure(args, path, workers):
+    """Start serve.py with `workers` processes and load it from all clients."""
+    command = server_command(args.port, workers, args.threads)
+    process, url = start_server(command, server_env(args, path), args.port)
+    try:
+        statuses = list(server_statuses(url))
+        with ProcessPoolExecutor(args.clients) as executor:
+            futures = [
+                executor.submit(
+                    client_process, url, statuses[i::args.clients], args.mix,
+                    args.concurrency, args.duration, args.warmup, i * 100,
+                )
+                for i in range(args.clients)
+            ]
+            results = [future.result() for future in futures]
+    finally:
+        process.terminate()
+        process.wait()
+
+    samples, errors = {}, {}
+    for client_samples, client_errors, _ in results:
+        for endpoint, latencies in client_samples.items():
+            samples.setdefault(endpoint, []).extend(latencies)
+        for endpoint, count in client_errors.items():
+            errors[endpoint] = errors.get(endpoint, 0) + count
+    elapsed = max(elapsed for _, _, elapsed in results)
+    return report(samples, errors, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--data", help="catalog file to use, generated there if missing")
+    parser.add_argument("--workers", default=",".join(map(str, default_worker_counts())),
+                        help="comma-separated worker counts (default: %(default)s)")
+    parser.add_argument("--threads", type=int, default=4, help="threads per worker")
+    parser.add_argument("--clients", type=int, default=max(2, os.cpu_count() or 1),
+                        help="load-generating processes (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=8, help="threads per client process")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--out", help="JSON results file (default: benchmarks/results/...)")
+    args = parser.parse_args()
+
+    worker_counts = [int(count) for count in args.workers.split(",") if count]
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = prepare_catalog(args, tmp_dir)
+        for workers in worker_counts:
+            print(f"{workers} worker(s): {args.clients} clients x {args.concurrency} threads, "
+                  f"{args.duration:g} s...")
+            endpoints, total = measure(args, path, workers)
+            rows.append({"workers": workers, "total": total, "endpoints": endpoints})
+
+    base_rps = rows[0]["total"]["rps"] or 1
+    for row in rows:
+        row["speedup"] = round(row["total"]["rps"] / base_rps, 2)
+
+    header = (f"{'workers':>8}{'req/s':>10}{'speedup':>9}"
+              f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    print()
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        total = row["total"]
+        print(f"{row['workers']:>8}{total['rps']:>10,.0f}{row['speedup']:>8.2f}x"
+              f"{total['p50_ms']:>9.2f}{total['p95_ms']:>9.2f}{total['p99_ms']:>9.2f}{total['errors']:>8}")
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "backend": args.backend,
+            "items": args.items,
+            "threads": args.threads,
+            "clients": args.clients,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": args.mix,
+        },
+        "runs": rows,
+    }
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"{commit or 'local'}-scaling-{args.backend}-{args.items}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark: trigram search index vs. a linear scan.
+
+Builds a synthetic catalog (1M items by default), indexes it with
+backend/search_index.py and times a mix of queries, with and without a
+result limit, against the old `query in name.lower()` scan.
+
+Usage:
+    python benchmarks/bench_search.py [--items N] [--repeat N]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from catalog_gen import generate_catalog  # noqa: E402
+from search_index import TrigramIndex  # noqa: E402
+
+
+QUERIES = [
+    "engine",          # rare title word
+    "garden",          # common title word
+    "silent river",    # phrase
+    "kowalski",        # author
+    "of rome 12",      # very selective
+    "zzzq",            # no match
+    "th",              # too short for trigrams: scan
+]
+
+
+def time_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def linear_scan(data, query):
+    query = query.lower()
+    return [name for name in data if query in name.lower()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"Generating {args.items:,} items...")
+    data = generate_catalog(args.items)
+
+    start = time.perf_counter()
+    index = TrigramIndex(data)
+    print(f"Index built in {time.perf_counter() - start:.1f} s\n")
+
+    header = f"{'query':<14}{'hits':>9}{'limit p50':>12}{'limit p95':>12}{'all p50':>11}{'scan p50':>11}"
+    print(header)
+    print("-" * len(header))
+
+    for query in QUERIES:
+        hits = len(index.search(query))
+        limited = time_ms(lambda: index.search(query, limit=args.limit), args.repeat)
+        full = time_ms(lambda: index.search(query), max(1, args.repeat // 10))
+        scan = time_ms(lambda: linear_scan(data, query), 3)
+        print(
+            f"{query:<14}{hits:>9,}{limited[0]:>10.3f}ms{limited[1]:>10.3f}ms"
+            f"{full[0]:>9.2f}ms{scan[0]:>9.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
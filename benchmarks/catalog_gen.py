@@ -0,0 +1,136 @@
+"""
+Synthetic catalog generator for benchmarks.
+
+Produces items shaped exactly like the ones in backend/database.json.
+Words, authors and categories are drawn with a skewed (Zipf-like)
+distribution, so some title words and authors are very common and most
+are rare, like in a real library.
+
+Write a catalog file the server can load (MEDIA_DATA_FILE) with:
+    python benchmarks/catalog_gen.py 100000 /tmp/catalog.json [--backend sqlite]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+
+ADJECTIVES = [
+    "Silent", "Hidden", "Last", "Lost", "Great", "Dark", "Little", "Golden",
+    "Broken", "Secret", "Wild", "Final", "Ancient", "Modern", "Deep", "Quiet",
+    "Burning", "Frozen", "Eternal", "Invisible", "Digital", "Practical",
+    "Complete", "Essential", "Intelligent", "Atomic", "Red", "Blue", "Green",
+]
+NOUNS = [
+    "Garden", "River", "Kingdom", "Mind", "Habits", "Empire", "Code", "Ocean",
+    "Machine", "City", "Laws", "Power", "Mountain", "Night", "Star", "Game",
+    "House", "Road", "War", "Investor", "Language", "Algorithm", "Finance",
+    "Mastery", "Seduction", "Universe", "Matrix", "Dream", "Storm", "Shadow",
+    "Island", "Forest", "Memory", "Signal", "Bridge", "Mirror", "Engine",
+]
+PLACES = [
+    "the North", "Tomorrow", "the Sea", "Rome", "Berlin", "Data", "the Past",
+    "the Future", "Silence", "Glass", "Fire", "Time", "Everything",
+]
+FIRST_NAMES = [
+    "Robert", "James", "David", "Anna", "Maria", "Ali", "Sara", "Chen",
+    "Fatima", "Lucas", "Emma", "Noah", "Olga", "Hiro", "Priya", "Omar",
+    "Laura", "Jonas", "Mei", "Carlos", "Nina", "Arjun", "Elena", "Tom",
+]
+LAST_NAMES = [
+    "Greene", "Clear", "Goggins", "Graham", "Nolan", "Gilligan", "Rowling",
+    "Doyle", "Kernighan", "Donovan", "Cormen", "Smith", "Garcia", "Kim",
+    "Nguyen", "Müller", "Rossi", "Haddad", "Tanaka", "Ivanova", "Silva",
+    "Johansson", "Okafor", "Kowalski", "Hassan", "Schmidt", "Novak", "Patel",
+]
+CATEGORIES = ["Book", "Film", "Magazine"]
+CATEGORY_WEIGHTS = [0.65, 0.25, 0.10]
+BORROWED_SHARE = 0.2
+
+
+def _zipf_weights(n, s=1.1):
+    return [1.0 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def generate_items(count, seed=42, today=None):
+    """Yield (name, item) pairs for a catalog of `count` items."""
+    rng = random.Random(seed)
+    today = today or date.today()
+
+    adjective_w = _zipf_weights(len(ADJECTIVES))
+    noun_w = _zipf_weights(len(NOUNS))
+    first_w = _zipf_weights(len(FIRST_NAMES))
+    last_w = _zipf_weights(len(LAST_NAMES))
+
+    for i in range(count):
+        adjective = rng.choices(ADJECTIVES, adjective_w)[0]
+        noun = rng.choices(NOUNS, noun_w)[0]
+        if rng.random() < 0.4:
+            title = f"The {adjective} {noun} of {rng.choice(PLACES)}"
+        else:
+            title = f"{adjective} {noun}"
+        # Suffix keeps names unique without making them unrealistic
+        name = f"{title} {i}"
+
+        author = f"{rng.choices(FIRST_NAMES, first_w)[0]} {rng.choices(LAST_NAMES, last_w)[0]}"
+        item = {
+            "name": name,
+            "author": author,
+            "publication_date": str(rng.randint(1950, today.year)),
+            "category": rng.choices(CATEGORIES, CATEGORY_WEIGHTS)[0],
+            "status": "available",
+            "image": "",
+            "borrowed_by": None,
+            "borrow_date": None,
+            "due_date": None,
+            "overdue": False,
+        }
+
+        if rng.random() < BORROWED_SHARE:
+            borrowed = today - timedelta(days=rng.randint(0, 30))
+            item.update(
+                status="borrowed",
+                borrowed_by=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                borrow_date=borrowed.isoformat(),
+                due_date=(borrowed + timedelta(days=rng.choice([7, 14, 21]))).isoformat(),
+            )
+
+        yield name, item
+
+
+def generate_catalog(count, seed=42, today=None):
+    """Return a synthetic catalog dict of `count` items."""
+    return dict(generate_items(count, seed, today))
+
+
+def write_catalog(path, count, backend=None, seed=42):
+    """Generate a catalog and save it to path with the given storage backend."""
+    from storage import backend_for_path, open_store
+
+    backend = backend or backend_for_path(path)
+    store = open_store(path, backend, journal=False)
+    store.save(generate_catalog(count, seed))
+    return backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic catalog for benchmarks.")
+    parser.add_argument("items", type=int)
+    parser.add_argument("path")
+    parser.add_argument("--backend", choices=["json", "sqlite"],
+                        help="storage backend (default: from the file extension)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    backend = write_catalog(args.path, args.items, args.backend, args.seed)
+    print(f"Wrote {args.items:,} items to {args.path} ({backend}) "
+          f"in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
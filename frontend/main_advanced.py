@@ -1,21 +1,174 @@
 import sys
 import os
-import requests
-from datetime import datetime
+import json
+import time
+from urllib.parse import quote
 
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-    QListWidget, QLabel, QPushButton, QComboBox,
+    QListView, QLabel, QPushButton, QComboBox,
     QLineEdit, QMessageBox, QDialog, QFormLayout,
-    QListWidgetItem, QSplitter
+    QSplitter
 )
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPixmap, QFont
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QFont
+
+from media_model import ItemRole, MediaFilterProxy, MediaListModel, NameRole, is_overdue
+from network import ApiClient, is_offline
+from replica import Replica
+from search_cache import SearchCache
+from thumbnails import ThumbnailCache
 
 
 BACKEND_URL = "http://127.0.0.1:5000"
 IMAGE_DIR = os.path.join(os.path.dirname(__file__), "..", "picss")
 
+# The list only needs these fields; full details are fetched on click.
+# The category is filtered locally, so switching it needs no request,
+# and the image name lets covers of nearby rows be prefetched.
+LIST_FIELDS = "name,status,overdue,category,image"
+PAGE_SIZE = 1000
+# How often to pull changes made by other clients
+SYNC_INTERVAL_MS = 5000
+
+# Search runs on the backend once typing pauses this long
+SEARCH_DEBOUNCE_MS = 150
+# Most results fetched per query, and results added to the list at a time
+SEARCH_LIMIT = 1000
+SEARCH_BATCH = 100
+
+UNREACHABLE = "Backend unreachable, retrying..."
+
+# What an offline borrow/return needs the item to be, and makes it
+REQUIRED_STATUS = {"borrow": ("available", "Media already borrowed"),
+                   "return": ("borrowed", "Media is not borrowed")}
+NEW_STATUS = {"borrow": "borrowed", "return": "available"}
+
+# Covers of this many rows above and below the current one are prefetched
+PREFETCH_ROWS = 2
+
+
+# ---------------------------------------------------------
+# NETWORK JOBS (run on the ApiClient thread pool)
+# ---------------------------------------------------------
+def fetch_pages(task, session, url):
+    """
+    Fetch a listing page by page, following X-Next-Cursor.
+    Returns (data, version, lineage).
+    """
+    data = {}
+    params = {"limit": PAGE_SIZE, "fields": LIST_FIELDS}
+    version = lineage = None
+    while True:
+        r = session.get(url, params=params)
+        r.raise_for_status()
+        data.update(r.json())
+
+        # Later pages may be newer; the first page's version is safe
+        if version is None and "X-Catalog-Version" in r.headers:
+            version = int(r.headers["X-Catalog-Version"])
+            lineage = r.headers.get("X-Catalog-Lineage")
+
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            return data, version, lineage
+        task.check()
+        params["cursor"] = cursor
+
+
+def fetch_catalog(task, session, replica):
+    """Load the whole list and keep it in the replica. Returns (data, version, lineage)."""
+    data, version, lineage = fetch_pages(task, session, f"{BACKEND_URL}/media")
+    task.check()
+    replica.replace(data, version, lineage)
+    return data, version, lineage
+
+
+def fetch_changes(task, session, version, lineage):
+    r = session.get(
+        f"{BACKEND_URL}/media/changes",
+        params={"since": version, "lineage": lineage, "fields": LIST_FIELDS},
+    )
+    r.raise_for_status()
+    return r.json()
+
+
+def fetch_item(task, session, name):
+    r = session.get(f"{BACKEND_URL}/media/{name}")
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    return r.json()
+
+
+def stream_search(task, session, query):
+    """
+    Run a search on the backend, reporting matches in batches while
+    the JSON Lines response arrives. Returns all of them.
+    """
+    r = session.get(
+        f"{BACKEND_URL}/media/search/{quote(query, safe='')}",
+        params={"limit": SEARCH_LIMIT, "format": "ndjson"},
+        stream=True,
+    )
+    r.raise_for_status()
+
+    results = {}
+    batch = {}
+    with r:
+        for line in r.iter_lines():
+            if not line:
+                continue
+            item = json.loads(line)
+            batch[item["name"]] = item
+            if len(batch) == SEARCH_BATCH:
+                task.report(batch)
+                results.update(batch)
+                batch = {}
+    if batch:
+        task.report(batch)
+        results.update(batch)
+    return results
+
+
+def post_json(task, session, path, payload=None):
+    """POST to the backend, returns (status code, JSON body)."""
+    r = session.post(f"{BACKEND_URL}{path}", json=payload)
+    return r.status_code, r.json()
+
+
+def replay_pending(task, session, replica):
+    """
+    Send the borrows/returns queued offline, oldest first, and remove
+    them from the queue. Stops at the first one that cannot be delivered
+    (backend gone again, or failing), leaving it and the rest queued.
+
+    Returns (sent, rejected); rejected are (action, error message, item
+    as the server has it now or None), for actions the backend refused.
+    """
+    sent, rejected = 0, []
+    for action in replica.pending():
+        try:
+            status, body = post_json(
+                task, session, f"/media/{action['name']}/{action['action']}", action["payload"]
+            )
+        except Exception as e:
+            if is_offline(e):
+                break
+            raise
+        if status >= 500:
+            break
+
+        if status == 200:
+            sent += 1
+        else:
+            item = fetch_item(task, session, action["name"])
+            if item is not None:
+                item = {field: item.get(field) for field in LIST_FIELDS.split(",")}
+            rejected.append((action, body.get("error", "Request failed"), item))
+        replica.discard(action["id"])
+    return sent, rejected
+
 
 # ---------------------------------------------------------
 # BORROW DIALOG
@@ -56,8 +209,19 @@ class MainWindow(QWidget):
         self.resize(1100, 650)
 
         self.current_data = {}
+        # Catalog version of current_data, for GET /media/changes
+        self.version = None
+        self.lineage = None
         self.dark_mode = False
 
+        # All backend calls run in the background through this
+        self.api = ApiClient(self)
+
+        # Last synced catalog and the actions made offline, on disk
+        self.replica = Replica(BACKEND_URL)
+        self.synced_at = None
+        self.offline = False
+
         main_layout = QHBoxLayout(self)
 
         # ---------------- LEFT SIDE ----------------
@@ -74,19 +238,42 @@ class MainWindow(QWidget):
         controls = QHBoxLayout()
         self.category_box = QComboBox()
         self.category_box.addItems(["All", "Book", "Film", "Magazine"])
-        self.category_box.currentTextChanged.connect(self.load_media)
+        self.category_box.currentTextChanged.connect(self.filter_category)
 
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("Search by name...")
         self.search_input.textChanged.connect(self.search_media)
 
+        # Typing restarts the timer; the search runs once it fires
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_cache = SearchCache()
+
         controls.addWidget(self.category_box)
         controls.addWidget(self.search_input)
         left_layout.addLayout(controls)
 
-        self.list_widget = QListWidget()
-        self.list_widget.itemClicked.connect(self.show_details)
-        left_layout.addWidget(self.list_widget)
+        # The view only draws the visible rows; search and category
+        # just re-filter the proxy
+        self.model = MediaListModel(self)
+        self.proxy = MediaFilterProxy(self)
+        self.proxy.setSourceModel(self.model)
+
+        # Search results get a model of their own
+        self.search_model = MediaListModel(self)
+        self.search_proxy = MediaFilterProxy(self)
+        self.search_proxy.setSourceModel(self.search_model)
+
+        self.list_view = QListView()
+        self.list_view.setUniformItemSizes(True)
+        self.set_list_model(self.proxy)
+        self.list_view.clicked.connect(self.show_details)
+        left_layout.addWidget(self.list_view)
+
+        self.status_label = QLabel("")
+        left_layout.addWidget(self.status_label)
 
         action_layout = QHBoxLayout()
         self.btn_borrow = QPushButton("Borrow")
@@ -114,6 +301,11 @@ class MainWindow(QWidget):
         self.image.setStyleSheet("border: 1px solid #ccc; background:#f5f5f5;")
         right_layout.addWidget(self.image)
 
+        # Scaled covers, decoded in the background and cached
+        self.thumbnails = ThumbnailCache(self.image.size(), parent=self)
+        self.thumbnails.ready.connect(self.cover_ready)
+        self.cover_key = None
+
         right_layout.addStretch()
 
         # ---------------- SPLITTER ----------------
@@ -130,52 +322,293 @@ class MainWindow(QWidget):
 
         main_layout.addWidget(splitter)
 
-        self.load_media()
+        self.open_replica()
+
+        self.sync_timer = QTimer(self)
+        self.sync_timer.timeout.connect(self.sync_changes)
+        self.sync_timer.start(SYNC_INTERVAL_MS)
 
     # -----------------------------------------------------
     # DATA LOADING
     # -----------------------------------------------------
+    def open_replica(self):
+        """Show the catalog of the last session at once, then catch up with the backend."""
+        data, version, lineage, synced_at = self.replica.load()
+        if version is None:
+            self.load_media()
+            return
+
+        self.current_data, self.version, self.lineage = data, version, lineage
+        self.synced_at = synced_at
+        self.model.set_items(self.current_data)
+        self.sync_changes()
+
     def load_media(self):
+        # Replaces a running load, and a pending sync must not patch
+        # the new list with old changes
+        self.api.cancel("sync")
+        self.set_loading(True)
+        self.api.submit(
+            fetch_catalog, self.replica,
+            on_done=self.media_loaded, on_error=self.load_failed, tag="list",
+        )
+
+    def media_loaded(self, result):
+        self.current_data, self.version, self.lineage = result
+        self.synced_at = time.time()
+        self.set_loading(False)
+        self.set_offline(False)
+        self.model.set_items(self.current_data)
+        self.reconcile(self.replica.conflicts(self.current_data, complete=True))
+
+    def load_failed(self, error):
+        self.set_loading(False)
+        if is_offline(error):
+            # The next sync tick tries again
+            self.set_offline(True)
+        else:
+            QMessageBox.critical(self, "Error", str(error))
+
+    def set_loading(self, loading):
+        self.status_label.setText("Loading..." if loading else "")
+        self.list_view.setEnabled(not loading)
+
+    def sync_changes(self, restart=False):
+        """
+        Fetch only what changed since the last load and patch those rows.
+        Timer ticks skip a sync that is still running; restart=True
+        (after borrowing or returning) replaces it.
+        """
+        if self.api.is_running("list") or self.api.is_running("replay"):
+            return
+        if self.version is None:
+            # Nothing loaded yet (first start while offline)
+            self.load_media()
+            return
+        if self.api.is_running("sync") and not restart:
+            return
+
+        self.api.submit(
+            fetch_changes, self.version, self.lineage,
+            on_done=self.changes_fetched, on_error=self.sync_failed, tag="sync",
+        )
+
+    def sync_failed(self, error):
+        # Backend unreachable, try again on the next tick
+        self.set_offline(True)
+
+    def changes_fetched(self, feed):
+        self.set_offline(False)
+        if feed["reset"]:
+            self.load_media()
+            return
+
+        self.version = feed["version"]
+        self.lineage = feed["lineage"]
+        self.synced_at = time.time()
+        changes = feed["changes"]
+        self.replica.apply(changes, self.version, self.lineage)
+        if changes:
+            self.apply_changes(changes)
+        self.reconcile(self.replica.conflicts(
+            {change["name"]: change.get("item") for change in changes}
+        ))
+
+    def apply_changes(self, changes):
+        # Cached search results may no longer be right
+        self.search_cache.clear()
+
+        for change in changes:
+            self.show_item(change["name"], change.get("item"))
+
+    def show_item(self, name, item):
+        """Put item (None: deleted) in the list and the search results."""
+        if item is None:
+            self.current_data.pop(name, None)
+            self.model.remove_item(name)
+            self.search_model.remove_item(name)
+        else:
+            self.current_data[name] = item
+            self.model.set_item(name, item)
+            if self.search_model.item(name) is not None:
+                self.search_model.set_item(name, item)
+
+    # -----------------------------------------------------
+    # OFFLINE
+    # -----------------------------------------------------
+    def set_offline(self, offline):
+        was_offline, self.offline = self.offline, offline
+        if offline:
+            text = UNREACHABLE
+            if self.synced_at is not None:
+                synced = time.strftime("%Y-%m-%d %H:%M", time.localtime(self.synced_at))
+                text += f" Showing the catalog as of {synced}."
+            pending = self.replica.pending_count()
+            if pending:
+                text += f" {pending} change(s) will be sent when it is back."
+            self.status_label.setText(text)
+        elif was_offline:
+            self.status_label.setText("")
+
+    def queue_action(self, name, action, payload=None):
+        """Borrow/return while offline: queue it and show the result right away."""
+        item = self.current_data.get(name)
+        if item is None:
+            return
+        required, error = REQUIRED_STATUS[action]
+        if item["status"] != required:
+            QMessageBox.warning(self, "Error", error)
+            return
+
         try:
-            if self.category_box.currentText() == "All":
-                r = requests.get(f"{BACKEND_URL}/media")
-            else:
-                cat = self.category_box.currentText()
-                r = requests.get(f"{BACKEND_URL}/media/category/{cat}")
+            self.replica.queue(name, action, payload, item)
+        except ValueError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
 
-            self.current_data = r.json()
-            self.update_list(self.current_data)
-        except Exception as e:
-            QMessageBox.critical(self, "Error", str(e))
+        item = dict(item, status=NEW_STATUS[action], overdue=False)
+        self.replica.put_local(name, item)
+        self.search_cache.clear()
+        self.show_item(name, item)
+        self.set_offline(True)
+
+    def reconcile(self, conflicts):
+        """
+        After a sync: report the queued actions the server's changes
+        conflict with and send the others.
+        """
+        for action in conflicts:
+            self.replica.discard(action["id"])
+        if conflicts:
+            self.report_conflicts(
+                (action, "it was changed by someone else") for action in conflicts
+            )
 
-    def update_list(self, data):
-        self.list_widget.clear()
-        for name, item in data.items():
-            text = name
-            if item["status"] == "borrowed":
-                if self.is_overdue(item):
-                    text += " 🔴 OVERDUE"
-                else:
-                    text += " 🔒 Borrowed"
+        # A running replay cannot be cancelled, so never start a second one
+        if self.replica.pending_count() and not self.api.is_running("replay"):
+            self.api.submit(
+                replay_pending, self.replica,
+                on_done=self.replay_done, on_error=self.action_failed, tag="replay",
+            )
+
+    def replay_done(self, result):
+        sent, rejected = result
+        for action, error, item in rejected:
+            # Show the item as the server has it, not as the action left it
+            if item is not None:
+                self.replica.put_local(action["name"], item)
+            self.show_item(action["name"], item)
+        if rejected:
+            self.search_cache.clear()
+            self.report_conflicts((action, error) for action, error, _ in rejected)
+        if sent:
+            self.status_label.setText(f"{sent} offline change(s) sent")
+        self.sync_changes(restart=True)
+
+    def report_conflicts(self, conflicts):
+        lines = [
+            f"{action['action'].capitalize()} {action['name']}: {reason}"
+            for action, reason in conflicts
+        ]
+        QMessageBox.warning(
+            self, "Offline changes not applied",
+            "These changes made while offline were not applied:\n\n" + "\n".join(lines),
+        )
 
-            self.list_widget.addItem(QListWidgetItem(text))
+    def filter_category(self, category):
+        self.proxy.set_category(category)
+        self.search_proxy.set_category(category)
 
+    # -----------------------------------------------------
+    # SEARCH
+    # -----------------------------------------------------
     def search_media(self):
-        query = self.search_input.text().lower()
-        filtered = {k: v for k, v in self.current_data.items() if query in k.lower()}
-        self.update_list(filtered)
+        """Called on every keystroke: wait for a pause before searching."""
+        if self.search_input.text().strip():
+            self.search_timer.start()
+            return
+
+        self.search_timer.stop()
+        self.api.cancel("search")
+        self.status_label.setText("")
+        self.set_list_model(self.proxy)
+
+    def run_search(self):
+        query = self.search_input.text().strip().lower()
+        if not query:
+            return
+        self.set_list_model(self.search_proxy)
+
+        cached = self.search_cache.get(query)
+        if cached is not None:
+            self.api.cancel("search")
+            results, complete = cached
+            self.search_model.set_items(results)
+            self.search_done(results, complete)
+            return
+
+        # Replaces the request of the query typed before
+        self.search_model.set_items({})
+        self.status_label.setText("Searching...")
+        self.api.submit(
+            stream_search, query,
+            on_progress=self.search_model.add_items,
+            on_done=lambda results: self.search_loaded(query, results),
+            on_error=self.search_failed,
+            tag="search",
+        )
+
+    def search_loaded(self, query, results):
+        complete = len(results) < SEARCH_LIMIT
+        self.search_cache.put(query, results, complete)
+        self.search_done(results, complete)
+
+    def search_done(self, results, complete):
+        if complete:
+            self.status_label.setText(f"{len(results)} matches")
+        else:
+            self.status_label.setText(f"First {len(results)} matches, keep typing to narrow down")
+
+    def search_failed(self, error):
+        self.status_label.setText(f"Search failed: {error}")
+
+    def set_list_model(self, model):
+        if self.list_view.model() is model:
+            return
+        self.list_view.setModel(model)
+        self.list_view.selectionModel().currentChanged.connect(self.prefetch_covers)
+
+    def selected_name(self):
+        index = self.list_view.currentIndex()
+        if not index.isValid():
+            return None
+        return index.data(NameRole)
 
     # -----------------------------------------------------
     # DETAILS
     # -----------------------------------------------------
-    def show_details(self, item):
-        name = item.text().replace(" 🔒 Borrowed", "").replace(" 🔴 OVERDUE", "")
-        media = self.current_data.get(name)
-        if not media:
+    def show_details(self, index):
+        name = index.data(NameRole)
+        if name not in self.current_data:
+            return
+
+        self.api.submit(
+            fetch_item, name,
+            on_done=self.details_loaded, on_error=self.details_failed, tag="details",
+        )
+
+    def details_failed(self, error):
+        if is_offline(error):
+            self.details.setText("Details are not available offline")
+        else:
+            QMessageBox.critical(self, "Error", str(error))
+
+    def details_loaded(self, media):
+        if media is None:
             return
 
         status = media["status"].upper()
-        if status == "BORROWED" and self.is_overdue(media):
+        if status == "BORROWED" and is_overdue(media):
             status = "OVERDUE"
 
         text = (
@@ -196,53 +629,103 @@ class MainWindow(QWidget):
         self.load_image(media.get("image"))
 
     def load_image(self, filename):
+        self.cover_key = None
         self.image.clear()
         if not filename:
             self.image.setText("No Image")
             return
 
         path = os.path.join(IMAGE_DIR, filename)
-        if os.path.exists(path):
-            pix = QPixmap(path).scaled(
-                self.image.width(),
-                self.image.height(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            self.image.setPixmap(pix)
-        else:
+        key = self.thumbnails.key(path)
+        if key is None:
             self.image.setText("Image not found")
+            return
+
+        pixmap = self.thumbnails.get(path, key)
+        if pixmap is None:
+            # cover_ready() shows it once it is decoded
+            self.cover_key = key
+            self.image.setText("Loading...")
+        else:
+            self.image.setPixmap(pixmap)
+
+    def cover_ready(self, key, pixmap):
+        if key == self.cover_key:
+            self.cover_key = None
+            self.image.setPixmap(pixmap)
+
+    def prefetch_covers(self, current, previous=None):
+        """Decode the covers next to the current row before they are clicked."""
+        if not current.isValid():
+            return
+        model = self.list_view.model()
+        rows = range(
+            max(0, current.row() - PREFETCH_ROWS),
+            min(model.rowCount(), current.row() + PREFETCH_ROWS + 1),
+        )
+
+        paths = []
+        for row in rows:
+            item = model.index(row, 0).data(ItemRole)
+            if item and item.get("image"):
+                paths.append(os.path.join(IMAGE_DIR, item["image"]))
+        self.thumbnails.prefetch(paths)
+
+    def closeEvent(self, event):
+        self.thumbnails.shutdown()
+        super().closeEvent(event)
 
     # -----------------------------------------------------
     # ACTIONS
     # -----------------------------------------------------
     def borrow_media(self):
-        item = self.list_widget.currentItem()
-        if not item:
+        name = self.selected_name()
+        if not name:
             return
 
-        name = item.text().split(" 🔒")[0].split(" 🔴")[0]
         dialog = BorrowDialog(name)
         if dialog.exec_():
             borrower, days = dialog.get_data()
             try:
                 days = int(days)
-                requests.post(
-                    f"{BACKEND_URL}/media/{name}/borrow",
-                    json={"borrowed_by": borrower, "days": days}
-                )
-                self.load_media()
-            except:
+            except ValueError:
                 QMessageBox.warning(self, "Error", "Invalid borrow data")
+                return
+
+            self.send_action(name, "borrow", {"borrowed_by": borrower, "days": days})
 
     def return_media(self):
-        item = self.list_widget.currentItem()
-        if not item:
+        name = self.selected_name()
+        if not name:
+            return
+
+        self.send_action(name, "return")
+
+    def send_action(self, name, action, payload=None):
+        """POST a borrow/return, or queue it while the backend is unreachable."""
+        if self.offline:
+            self.queue_action(name, action, payload)
             return
 
-        name = item.text().split(" 🔒")[0].split(" 🔴")[0]
-        requests.post(f"{BACKEND_URL}/media/{name}/return")
-        self.load_media()
+        def failed(error):
+            if is_offline(error):
+                self.queue_action(name, action, payload)
+            else:
+                self.action_failed(error)
+
+        self.api.submit(
+            post_json, f"/media/{name}/{action}", payload,
+            on_done=self.action_done, on_error=failed,
+        )
+
+    def action_done(self, result):
+        status, body = result
+        if status != 200:
+            QMessageBox.warning(self, "Error", body.get("error", "Request failed"))
+        self.sync_changes(restart=True)
+
+    def action_failed(self, error):
+        QMessageBox.warning(self, "Error", str(error))
 
     # -----------------------------------------------------
     # DARK MODE
@@ -263,7 +746,7 @@ class MainWindow(QWidget):
                 background-color: #1e1e1e;
                 color: #f0f0f0;
             }
-            QLineEdit, QListWidget, QComboBox {
+            QLineEdit, QListView, QComboBox {
                 background-color: #2b2b2b;
                 border: 1px solid #444;
                 color: #ffffff;
@@ -278,14 +761,6 @@ class MainWindow(QWidget):
             }
         """)
 
-    # -----------------------------------------------------
-    def is_overdue(self, media):
-        if not media.get("due_date"):
-            return False
-        return datetime.now().date() > datetime.strptime(
-            media["due_date"], "%Y-%m-%d"
-        ).date()
-
 
 # ---------------------------------------------------------
 def main():
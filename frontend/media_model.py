@@ -0,0 +1,150 @@
+"""
+Qt model for the media list.
+
+MediaListModel holds the loaded items (name -> list fields) in name
+order and builds a row's text only when the view asks for it, so a
+QListView with uniform item sizes only ever touches the rows on
+screen. MediaFilterProxy narrows it down to one category without
+recreating anything: switching category just re-runs the filter.
+(Search runs on the backend and fills a model of its own.)
+
+Views and slots get at the item behind a row through the roles below
+instead of parsing the displayed text.
+"""
+from bisect import bisect_left
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QSortFilterProxyModel, Qt
+
+
+NameRole = Qt.UserRole + 1
+ItemRole = Qt.UserRole + 2
+StatusRole = Qt.UserRole + 3
+CategoryRole = Qt.UserRole + 4
+
+
+def is_overdue(item):
+    """The backend flags borrowed items past their due date."""
+    return bool(item.get("overdue"))
+
+
+def row_text(name, item):
+    text = name
+    if item.get("status") == "borrowed":
+        if is_overdue(item):
+            text += " 🔴 OVERDUE"
+        else:
+            text += " 🔒 Borrowed"
+    return text
+
+
+# ---------------------------------------------------------
+# LIST MODEL
+# ---------------------------------------------------------
+class MediaListModel(QAbstractListModel):
+    """Items of the catalog, one row per name, sorted by name."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._names = []
+        self._items = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._names)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        name = self._names[index.row()]
+        item = self._items[name]
+
+        if role == Qt.DisplayRole:
+            return row_text(name, item)
+        if role == NameRole:
+            return name
+        if role == ItemRole:
+            return item
+        if role == StatusRole:
+            return item.get("status")
+        if role == CategoryRole:
+            return item.get("category")
+        return None
+
+    def roleNames(self):
+        names = super().roleNames()
+        names.update({
+            NameRole: b"name",
+            ItemRole: b"item",
+            StatusRole: b"status",
+            CategoryRole: b"category",
+        })
+        return names
+
+    # -----------------------------------------------------
+    # UPDATES
+    # -----------------------------------------------------
+    def set_items(self, data):
+        """Replace all rows."""
+        self.beginResetModel()
+        self._items = dict(data)
+        self._names = sorted(self._items)
+        self.endResetModel()
+
+    def set_item(self, name, item):
+        """Update one row, inserting it in name order if it is new."""
+        if name in self._items:
+            self._items[name] = item
+            index = self.index(bisect_left(self._names, name))
+            self.dataChanged.emit(index, index)
+            return
+
+        row = bisect_left(self._names, name)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._names.insert(row, name)
+        self._items[name] = item
+        self.endInsertRows()
+
+    def add_items(self, items):
+        """Insert or update several rows, e.g. a batch of streamed results."""
+        for name, item in items.items():
+            self.set_item(name, item)
+
+    def remove_item(self, name):
+        if name not in self._items:
+            return
+        row = bisect_left(self._names, name)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._names[row]
+        del self._items[name]
+        self.endRemoveRows()
+
+    def item(self, name):
+        return self._items.get(name)
+
+    def name_at(self, row):
+        return self._names[row]
+
+
+# ---------------------------------------------------------
+# CATEGORY FILTER
+# ---------------------------------------------------------
+class MediaFilterProxy(QSortFilterProxyModel):
+    """Shows the rows of one category."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._category = None
+
+    def set_category(self, category):
+        """Only show this category (None or "All" for everything)."""
+        category = None if category == "All" else category
+        if category != self._category:
+            self._category = category
+            self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self._category is None:
+            return True
+        model = self.sourceModel()
+        return model.item(model.name_at(source_row)).get("category") == self._category
@@ -0,0 +1,169 @@
+"""
+Background networking for the PyQt frontend.
+
+Requests run on a QThreadPool instead of the GUI thread and report back
+through Qt signals, so a slow or dead backend never freezes the window.
+All of them share one requests.Session, i.e. a pool of keep-alive
+connections, with a timeout on every request and retries for failed
+connections (and for GETs answered with a gateway error).
+
+A job can be given a tag: submitting a new job with the same tag
+cancels the previous one. A running HTTP call cannot be interrupted,
+but a cancelled job's result is never delivered, and jobs that make
+several calls (e.g. paging) stop at the next task.check(). Long jobs
+can hand partial results to the GUI with task.report().
+"""
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+# (connect, read) timeout in seconds for every request
+TIMEOUT = (3.05, 10)
+
+# Retries for failed connections, and for GETs answered with these
+# statuses (after the Retry-After the backend sends with 429 and 503)
+RETRIES = 3
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Worker threads, and keep-alive connections kept open to the backend
+POOL_SIZE = 4
+
+
+class Cancelled(Exception):
+    """Raised by task.check() once a job's result is no longer wanted."""
+
+
+class TimeoutSession(requests.Session):
+    """Session that applies TIMEOUT unless a request sets its own."""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+def is_offline(error):
+    """True if a job failed because the backend could not be reached."""
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def make_session():
+    session = TimeoutSession()
+    retry = Retry(
+        total=RETRIES,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=("GET", "HEAD"),
+        backoff_factor=0.3,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# ---------------------------------------------------------
+# JOBS
+# ---------------------------------------------------------
+class _Signals(QObject):
+    # (result, error): exactly one of them is set
+    done = pyqtSignal(object, object)
+    progress = pyqtSignal(object)
+
+
+class Task(QRunnable):
+    """One job on the pool: calls fn(task, session, *args)."""
+
+    def __init__(self, fn, session, args, tag=None):
+        super().__init__()
+        self.fn = fn
+        self.session = session
+        self.args = args
+        self.tag = tag
+        self.cancelled = False
+        self.signals = _Signals()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def check(self):
+        """Stop the job here if it has been cancelled."""
+        if self.cancelled:
+            raise Cancelled()
+
+    def report(self, value):
+        """Send a partial result to the GUI thread (stops if cancelled)."""
+        self.check()
+        self.signals.progress.emit(value)
+
+    def run(self):
+        try:
+            self.check()
+            result = self.fn(self, self.session, *self.args)
+        except Exception as e:
+            self.signals.done.emit(None, e)
+        else:
+            self.signals.done.emit(result, None)
+
+
+class ApiClient(QObject):
+    """Runs network jobs off the GUI thread and delivers their results on it."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.session = make_session()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(POOL_SIZE)
+        self._latest = {}     # tag -> newest task with that tag
+        self._running = set() # keeps tasks alive until they report back
+
+    def submit(self, fn, *args, on_done=None, on_error=None, on_progress=None, tag=None):
+        """
+        Run fn(task, session, *args) on the pool. on_done(result) or
+        on_error(exception) is then called on the GUI thread, unless
+        the task was cancelled in the meantime; so is on_progress for
+        every task.report(value).
+        """
+        if tag is not None:
+            self.cancel(tag)
+
+        task = Task(fn, self.session, args, tag)
+        task.setAutoDelete(False)
+        task.signals.done.connect(
+            lambda result, error: self._deliver(task, result, error, on_done, on_error)
+        )
+        if on_progress is not None:
+            task.signals.progress.connect(
+                lambda value: None if task.cancelled else on_progress(value)
+            )
+
+        self._running.add(task)
+        if tag is not None:
+            self._latest[tag] = task
+        self.pool.start(task)
+        return task
+
+    def cancel(self, tag):
+        task = self._latest.pop(tag, None)
+        if task is not None:
+            task.cancel()
+
+    def is_running(self, tag):
+        return tag in self._latest
+
+    def _deliver(self, task, result, error, on_done, on_error):
+        self._running.discard(task)
+        if task.tag is not None and self._latest.get(task.tag) is task:
+            del self._latest[task.tag]
+
+        # Checked here, on the GUI thread, so a cancel() that raced
+        # with the end of the job still wins
+        if task.cancelled:
+            return
+        if error is None:
+            if on_done is not None:
+                on_done(result)
+        elif on_error is not None:
+            on_error(error)
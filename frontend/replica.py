@@ -0,0 +1,222 @@
+"""
+Local replica of the catalog, so the client works without the backend.
+
+The last synced list (the LIST_FIELDS projection), its catalog version
+and lineage are kept in a small SQLite database in the user's cache
+directory. The window opens from it at once and then catches up
+through GET /media/changes like any other sync; the backend answers
+"reset" if the replica is too old or comes from another catalog.
+
+Borrows and returns made while the backend is unreachable are queued
+here too (at most one per item), together with the item as it was when
+the action was taken. Once the backend is back they are replayed in
+order. An action is a conflict, and reported instead of replayed, if
+the server changed the item in the meantime or rejects the action.
+
+Every call opens its own connection, so the replica can be used from
+the GUI thread and from network jobs alike.
+"""
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from PyQt5.QtCore import QStandardPaths
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (name TEXT PRIMARY KEY, item TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS pending (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    action TEXT NOT NULL,
+    payload TEXT,
+    before TEXT NOT NULL,
+    queued_at REAL NOT NULL
+);
+"""
+
+# Fields whose change does not make a queued action a conflict: the
+# backend's overdue scheduler flips it without anyone touching the item
+IGNORED_FIELDS = {"overdue"}
+
+
+def default_path():
+    base = QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation)
+    return os.path.join(base or os.path.expanduser("~/.cache"), "media-library", "replica.sqlite3")
+
+
+def changed_on_server(before, item, reported=False):
+    """
+    True if item, as the server has it now, is not the item an action
+    was queued on. reported=True if the server said it changed.
+    """
+    if item is None:
+        return True
+    changed = {
+        key for key in set(before) | set(item)
+        if before.get(key) != item.get(key)
+    }
+    if reported and not changed:
+        # Changed and changed back, e.g. returned and borrowed again
+        # by someone else
+        return True
+    return bool(changed - IGNORED_FIELDS)
+
+
+class Replica:
+    """The local copy of one backend's catalog, plus the offline queue."""
+
+    def __init__(self, backend_url, path=None):
+        self.backend_url = backend_url
+        self.path = path or default_path()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+            # A replica of another backend is of no use
+            if self._meta(db, "backend") not in (None, backend_url):
+                db.execute("DELETE FROM items")
+                db.execute("DELETE FROM meta")
+                db.execute("DELETE FROM pending")
+            self._set_meta(db, backend=backend_url)
+
+    @contextmanager
+    def _connect(self):
+        """A connection for one call: committed (or rolled back) and closed after it."""
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            # Losing the last change in a power cut only costs a resync
+            db.execute("PRAGMA synchronous=NORMAL")
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def _meta(db, key):
+        row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _set_meta(db, **values):
+        db.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(key, None if value is None else str(value)) for key, value in values.items()],
+        )
+
+    # -----------------------------------------------------
+    # CATALOG
+    # -----------------------------------------------------
+    def load(self):
+        """Returns (data, version, lineage, synced_at); version is None if empty."""
+        with self._connect() as db:
+            data = {name: json.loads(item) for name, item in db.execute("SELECT name, item FROM items")}
+            version = self._meta(db, "version")
+            synced_at = self._meta(db, "synced_at")
+            return (
+                data,
+                int(version) if version is not None else None,
+                self._meta(db, "lineage"),
+                float(synced_at) if synced_at is not None else None,
+            )
+
+    def replace(self, data, version, lineage):
+        """Store a freshly loaded catalog."""
+        with self._connect() as db:
+            db.execute("DELETE FROM items")
+            db.executemany(
+                "INSERT INTO items (name, item) VALUES (?, ?)",
+                [(name, json.dumps(item)) for name, item in data.items()],
+            )
+            self._set_meta(db, version=version, lineage=lineage, synced_at=time.time())
+
+    def apply(self, changes, version, lineage):
+        """Store the changes of a GET /media/changes response."""
+        with self._connect() as db:
+            for change in changes:
+                item = change.get("item")
+                if item is None:
+                    db.execute("DELETE FROM items WHERE name = ?", (change["name"],))
+                else:
+                    db.execute(
+                        "INSERT OR REPLACE INTO items (name, item) VALUES (?, ?)",
+                        (change["name"], json.dumps(item)),
+                    )
+            self._set_meta(db, version=version, lineage=lineage, synced_at=time.time())
+
+    def put_local(self, name, item):
+        """Store an item changed locally (offline) without touching the version."""
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO items (name, item) VALUES (?, ?)",
+                (name, json.dumps(item)),
+            )
+
+    # -----------------------------------------------------
+    # OFFLINE QUEUE
+    # -----------------------------------------------------
+    def queue(self, name, action, payload, before):
+        """
+        Queue a borrow/return made offline on `before`, the item as last
+        synced. Returning an item whose borrow is still queued cancels
+        the borrow instead. Returns False if that happened.
+        """
+        with self._connect() as db:
+            row = db.execute("SELECT action FROM pending WHERE name = ?", (name,)).fetchone()
+            if row is not None:
+                if (row[0], action) != ("borrow", "return"):
+                    raise ValueError(f"{name} already has a change waiting to be sent")
+                db.execute("DELETE FROM pending WHERE name = ?", (name,))
+                return False
+            db.execute(
+                "INSERT INTO pending (name, action, payload, before, queued_at) VALUES (?, ?, ?, ?, ?)",
+                (name, action, json.dumps(payload), json.dumps(before), time.time()),
+            )
+            return True
+
+    def pending(self):
+        """Queued actions, oldest first: {"id", "name", "action", "payload", "before", "queued_at"}."""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, name, action, payload, before, queued_at FROM pending ORDER BY id"
+            ).fetchall()
+        return [
+            {
+                "id": id_,
+                "name": name,
+                "action": action,
+                "payload": json.loads(payload),
+                "before": json.loads(before),
+                "queued_at": queued_at,
+            }
+            for id_, name, action, payload, before, queued_at in rows
+        ]
+
+    def pending_count(self):
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def discard(self, action_id):
+        """Forget a queued action once it was replayed or reported."""
+        with self._connect() as db:
+            db.execute("DELETE FROM pending WHERE id = ?", (action_id,))
+
+    def conflicts(self, items, complete=False):
+        """
+        Queued actions whose item the server changed meanwhile. `items`
+        is {name: item, or None if deleted} as the server has them:
+        the whole catalog (complete=True), or the changed items of a
+        change feed response.
+        """
+        found = []
+        for action in self.pending():
+            name = action["name"]
+            if complete:
+                if changed_on_server(action["before"], items.get(name)):
+                    found.append(action)
+            elif name in items and changed_on_server(action["before"], items[name], reported=True):
+                found.append(action)
+        return found
@@ -0,0 +1,64 @@
+"""
+Client-side cache of recent search results.
+
+Keeps the results of the last few queries in an LRU. A query that
+extends a cached one (contains it, e.g. "inter" after "int") can only
+match a subset of its results, so as long as the cached result was
+complete it is refined locally instead of asking the backend again.
+"""
+from collections import OrderedDict
+
+
+# Queries remembered
+CACHE_SIZE = 32
+
+
+def matches(query, name, item):
+    """Same rule as the backend: name or author contains query, case-insensitive."""
+    return (
+        query in (item.get("name") or name).lower()
+        or query in (item.get("author") or "").lower()
+    )
+
+
+class SearchCache:
+    """LRU of query -> ({name: item}, complete)."""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+
+    def put(self, query, results, complete):
+        """Remember results; complete=False if the backend cut them at a limit."""
+        self._entries[query] = (results, complete)
+        self._entries.move_to_end(query)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def get(self, query):
+        """
+        Cached (results, complete) for query, refined from the longest
+        complete cached query it contains if needed, or None.
+        """
+        entry = self._entries.get(query)
+        if entry is not None:
+            self._entries.move_to_end(query)
+            return entry
+
+        base = None
+        for cached, (_, complete) in self._entries.items():
+            if complete and cached in query and (base is None or len(cached) > len(base)):
+                base = cached
+        if base is None:
+            return None
+
+        results = {
+            name: item
+            for name, item in self._entries[base][0].items()
+            if matches(query, name, item)
+        }
+        self.put(query, results, True)
+        return results, True
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,170 @@
+"""
+Cover thumbnails for the details panel.
+
+Decoding a full-size JPEG and smooth-scaling it on the GUI thread made
+every click slow, so covers go through a small pipeline instead:
+
+    1. memory: QPixmapCache, limited to MEMORY_BUDGET_KB
+    2. disk: pre-scaled JPEGs in the user's cache directory, named
+       after the source path, its mtime and the thumbnail size, so an
+       edited cover never hits a stale thumbnail
+    3. decode: QImageReader with setScaledSize() on a worker thread;
+       JPEG decoders scale while decoding, which is much cheaper than
+       decoding at full size and scaling afterwards
+
+Only step 1 runs on the GUI thread. Workers produce QImages; they are
+turned into QPixmaps (which must live on the GUI thread) when they
+arrive. prefetch() warms the caches for covers likely to be shown next.
+Call shutdown() before the window goes away, so no decode is left
+running on a deleted cache.
+"""
+import hashlib
+import os
+
+from PyQt5.QtCore import (
+    QObject, QRunnable, QSize, QStandardPaths, QThreadPool, Qt, pyqtSignal
+)
+from PyQt5.QtGui import QImageReader, QPixmap, QPixmapCache
+
+
+# Memory for decoded thumbnails (shared QPixmapCache)
+MEMORY_BUDGET_KB = 32 * 1024
+
+# Threads decoding covers in the background
+DECODE_THREADS = 2
+
+DISK_QUALITY = 90
+
+
+def default_cache_dir():
+    base = QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation)
+    return os.path.join(base or os.path.expanduser("~/.cache"), "media-library", "thumbnails")
+
+
+class _Signals(QObject):
+    # (key, QImage or None if the file could not be decoded)
+    decoded = pyqtSignal(str, object)
+
+
+class _DecodeJob(QRunnable):
+    """Load one thumbnail from the disk cache, or decode and store it."""
+
+    def __init__(self, key, path, size, disk_path, signals):
+        super().__init__()
+        self.key = key
+        self.path = path
+        self.size = size
+        self.disk_path = disk_path
+        # Owned by the cache, so it outlives the job
+        self.signals = signals
+
+    def run(self):
+        image = None
+        if self.disk_path and os.path.exists(self.disk_path):
+            image = QImageReader(self.disk_path).read()
+
+        if image is None or image.isNull():
+            reader = QImageReader(self.path)
+            reader.setAutoTransform(True)
+            source_size = reader.size()
+            if source_size.isValid():
+                reader.setScaledSize(source_size.scaled(self.size, Qt.KeepAspectRatio))
+            image = reader.read()
+            if image.isNull():
+                image = None
+            elif self.disk_path:
+                self.store(image)
+
+        try:
+            self.signals.decoded.emit(self.key, image)
+        except RuntimeError:
+            pass  # the cache was deleted while this decode ran
+
+    def store(self, image):
+        # Write to a temp file first, so a reader never sees half a JPEG
+        tmp_path = f"{self.disk_path}.{os.getpid()}.{id(self)}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.disk_path), exist_ok=True)
+            if image.save(tmp_path, "JPG", DISK_QUALITY):
+                os.replace(tmp_path, self.disk_path)
+        except OSError:
+            pass  # the disk cache is only an optimization
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+class ThumbnailCache(QObject):
+    """Thumbnails of one size, served from memory, disk or a background decode."""
+
+    # (key, QPixmap) once a requested thumbnail is ready, on the GUI thread
+    ready = pyqtSignal(str, QPixmap)
+
+    def __init__(self, size, cache_dir=None, parent=None):
+        super().__init__(parent)
+        self.size = QSize(size)
+        self.cache_dir = default_cache_dir() if cache_dir is None else cache_dir
+        QPixmapCache.setCacheLimit(MEMORY_BUDGET_KB)
+
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(DECODE_THREADS)
+        self._signals = _Signals(self)
+        self._signals.decoded.connect(self._decoded)
+        self._pending = {}  # key -> job, until it reports back
+
+    def key(self, path):
+        """Cache key of the thumbnail of path, or None if the file is missing."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        source = f"{os.path.abspath(path)}|{mtime}|{self.size.width()}x{self.size.height()}"
+        return hashlib.sha1(source.encode()).hexdigest()
+
+    def get(self, path, key=None):
+        """
+        The thumbnail of path if it is in memory. Otherwise None, and
+        `ready` is emitted once it has been loaded in the background.
+        """
+        key = key or self.key(path)
+        if key is None:
+            return None
+
+        pixmap = QPixmapCache.find(key)
+        if pixmap is not None:
+            return pixmap
+
+        self._load(key, path)
+        return None
+
+    def prefetch(self, paths):
+        """Warm the caches for covers that will probably be shown soon."""
+        for path in paths:
+            key = self.key(path)
+            if key is not None and QPixmapCache.find(key) is None:
+                self._load(key, path)
+
+    def _load(self, key, path):
+        if key in self._pending:
+            return
+
+        disk_path = os.path.join(self.cache_dir, key[:2], key + ".jpg") if self.cache_dir else None
+        job = _DecodeJob(key, path, self.size, disk_path, self._signals)
+        job.setAutoDelete(False)
+        self._pending[key] = job
+        self.pool.start(job)
+
+    def shutdown(self):
+        """Drop the queued decodes and wait for the running ones to finish."""
+        self.pool.clear()
+        self.pool.waitForDone()
+        self._pending.clear()
+
+    def _decoded(self, key, image):
+        self._pending.pop(key, None)
+        if image is None:
+            return
+
+        pixmap = QPixmap.fromImage(image)
+        QPixmapCache.insert(key, pixmap)
+        self.ready.emit(key, pixmap)
@@ -0,0 +1,47 @@
+"""
+Temporary files for the in-process tests.
+
+Each helper is a context manager that removes what it created when the
+block ends, so the tests never write next to the real catalog and leave
+nothing behind in the temp directory.
+"""
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+
+@contextmanager
+def temp_dir():
+    """An empty temporary directory."""
+    # Open stores may still hold their files (Windows cannot delete them)
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        yield directory
+
+
+@contextmanager
+def catalog_copy(backend="json", filename="database.json", changes=None):
+    """
+    Path of a copy of backend/database.json named `filename`, with
+    `changes` ({name: {field: value}}) applied to its items, migrated
+    to an SQLite database.sqlite3 if backend="sqlite".
+    """
+    with temp_dir() as directory:
+        path = os.path.join(directory, filename)
+        shutil.copy(os.path.join(BACKEND_DIR, "database.json"), path)
+        if changes:
+            with open(path) as f:
+                data = json.load(f)
+            for name, fields in changes.items():
+                data[name].update(fields)
+            with open(path, "w") as f:
+                json.dump(data, f, indent=4)
+        if backend == "sqlite":
+            from migrate import migrate
+            sqlite_path = os.path.join(directory, "database.sqlite3")
+            migrate(path, sqlite_path)
+            path = sqlite_path
+        yield path
@@ -3,6 +3,7 @@ Basic tests for the Online Library backend API
 """
 import requests
 import json
+import time
 
 BACKEND_URL = "http://127.0.0.1:5000"
 
@@ -15,6 +16,40 @@ def test_get_all_media():
     assert isinstance(data, dict), "Response should be a dictionary"
     print("✓ GET all media works")
 
+def test_conditional_get():
+    """Test: GET /media with If-None-Match - unchanged catalog answers 304"""
+    print("Testing: Conditional GET (ETag)...")
+    response = requests.get(f"{BACKEND_URL}/media")
+    etag = response.headers.get("ETag")
+    assert etag, "Response should carry an ETag"
+
+    response = requests.get(f"{BACKEND_URL}/media", headers={"If-None-Match": etag})
+    assert response.status_code == 304, f"Expected 304, got {response.status_code}"
+    assert response.content == b"", "304 should have no body"
+    print("✓ Conditional GET works")
+
+def test_get_cover():
+    """Test: GET /media/<name>/cover - ETag, 304 and Range support"""
+    print("Testing: GET cover image...")
+    url = f"{BACKEND_URL}/media/Atomic Habits/cover"
+    response = requests.get(url)
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    assert response.headers["Content-Type"].startswith("image/"), "Cover should be an image"
+    assert "max-age" in response.headers["Cache-Control"], "Cover should be cacheable"
+
+    response = requests.get(url, headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304, f"Expected 304, got {response.status_code}"
+
+    response = requests.get(url, headers={"Range": "bytes=0-99"})
+    assert response.status_code == 206, f"Expected 206, got {response.status_code}"
+    assert len(response.content) == 100, "Range should return exactly 100 bytes"
+
+    response = requests.get(url, params={"size": "100x140"})
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    response = requests.get(url, params={"size": "big"})
+    assert response.status_code == 400, f"Expected 400, got {response.status_code}"
+    print("✓ GET cover image works")
+
 def test_add_media():
     """Test: POST /media - should create a new media item"""
     print("Testing: POST add media...")
@@ -30,6 +65,31 @@ def test_add_media():
     assert data["status"] == "created", "Status should be 'created'"
     print("✓ POST add media works")
 
+def test_change_feed():
+    """Test: GET /media/changes?since=<version> - should return only the delta"""
+    print("Testing: Change feed...")
+    response = requests.get(f"{BACKEND_URL}/media")
+    since = response.headers["X-Catalog-Version"]
+    lineage = response.headers["X-Catalog-Lineage"]
+
+    new_media = {"name": "Feed Test", "author": "Feed Author", "publication_date": "2025", "category": "Book"}
+    requests.post(f"{BACKEND_URL}/media", json=new_media)
+    response = requests.get(f"{BACKEND_URL}/media/changes", params={"since": since, "lineage": lineage})
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    feed = response.json()
+    assert not feed["reset"], "Feed should not ask for a full reload"
+    assert [c["name"] for c in feed["changes"]] == ["Feed Test"], "Only the new item should be listed"
+    assert feed["changes"][0]["op"] == "put", "New item should be a put"
+
+    requests.delete(f"{BACKEND_URL}/media/Feed Test")
+    response = requests.get(f"{BACKEND_URL}/media/changes", params={"since": feed["version"], "lineage": lineage})
+    assert response.json()["changes"] == [{"op": "delete", "name": "Feed Test"}], "Delete should be listed"
+
+    # Listing options that do not apply to the feed are ignored
+    response = requests.get(f"{BACKEND_URL}/media/changes", params={"since": 0, "limit": "abc", "cursor": "!"})
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    print("✓ Change feed works")
+
 def test_get_specific_media():
     """Test: GET /media/<name> - should return specific media item"""
     print("Testing: GET specific media...")
@@ -48,6 +108,30 @@ def test_search_media():
     assert isinstance(data, dict), "Response should be a dictionary"
     print("✓ Search media works")
 
+def test_search_ndjson():
+    """Test: GET /media/search/<query>?format=ndjson - one matching item per line"""
+    print("Testing: Search media (JSON Lines)...")
+    expected = requests.get(f"{BACKEND_URL}/media/search/the").json()
+    response = requests.get(f"{BACKEND_URL}/media/search/the", params={"format": "ndjson"})
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    names = [json.loads(line)["name"] for line in response.text.splitlines()]
+    assert sorted(names) == sorted(expected), "Lines should hold the same items as the JSON response"
+    print("✓ Search media (JSON Lines) works")
+
+def test_search_ranked():
+    """Test: GET /media/search/<query>?rank=1&limit=N - best match first, at most N"""
+    print("Testing: Search media (ranked, limited)...")
+    response = requests.get(f"{BACKEND_URL}/media/search/test book", params={"rank": 1, "limit": 1})
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    data = response.json()
+    assert list(data) == ["Test Book"], f"Expected only 'Test Book', got {list(data)}"
+    response = requests.get(f"{BACKEND_URL}/media/search/test book", params={"limit": 0})
+    assert response.status_code == 400, f"limit=0 should be rejected, got {response.status_code}"
+
+    response = requests.get(f"{BACKEND_URL}/media/search/test author")
+    assert "Test Book" in response.json(), "Search should match the author too"
+    print("✓ Ranked search works")
+
 def test_borrow_media():
     """Test: POST /media/<name>/borrow - should mark media as borrowed"""
     print("Testing: Borrow media...")
@@ -61,6 +145,42 @@ def test_borrow_media():
     assert data["status"] == "borrowed", "Status should be 'borrowed'"
     print("✓ Borrow media works")
 
+def test_get_by_status():
+    """Test: GET /media/status/<status> - should list the borrowed test item"""
+    print("Testing: GET by status...")
+    response = requests.get(f"{BACKEND_URL}/media/status/borrowed")
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    data = response.json()
+    assert "Test Book" in data, "Borrowed item should be listed"
+    assert all(item["status"] == "borrowed" for item in data.values()), "Only borrowed items expected"
+    print("✓ GET by status works")
+
+def test_get_overdue():
+    """Test: GET /media/overdue?as_of=<date> - should use the due date range"""
+    print("Testing: GET overdue media...")
+    response = requests.get(f"{BACKEND_URL}/media/overdue", params={"as_of": "2999-01-01"})
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    assert "Test Book" in response.json(), "Item due before as_of should be overdue"
+
+    response = requests.get(f"{BACKEND_URL}/media/overdue", params={"as_of": "2000-01-01"})
+    assert "Test Book" not in response.json(), "Item due after as_of should not be overdue"
+
+    # Dates without zero padding mean the same day: the first of the
+    # month before the due date, e.g. 2026-9-1, is before 2026-10-24
+    year, month = map(int, requests.get(f"{BACKEND_URL}/media/Test Book").json()["due_date"].split("-")[:2])
+    as_of = f"{year}-{month - 1}-1" if month > 1 else f"{year - 1}-12-1"
+    response = requests.get(f"{BACKEND_URL}/media/overdue", params={"as_of": as_of})
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    assert "Test Book" not in response.json(), f"as_of={as_of} is before the due date"
+
+    response = requests.get(f"{BACKEND_URL}/media/overdue", params={"as_of": "soon"})
+    assert response.status_code == 400, f"Expected 400, got {response.status_code}"
+
+    response = requests.get(f"{BACKEND_URL}/media/overdue")
+    for name, item in response.json().items():
+        assert item["overdue"] is True, f"{name} should be flagged overdue by the backend"
+    print("✓ GET overdue media works")
+
 def test_return_media():
     """Test: POST /media/<name>/return - should mark media as available"""
     print("Testing: Return media...")
@@ -70,6 +190,28 @@ def test_return_media():
     assert data["status"] == "returned", "Status should be 'returned'"
     print("✓ Return media works")
 
+def test_borrow_history():
+    """Test: GET /media/<name>/history and /stats - the borrow and return should be recorded"""
+    print("Testing: Borrowing history and stats...")
+    response = requests.get(f"{BACKEND_URL}/media/Test Book/history")
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    events = response.json()
+    assert [event["kind"] for event in events[:2]] == ["return", "borrow"], "Newest events first"
+    assert events[1]["borrower"] == "Test Student" and events[1]["days"] == 7
+
+    stats = requests.get(f"{BACKEND_URL}/stats/items/Test Book").json()
+    assert stats["name"] == "Test Book" and stats["borrows"] >= 1 and stats["returns"] >= 1
+    assert requests.get(f"{BACKEND_URL}/stats").json()["today"]["borrows"] >= 1, "Today's rollup should count it"
+    month = requests.get(f"{BACKEND_URL}/stats").json()["month"]["month"]
+    top = requests.get(f"{BACKEND_URL}/stats/items", params={"month": month, "limit": 100}).json()
+    assert "Test Book" in [row["name"] for row in top], "Should be among this month's borrowed items"
+    categories = requests.get(f"{BACKEND_URL}/stats/categories").json()
+    assert "Book" in [row["category"] for row in categories], "Loans should be rolled up per category"
+
+    assert requests.get(f"{BACKEND_URL}/stats/items?month=March").status_code == 400, "Bad month should be 400"
+    assert requests.get(f"{BACKEND_URL}/stats/shelves").status_code == 404, "Unknown stats should be 404"
+    print("✓ Borrowing history and stats work")
+
 def test_delete_media():
     """Test: DELETE /media/<name> - should delete the media item"""
     print("Testing: DELETE media...")
@@ -79,6 +221,67 @@ def test_delete_media():
     assert data["status"] == "deleted", "Status should be 'deleted'"
     print("✓ DELETE media works")
 
+def test_bulk_and_batch():
+    """Test: bulk import, batch borrow/return and export"""
+    print("Testing: Bulk import and batch borrow/return...")
+    lines = "\n".join(json.dumps({"name": f"Bulk {i}", "author": "Bulk Author", "publication_date": "2025", "category": "Book"}) for i in range(3))
+    response = requests.post(f"{BACKEND_URL}/media/bulk", data=lines, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 201, f"Expected 201, got {response.status_code}"
+    assert response.json()["applied"] == 3, "All three items should be imported"
+
+    response = requests.post(f"{BACKEND_URL}/media/bulk", data='[{"name": "Bulk x" "author": "A"}' + ', {}' * 100000 + ']')
+    assert response.status_code == 400, f"Malformed array should get 400, got {response.status_code}"
+
+    items = [{"name": f"Bulk {i}", "borrowed_by": "Batch Student", "days": 7} for i in range(3)]
+    items.append({"name": "Bulk 0", "borrowed_by": "Someone Else", "days": 7})
+    response = requests.post(f"{BACKEND_URL}/media/borrow/batch", json={"items": items})
+    assert response.status_code == 207, f"Expected 207, got {response.status_code}"
+    results = response.json()["results"]
+    assert [r.get("status") for r in results] == ["borrowed"] * 3 + [None], "Second borrow of Bulk 0 should fail"
+
+    response = requests.post(f"{BACKEND_URL}/media/return/batch?atomic=1", json=["Bulk 0", "Missing Item"])
+    assert response.status_code == 400, f"Expected 400, got {response.status_code}"
+    assert requests.get(f"{BACKEND_URL}/media/Bulk 0").json()["status"] == "borrowed", "Atomic batch should apply nothing"
+
+    response = requests.post(f"{BACKEND_URL}/media/return/batch", json={"items": ["Bulk 0", "Bulk 1", "Bulk 2"]})
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+
+    response = requests.get(f"{BACKEND_URL}/media/export")
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert response.headers["Content-Type"] == "application/x-ndjson", "Export should be JSON Lines"
+    assert "Bulk 1" in [item["name"] for item in exported], "Export should contain the imported items"
+
+    for i in range(3):
+        requests.delete(f"{BACKEND_URL}/media/Bulk {i}")
+    print("✓ Bulk import, batch borrow/return and export work")
+
+def test_background_jobs():
+    """Test: POST /media/bulk?async=1 - should queue a job reported by GET /jobs/<id>"""
+    print("Testing: Background jobs...")
+    items = [{"name": f"Job Item {i}", "author": "Job Author", "publication_date": "2025", "category": "Book"} for i in range(3)]
+    response = requests.post(f"{BACKEND_URL}/media/bulk?async=1", json=items)
+    assert response.status_code == 202, f"Expected 202, got {response.status_code}"
+    job = response.json()
+    assert response.headers["Location"] == f"/jobs/{job['id']}", "Location should point at the job"
+
+    for _ in range(100):
+        job = requests.get(f"{BACKEND_URL}/jobs/{job['id']}").json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done", f"Job should finish, is {job['status']}"
+    assert job["result"]["applied"] == 3, "The job result should be the import's response body"
+    assert job["progress"] == {"done": 3, "total": 3}, "Progress should be complete"
+    assert requests.get(f"{BACKEND_URL}/media/Job Item 2").status_code == 200, "Items should be imported"
+
+    assert requests.get(f"{BACKEND_URL}/jobs/missing").status_code == 404, "Unknown jobs should be 404"
+    assert requests.post(f"{BACKEND_URL}/jobs", json={"kind": "nope"}).status_code == 400, "Unknown kinds should be 400"
+    assert job["id"] in [j["id"] for j in requests.get(f"{BACKEND_URL}/jobs?status=done").json()], "Job should be listed"
+
+    for i in range(3):
+        requests.delete(f"{BACKEND_URL}/media/Job Item {i}")
+    print("✓ Background jobs work")
+
 def test_get_by_category():
     """Test: GET /media/category/<category> - should return media by category"""
     print("Testing: GET by category...")
@@ -88,6 +291,20 @@ def test_get_by_category():
     assert isinstance(data, dict), "Response should be a dictionary"
     print("✓ GET by category works")
 
+def test_metrics():
+    """Test: GET /metrics - should return Prometheus text with request timings"""
+    print("Testing: GET /metrics...")
+    response = requests.get(f"{BACKEND_URL}/metrics")
+    assert response.status_code == 200, f"Expected 200, got {response.status_code}"
+    assert response.headers["Content-Type"].startswith("text/plain"), "Metrics should be plain text"
+    text = response.text
+    assert "# TYPE media_request_duration_seconds histogram" in text, "Latency histogram missing"
+    assert 'endpoint="/media/<name>/borrow"' in text, "Endpoints should be labelled by route"
+    assert 'phase="persist"' in text, "Phase timings missing"
+    assert "media_store_writes_total" in text, "Write counter missing"
+    assert "media_catalog_items " in text, "Catalog size missing"
+    print("✓ GET /metrics works")
+
 def run_all_tests():
     """Run all tests"""
     print("=" * 50)
@@ -97,13 +314,24 @@ def run_all_tests():
     
     try:
         test_get_all_media()
+        test_conditional_get()
+        test_get_cover()
         test_add_media()
+        test_change_feed()
         test_get_specific_media()
         test_search_media()
+        test_search_ndjson()
+        test_search_ranked()
         test_borrow_media()
+        test_get_by_status()
+        test_get_overdue()
         test_return_media()
+        test_borrow_history()
         test_delete_media()
+        test_bulk_and_batch()
+        test_background_jobs()
         test_get_by_category()
+        test_metrics()
         
         print()
         print("=" * 50)
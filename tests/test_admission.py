@@ -0,0 +1,156 @@
+"""
+Tests for request coalescing, rate limiting and admission control
+(admission.py). Uses the classes directly with threads and a fake
+clock, and the app's limits with Flask's test client in a fresh
+process, so no server is needed.
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from admission import AdmissionGate, RateLimiter, SingleFlight  # noqa: E402
+from helpers import catalog_copy  # noqa: E402
+
+
+def test_single_flight():
+    """Concurrent calls with the same key run once and share the result"""
+    print("Testing: request coalescing...")
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "body"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("GET /media", compute)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1, f"Expected one computation, got {len(calls)}"
+    assert [result for result, _ in results] == ["body"] * 5, "Everyone should get the result"
+    assert sorted(shared for _, shared in results) == [False] + [True] * 4, "One leader, four waiters"
+    assert flight.do("GET /media", lambda: "again") == ("again", False), "Finished keys run again"
+
+    def broken():
+        raise ValueError("boom")
+    try:
+        flight.do("broken", broken)
+        assert False, "The exception should be raised"
+    except ValueError:
+        pass
+    print("✓ Request coalescing works")
+
+
+def test_rate_limiter():
+    """Each client gets `burst` requests at once and `rate` per second after that"""
+    print("Testing: rate limiter...")
+    limiter = RateLimiter(rate=2, burst=3)
+    now = 100.0
+    assert [limiter.acquire("kiosk-1", now) for _ in range(3)] == [0, 0, 0], "Burst should pass"
+    wait = limiter.acquire("kiosk-1", now)
+    assert 0.4 < wait <= 0.5, f"Fourth request should wait ~0.5 s, got {wait}"
+    assert limiter.acquire("kiosk-2", now) == 0, "Clients are limited separately"
+    assert limiter.acquire("kiosk-1", now + 0.5) == 0, "A token should be back after 1/rate"
+    assert limiter.acquire("kiosk-1", now + 0.5) > 0, "But only one"
+    print("✓ Rate limiter works")
+
+
+def test_admission_gate():
+    """Requests over the concurrency limit queue, and are shed when the queue is full"""
+    print("Testing: admission control...")
+    gate = AdmissionGate(concurrency=1, queue=1, timeout=5)
+    assert gate.enter(), "First request should be admitted"
+
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(gate.enter()))
+    waiter.start()
+    time.sleep(0.1)
+    assert gate.waiting == 1, "Second request should wait in the queue"
+    assert not gate.enter(), "Third request should be shed (queue full)"
+
+    gate.leave()
+    waiter.join()
+    assert admitted == [True], "Queued request should get the freed slot"
+    gate.leave()
+
+    slow = AdmissionGate(concurrency=1, queue=1, timeout=0.05)
+    assert slow.enter()
+    assert not slow.enter(), "Waiting longer than the timeout should shed the request"
+    assert slow.waiting == 0 and slow.running == 1, "Shed requests should not hold anything"
+    print("✓ Admission control works")
+
+
+# One export at a time and no queue, so a held turn shows as a 503
+EXPORT_LIMITS = '{"GET /media/export": {"rate": 1, "burst": 3, "concurrency": 1}}'
+
+
+def exports_over_limit(path):
+    """
+    Status codes (and Retry-After) of GET /media/export from an app
+    started with EXPORT_LIMITS: two while a streamed export is still
+    being read, then three more after it has been closed.
+    """
+    os.environ.update(MEDIA_DATA_FILE=path, MEDIA_LIMITS=EXPORT_LIMITS)
+    import app
+
+    client = app.app.test_client()
+    streaming = client.get("/media/export", buffered=False)
+    responses = [streaming, client.get("/media/export")]
+    streaming.close()
+    responses += [client.get("/media/export") for _ in range(3)]
+    return [(r.status_code, r.headers.get("Retry-After")) for r in responses]
+
+
+def test_endpoint_limits():
+    """Endpoint limits: 429 over the rate, 503 while streamed responses hold every turn"""
+    print("Testing: endpoint rate limits...")
+    # A new process, so the app reads MEDIA_LIMITS when it is imported
+    with catalog_copy() as path, multiprocessing.get_context("spawn").Pool(1) as pool:
+        results = pool.apply(exports_over_limit, (path,))
+    codes = [code for code, _ in results]
+    assert codes[:3] == [200, 503, 200], f"A streamed export should hold its turn until closed, got {codes}"
+    assert 429 in codes[3:], f"Exports allow a burst of 3, the rest should get 429, got {codes}"
+    assert int(results[codes.index(429)][1]) >= 1, "429 should say when to retry"
+    print("✓ Endpoint rate limits work")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("=" * 50)
+    print("Running Admission Tests")
+    print("=" * 50)
+    print()
+
+    try:
+        test_single_flight()
+        test_rate_limiter()
+        test_admission_gate()
+        test_endpoint_limits()
+
+        print()
+        print("=" * 50)
+        print("✓ ALL TESTS PASSED!")
+        print("=" * 50)
+    except AssertionError as e:
+        print()
+        print("=" * 50)
+        print(f"✗ TEST FAILED: {e}")
+        print("=" * 50)
+
+
+if __name__ == "__main__":
+    run_all_tests()
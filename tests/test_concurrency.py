@@ -0,0 +1,180 @@
+"""
+Concurrency stress tests for the catalog store.
+
+Fires thousands of parallel borrow requests at a single item, from many
+threads and from several processes sharing the same database files, and
+checks that exactly one of them wins, for both storage backends. Uses
+Flask's test client against a temporary copy of the database, so no
+server is needed. The app reads its configuration when it is imported,
+so every run imports it in new processes, with the environment pointing
+at that copy.
+"""
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from helpers import catalog_copy  # noqa: E402
+
+ITEM = "Atomic Habits"
+THREADS = 32
+REQUESTS_PER_PROCESS = 500
+PROCESSES = 4
+
+
+def database(backend="json"):
+    """A temporary copy of the catalog (removed afterwards) with the test item available."""
+    available = {"status": "available", "borrowed_by": None, "borrow_date": None, "due_date": None}
+    return catalog_copy(backend, changes={ITEM: available})
+
+
+def fire_borrows(path, backend_name, journal, count, tag):
+    """Send `count` parallel borrows for ITEM, return their status codes."""
+    os.environ.update(
+        MEDIA_DATA_FILE=path, MEDIA_STORAGE=backend_name, MEDIA_JOURNAL="1" if journal else "0"
+    )
+    import app as backend
+
+    def borrow(i):
+        client = backend.app.test_client()
+        response = client.post(
+            f"/media/{ITEM}/borrow",
+            json={"borrowed_by": f"{tag}-{i}", "days": 7},
+        )
+        return response.status_code
+
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        return list(pool.map(borrow, range(count)))
+
+
+def fire_borrows_in_process(args):
+    return fire_borrows(*args)
+
+
+def pool(processes):
+    """Worker processes that start without the app imported."""
+    return multiprocessing.get_context("spawn").Pool(processes)
+
+
+def fire_threaded_borrows(path, backend, journal, count):
+    with pool(1) as workers:
+        return workers.apply(fire_borrows, (path, backend, journal, count, "thread"))
+
+
+def check_single_winner(path, backend, journal, codes):
+    from storage import open_store
+
+    assert codes.count(200) == 1, f"Expected exactly one successful borrow, got {codes.count(200)}"
+    assert codes.count(400) == len(codes) - 1, "All other borrows should be rejected"
+
+    # A fresh store reading the files from disk must agree
+    item = open_store(path, backend, journal=journal).load()[ITEM]
+    assert item["status"] == "borrowed", "Item should be borrowed on disk"
+    assert item["borrowed_by"] is not None, "Borrower should be recorded"
+
+
+def test_threaded_borrows_journal():
+    """Thousands of threaded borrows (journaled store): exactly one wins"""
+    print("Testing: parallel borrows from threads (journal)...")
+    with database() as path:
+        codes = fire_threaded_borrows(path, "json", True, 2000)
+        check_single_winner(path, "json", True, codes)
+        print("✓ Exactly one threaded borrow succeeded (journal)")
+
+
+def test_threaded_borrows_plain():
+    """Thousands of threaded borrows (full-rewrite store): exactly one wins"""
+    print("Testing: parallel borrows from threads (plain file)...")
+    with database() as path:
+        codes = fire_threaded_borrows(path, "json", False, 2000)
+        check_single_winner(path, "json", False, codes)
+        print("✓ Exactly one threaded borrow succeeded (plain file)")
+
+
+def test_threaded_borrows_sqlite():
+    """Thousands of threaded borrows (SQLite store): exactly one wins"""
+    print("Testing: parallel borrows from threads (SQLite)...")
+    with database("sqlite") as path:
+        codes = fire_threaded_borrows(path, "sqlite", False, 2000)
+        check_single_winner(path, "sqlite", False, codes)
+        print("✓ Exactly one threaded borrow succeeded (SQLite)")
+
+
+def run_multiprocess_borrows(backend, journal):
+    with database(backend) as path:
+        jobs = [(path, backend, journal, REQUESTS_PER_PROCESS, f"proc{i}") for i in range(PROCESSES)]
+
+        with pool(PROCESSES) as workers:
+            codes = [code for result in workers.map(fire_borrows_in_process, jobs) for code in result]
+
+        check_single_winner(path, backend, journal, codes)
+
+
+def test_multiprocess_borrows():
+    """Borrows from several processes sharing one database: exactly one wins"""
+    print("Testing: parallel borrows from several processes...")
+    run_multiprocess_borrows("json", True)
+    print("✓ Exactly one borrow succeeded across processes")
+
+
+def test_multiprocess_borrows_sqlite():
+    """Borrows from several processes sharing one SQLite database: exactly one wins"""
+    print("Testing: parallel borrows from several processes (SQLite)...")
+    run_multiprocess_borrows("sqlite", False)
+    print("✓ Exactly one borrow succeeded across processes (SQLite)")
+
+
+def test_follow_compaction():
+    """A store that is up to date keeps its catalog when another one compacts"""
+    print("Testing: following another store's compaction...")
+    from storage import open_store
+
+    with database() as path:
+        writer = open_store(path, journal=True)
+        reader = open_store(path, journal=True)
+        writer.put(ITEM, dict(writer.get(ITEM), borrowed_by="Ana", status="borrowed"))
+        data, indexes = reader.load(), reader.indexes
+        assert data[ITEM]["borrowed_by"] == "Ana", "Reader should replay the journal"
+
+        assert writer.compact(), "Compaction should succeed"
+        writer.put(ITEM, dict(writer.get(ITEM), borrowed_by="Ben"))
+        assert reader.load() is data and reader.indexes is indexes, "Reader should not reload"
+        assert data[ITEM]["borrowed_by"] == "Ben", "Reader should replay the new journal"
+        assert reader.version == writer.version and reader.load() == open_store(path, journal=True).load()
+
+        # A snapshot no journal record accounts for still means a reload
+        writer.save(dict(data))
+        assert reader.load() is not data, "A saved snapshot should be reloaded"
+        print("✓ Compaction is followed without a reload")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("=" * 50)
+    print("Running Concurrency Stress Tests")
+    print("=" * 50)
+    print()
+
+    try:
+        test_threaded_borrows_journal()
+        test_threaded_borrows_plain()
+        test_threaded_borrows_sqlite()
+        test_multiprocess_borrows()
+        test_multiprocess_borrows_sqlite()
+        test_follow_compaction()
+
+        print()
+        print("=" * 50)
+        print("✓ ALL TESTS PASSED!")
+        print("=" * 50)
+    except AssertionError as e:
+        print()
+        print("=" * 50)
+        print(f"✗ TEST FAILED: {e}")
+        print("=" * 50)
+
+
+if __name__ == "__main__":
+    run_all_tests()
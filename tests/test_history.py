@@ -0,0 +1,114 @@
+"""
+Tests for the borrowing history and its rollups (history.py).
+
+Works on a temporary event database, so no server is needed.
+"""
+import os
+import sys
+from contextlib import contextmanager
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from helpers import temp_dir  # noqa: E402
+from history import EventLog, change_event  # noqa: E402
+
+
+@contextmanager
+def event_log():
+    with temp_dir() as directory:
+        yield EventLog(os.path.join(directory, "history.sqlite3"))
+
+
+def item(category="Book", **fields):
+    base = {"category": category, "status": "available", "borrowed_by": None,
+            "borrow_date": None, "due_date": None}
+    return dict(base, **fields)
+
+
+def loan(log, name, borrower, start, end, category="Book"):
+    """Record borrowing `name` on `start` and returning it on `end`."""
+    borrowed = item(category, status="borrowed", borrowed_by=borrower,
+                    borrow_date=start, due_date=start)
+    log.record([change_event(name, item(category), borrowed, start)])
+    log.record([change_event(name, borrowed, item(category), end)])
+
+
+def snapshot(log):
+    return {
+        dimension: log.top(dimension, limit=100)
+        for dimension in ("all", "item", "borrower", "category", "day")
+    } | {"month": log.top("item", "2026-03", limit=100)}
+
+
+def test_rollups():
+    """Borrows and returns are rolled up per item, borrower, category and day"""
+    print("Testing: history rollups...")
+    with event_log() as log:
+        assert change_event("Dune", item(), item(), "2026-03-01") is None, "Only borrows and returns count"
+
+        loan(log, "Dune", "Ana", "2026-02-20", "2026-03-02")
+        loan(log, "Dune", "Ben", "2026-03-05", "2026-03-09")
+        loan(log, "Emma", "Ana", "2026-03-06", "2026-03-08")
+        loan(log, "Alien", "Ben", "2026-03-06", "2026-03-16", category="Film")
+
+        top = log.top("item", "2026-03")
+        assert [(row["key"], row["borrows"]) for row in top] == [("Alien", 1), ("Dune", 1), ("Emma", 1)]
+        assert log.top("item")[0] == {
+            "key": "Dune", "borrows": 2, "returns": 2, "loans": 2, "average_loan_days": 7.0,
+        }, "All-time rollup should count both loans of Dune (10 and 4 days)"
+        assert log.get("category", "Film")["average_loan_days"] == 10.0
+        assert log.get("borrower", "Ana", "2026-02")["borrows"] == 1, "Monthly rollups per borrower"
+        assert log.get("item", "Never borrowed")["borrows"] == 0, "Unknown keys should be zeros"
+        days = log.between("day", "2026-03-05", "2026-03-06")
+        assert [(row["key"], row["borrows"]) for row in days] == [("2026-03-05", 1), ("2026-03-06", 2)]
+        assert [event["kind"] for event in log.events("Dune")] == ["return", "borrow", "return", "borrow"]
+        print("✓ History rollups work")
+
+
+def test_rotate_and_backfill():
+    """Rotated events leave the table but still count, and a backfill rebuilds the same rollups"""
+    print("Testing: history rotation and backfill...")
+    with event_log() as log:
+        loan(log, "Dune", "Ana", "2026-01-10", "2026-01-20")
+        loan(log, "Emma", "Ben", "2026-03-01", "2026-03-03")
+        expected = snapshot(log)
+
+        path, moved = log.rotate(keep_days=30, today=date(2026, 3, 5))
+        assert moved == 2 and os.path.exists(path), "January's borrow and return should be archived"
+        assert log.rotate(keep_days=30, today=date(2026, 3, 5)) == (None, 0), "Nothing left to archive"
+        assert log.events("Dune") == [] and len(log.events("Emma")) == 2
+        assert snapshot(log) == expected, "Rotation should not change the rollups"
+        assert len(list(log.stream())) == 4, "The stream should read archived events too"
+
+        with log._transaction() as db:
+            db.execute("DELETE FROM rollups")
+        assert log.backfill(flush_keys=3) == 4, "Backfill should read every event"
+        assert snapshot(log) == expected, "Backfill should rebuild the same rollups"
+        print("✓ History rotation and backfill work")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("=" * 50)
+    print("Running History Tests")
+    print("=" * 50)
+    print()
+
+    try:
+        test_rollups()
+        test_rotate_and_backfill()
+
+        print()
+        print("=" * 50)
+        print("✓ ALL TESTS PASSED!")
+        print("=" * 50)
+    except AssertionError as e:
+        print()
+        print("=" * 50)
+        print(f"✗ TEST FAILED: {e}")
+        print("=" * 50)
+
+
+if __name__ == "__main__":
+    run_all_tests()
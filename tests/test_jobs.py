@@ -0,0 +1,132 @@
+"""
+Tests for the background job queue (jobs.py).
+
+Runs the queued jobs by hand (no worker threads) on a temporary job
+table, so priorities, retries and failures can be checked step by
+step. No server is needed.
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+import jobs  # noqa: E402
+from helpers import temp_dir  # noqa: E402
+from jobs import JobError, JobQueue  # noqa: E402
+
+
+@contextmanager
+def job_queue():
+    with temp_dir() as directory:
+        yield JobQueue(os.path.join(directory, "jobs.sqlite3"))
+
+
+def test_priorities_and_progress():
+    """Higher priority runs first; progress and results are recorded"""
+    print("Testing: job priorities and progress...")
+    with job_queue() as queue:
+        ran = []
+
+        def record(job, params):
+            ran.append(params["n"])
+            job.progress(2, 2)
+            return {"n": params["n"]}
+
+        queue.register("record", record)
+        low = queue.submit("record", {"n": 1})
+        queue.submit("record", {"n": 2}, priority=5)
+        queue.submit("record", {"n": 3})
+        assert low["status"] == "queued", "New jobs should be queued"
+
+        assert queue.run_pending() == 3, "All three jobs should run"
+        assert ran == [2, 1, 3], "Higher priority first, then oldest first"
+        job = queue.get(low["id"])
+        assert job["status"] == "done" and job["result"] == {"n": 1}, "Result should be stored"
+        assert job["progress"] == {"done": 2, "total": 2}, "Progress should be stored"
+        assert queue.counts()["done"] == 3, "Counts should include finished jobs"
+        print("✓ Job priorities and progress work")
+
+
+def test_retries_and_failures():
+    """Failing jobs are retried with backoff, JobError fails at once"""
+    print("Testing: job retries...")
+    with job_queue() as queue:
+        calls = {"flaky": 0, "broken": 0}
+
+        def flaky(job, params):
+            calls["flaky"] += 1
+            if job.attempt < 2:
+                raise RuntimeError("try again")
+            return "ok"
+
+        def broken(job, params):
+            calls["broken"] += 1
+            raise JobError("bad params")
+
+        queue.register("flaky", flaky)
+        queue.register("broken", broken)
+        flaky_job = queue.submit("flaky")
+        broken_job = queue.submit("broken")
+
+        saved = jobs.RETRY_SECONDS
+        jobs.RETRY_SECONDS = 0.05
+        try:
+            queue.run_pending()
+            job = queue.get(flaky_job["id"])
+            assert job["status"] == "queued" and job["error"] == "try again", "Failed job should be queued again"
+            time.sleep(0.1)
+            queue.run_pending()
+        finally:
+            jobs.RETRY_SECONDS = saved
+
+        job = queue.get(flaky_job["id"])
+        assert job["status"] == "done" and job["attempts"] == 2, "Retry should succeed"
+        job = queue.get(broken_job["id"])
+        assert job["status"] == "failed" and job["error"] == "bad params", "JobError should fail the job"
+        assert calls["broken"] == 1, "JobError should not be retried"
+        print("✓ Job retries work")
+
+
+def test_orphaned_jobs():
+    """A running job whose process stopped heartbeating is queued again"""
+    print("Testing: orphaned jobs...")
+    with job_queue() as queue:
+        queue.register("noop", lambda job, params: None)
+        job = queue.submit("noop")
+        assert queue._claim()[0] == job["id"], "Job should be claimed"
+
+        with queue._transaction() as db:
+            db.execute("UPDATE jobs SET owner = 'gone', heartbeat = ?", (time.time() - jobs.STALE_SECONDS - 1,))
+        queue.maintain()
+        assert queue.get(job["id"])["status"] == "queued", "Orphaned job should be queued again"
+        assert queue.run_pending() == 1 and queue.get(job["id"])["status"] == "done", "It should run again"
+        print("✓ Orphaned jobs are requeued")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("=" * 50)
+    print("Running Job Queue Tests")
+    print("=" * 50)
+    print()
+
+    try:
+        test_priorities_and_progress()
+        test_retries_and_failures()
+        test_orphaned_jobs()
+
+        print()
+        print("=" * 50)
+        print("✓ ALL TESTS PASSED!")
+        print("=" * 50)
+    except AssertionError as e:
+        print()
+        print("=" * 50)
+        print(f"✗ TEST FAILED: {e}")
+        print("=" * 50)
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,100 @@
+"""
+Tests for the request metrics and the sampling profiler.
+
+Uses the metrics module directly with a temporary copy of the
+database, so no server is needed.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+import metrics  # noqa: E402
+from helpers import catalog_copy, temp_dir  # noqa: E402
+from storage import open_store  # noqa: E402
+
+
+def phase_counts(text, endpoint, phase):
+    prefix = f'media_request_phase_seconds_count{{method="POST",endpoint="{endpoint}",phase="{phase}"}} '
+    return [int(line[len(prefix):]) for line in text.splitlines() if line.startswith(prefix)]
+
+
+def test_phases_and_counters():
+    """Store calls are charged to load/persist and writes are counted once"""
+    print("Testing: request phases and write counters...")
+    with catalog_copy() as path:
+        store = metrics.instrument(open_store(path, "json", journal=True))
+        name = next(iter(store.load()))
+
+        metrics.start_request()
+        with store.transaction() as data:
+            item = dict(data[name], status="borrowed")
+            store.put(name, item)
+        with metrics.phase("serialize"):
+            with metrics.phase("load"):  # nested: counts for the outer phase
+                pass
+        phases = dict(metrics._local.phases)
+        metrics.finish_request("POST", "/test", 200)
+
+        assert phases["load"] > 0, "Taking the transaction should count as load"
+        assert phases["persist"] > 0, "The write should count as persist"
+        assert "serialize" in phases, "Explicit phases should be recorded"
+
+        text = metrics.registry.render([("media_catalog_items", (), store.count())])
+        for phase in metrics.PHASES:
+            assert phase_counts(text, "/test", phase) == [1], f"Missing {phase} histogram"
+        assert 'media_store_writes_total{op="put"} 1' in text, "One put should be counted"
+        assert 'media_request_duration_seconds_bucket{method="POST",endpoint="/test",le="+Inf"} 1' in text
+        assert f"media_catalog_items {store.count()}" in text, "Gauges should be rendered"
+        print("✓ Request phases and write counters work")
+
+
+def test_sampling_profiler():
+    """One request in `every` is profiled and gets a report on disk"""
+    print("Testing: sampling profiler...")
+    for mode in ("cprofile", "tracemalloc"):
+        with temp_dir() as directory:
+            profiler = metrics.Profiler(mode, every=2, directory=directory)
+
+            tokens = [profiler.start() for _ in range(4)]
+            assert tokens[0] is None and tokens[2] is None, "Unsampled requests are not profiled"
+            assert tokens[1] is not None, "Every 2nd request should be sampled"
+            assert tokens[3] is None, "Only one request is profiled at a time"
+
+            [x for x in range(10000)]
+            profiler.stop(tokens[1], "GET /media -> 200")
+            reports = os.listdir(directory)
+            assert any(report.endswith(".txt") for report in reports), f"No {mode} report written"
+            if mode == "cprofile":
+                assert any(report.endswith(".prof") for report in reports), "No pstats dump written"
+            assert profiler.start() is None, "Sampling continues after a report"
+            token = profiler.start()
+            assert token is not None, "Profiler should be free again"
+            profiler.stop(token, "GET /media -> 200")
+    print("✓ Sampling profiler works")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("=" * 50)
+    print("Running Metrics Tests")
+    print("=" * 50)
+    print()
+
+    try:
+        test_phases_and_counters()
+        test_sampling_profiler()
+
+        print()
+        print("=" * 50)
+        print("✓ ALL TESTS PASSED!")
+        print("=" * 50)
+    except AssertionError as e:
+        print()
+        print("=" * 50)
+        print(f"✗ TEST FAILED: {e}")
+        print("=" * 50)
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,94 @@
+"""
+Tests for the overdue scheduler.
+
+Runs the scheduler's checks by hand (no background thread) against a
+temporary copy of the database with a fake "today", so due dates can
+be passed without waiting. No server is needed.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from helpers import catalog_copy  # noqa: E402
+from overdue import OverdueScheduler  # noqa: E402
+from storage import open_store  # noqa: E402
+
+
+def borrowed(name, due_date):
+    return {
+        "name": name, "author": "Someone", "publication_date": "2025", "category": "Book",
+        "status": "borrowed", "image": "", "borrowed_by": "Student",
+        "borrow_date": "2030-01-01", "due_date": due_date, "overdue": False,
+    }
+
+
+def run_scheduler(backend):
+    with catalog_copy(backend) as path:
+        store = open_store(path, backend, journal=True)
+        clock = {"today": "2030-01-01"}
+        scheduler = OverdueScheduler(store, today=lambda: clock["today"])
+        notified = []
+        scheduler.subscribe(notified.extend)
+
+        # Everything in the sample data is due before 2030
+        scheduler.run_due()
+        for name, item in store.due_between().items():
+            if item["status"] == "borrowed":
+                assert store.get(name)["overdue"] is True, f"{name} should be overdue on start"
+
+        version = store.version
+        store.put("Due Soon", borrowed("Due Soon", "2030-01-05"))
+        assert scheduler.run_due() == [], "Nothing should be due yet"
+
+        clock["today"] = "2030-01-05"
+        assert scheduler.run_due() == [], "An item is not overdue on its due date"
+
+        clock["today"] = "2030-01-06"
+        assert scheduler.run_due() == ["Due Soon"], "Item should become overdue the day after"
+        assert store.get("Due Soon")["overdue"] is True, "Flag should be stored"
+        assert "Due Soon" in notified, "Subscribers should be told"
+
+        _, names = store.changes_since(version)
+        assert "Due Soon" in names, "The change feed should list the newly overdue item"
+        assert scheduler.run_due() == [], "An item is only marked once"
+
+
+def test_overdue_scheduler_json():
+    """Items are flagged overdue the day after their due date (JSON store)"""
+    print("Testing: overdue scheduler (JSON)...")
+    run_scheduler("json")
+    print("✓ Overdue scheduler works (JSON)")
+
+
+def test_overdue_scheduler_sqlite():
+    """Items are flagged overdue the day after their due date (SQLite store)"""
+    print("Testing: overdue scheduler (SQLite)...")
+    run_scheduler("sqlite")
+    print("✓ Overdue scheduler works (SQLite)")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("=" * 50)
+    print("Running Overdue Scheduler Tests")
+    print("=" * 50)
+    print()
+
+    try:
+        test_overdue_scheduler_json()
+        test_overdue_scheduler_sqlite()
+
+        print()
+        print("=" * 50)
+        print("✓ ALL TESTS PASSED!")
+        print("=" * 50)
+    except AssertionError as e:
+        print()
+        print("=" * 50)
+        print(f"✗ TEST FAILED: {e}")
+        print("=" * 50)
+
+
+if __name__ == "__main__":
+    run_all_tests()
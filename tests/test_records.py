@@ -0,0 +1,125 @@
+"""
+Tests for the compact item records and their validation (records.py).
+
+Works on temporary copies of the database, so no server is needed.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+import serialization  # noqa: E402
+from helpers import catalog_copy  # noqa: E402
+from records import MediaItem, ValidationError, parse, parse_borrow  # noqa: E402
+from storage import open_store  # noqa: E402
+
+
+BORROWED = {
+    "name": "Dune", "author": "Frank Herbert", "publication_date": "1965",
+    "category": "Book", "status": "borrowed", "image": "dune.jpg",
+    "borrowed_by": "Ana", "borrow_date": "2026-03-01", "due_date": "2026-03-15",
+    "overdue": False,
+}
+
+
+def expect_invalid(fn, payload, message):
+    try:
+        fn(payload)
+    except ValidationError as e:
+        assert str(e) == message, f"Expected {message!r}, got {e!r}"
+    else:
+        raise AssertionError(f"{payload!r} should be rejected")
+
+
+def test_record_round_trip():
+    """A record reads and encodes exactly like the dict it was made from"""
+    print("Testing: MediaItem round trip...")
+    item = MediaItem(BORROWED)
+    assert item == BORROWED and dict(item) == BORROWED, "Record should equal its dict"
+    assert list(item) == list(BORROWED), "Keys should keep their order"
+    assert item.to_dict() == BORROWED and item["due_date"] == "2026-03-15"
+    assert isinstance(item.due_date, int), "Dates should be stored as ordinals"
+
+    other = MediaItem(dict(BORROWED, name="Emma", category="".join(["Bo", "ok"])))
+    assert other.category is item.category, "Categories should be interned"
+    assert other.due_date is item.due_date, "Items due the same day should share the ordinal"
+
+    # Hand-edited items: missing fields stay missing, unknown ones and
+    # odd dates are kept as they are
+    odd = {"name": "Old", "due_date": "15/03/2026", "shelf": "B2"}
+    assert MediaItem(odd).to_dict() == odd and "overdue" not in MediaItem(odd)
+    assert MediaItem(odd).get("overdue", "none") == "none"
+
+    for name, (dumps_bytes, loads) in serialization.LIBRARIES.items():
+        raw = dumps_bytes({"Dune": item, "Old": MediaItem(odd)}, sort_keys=True)
+        assert loads(raw) == {"Dune": BORROWED, "Old": odd}, f"{name} did not encode the records"
+    assert item.replace(status="available", due_date=None)["due_date"] is None
+    assert item["status"] == "borrowed", "replace() should not change the original"
+    print("✓ MediaItem round trip works")
+
+
+def test_validation():
+    """New items and borrow requests are checked once, at the boundary"""
+    print("Testing: validation...")
+    item = parse({"name": "New", "author": "A", "publication_date": 2025, "category": "Film"})
+    assert item["status"] == "available" and item["overdue"] is False, "Defaults should be filled in"
+    assert item["publication_date"] == "2025"
+
+    expect_invalid(parse, ["not", "an", "item"], "Invalid media data")
+    expect_invalid(parse, {"name": "New", "author": "A", "category": "Film"},
+                   "Missing field: publication_date")
+    expect_invalid(parse, dict(BORROWED, status="lost"), "Invalid field: status")
+    expect_invalid(parse, dict(BORROWED, due_date="next week"), "Invalid field: due_date")
+    expect_invalid(parse, dict(BORROWED, author=None), "Invalid field: author")
+
+    assert parse_borrow({"borrowed_by": "Ana", "days": 7}) == ("Ana", 7)
+    for payload in ({"borrowed_by": "Ana"}, {"borrowed_by": "", "days": 7},
+                    {"borrowed_by": "Ana", "days": True}, {"borrowed_by": "Ana", "days": "7"},
+                    {"borrowed_by": "Ana", "days": -1}, {"borrowed_by": "Ana", "days": 99999999}):
+        expect_invalid(parse_borrow, payload, "Invalid borrow data")
+    print("✓ Validation works")
+
+
+def test_store_holds_records():
+    """The JSON store keeps records in memory and plain JSON on disk"""
+    print("Testing: store records...")
+    with catalog_copy() as path:
+        store = open_store(path, journal=True)
+        assert all(isinstance(item, MediaItem) for item in store.load().values())
+        store.put("Dune", BORROWED)
+        assert isinstance(store.get("Dune"), MediaItem) and store.get("Dune") == BORROWED
+
+        reopened = open_store(path, journal=True)
+        assert reopened.get("Dune") == BORROWED, "Journal should replay the record"
+        assert reopened.select("status", "borrowed")["Dune"] == BORROWED
+        assert store.compact(), "Compaction should succeed"
+        with open(path, "rb") as f:
+            assert serialization.loads(f.read())["Dune"] == BORROWED
+        print("✓ Store records work")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("=" * 50)
+    print("Running Record Tests")
+    print("=" * 50)
+    print()
+
+    try:
+        test_record_round_trip()
+        test_validation()
+        test_store_holds_records()
+
+        print()
+        print("=" * 50)
+        print("✓ ALL TESTS PASSED!")
+        print("=" * 50)
+    except AssertionError as e:
+        print()
+        print("=" * 50)
+        print(f"✗ TEST FAILED: {e}")
+        print("=" * 50)
+
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,88 @@
+"""
+Tests for the JSON libraries and snapshot formats (serialization.py).
+
+Works on temporary copies of the database, so no server is needed.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+import serialization  # noqa: E402
+from helpers import catalog_copy  # noqa: E402
+from storage import open_store  # noqa: E402
+
+
+SAMPLE = {"Zebra": {"name": "Zebra", "author": "Müller", "due_date": None, "overdue": False, "n": 3}}
+
+
+def test_json_libraries_agree():
+    """Every available JSON library writes compact UTF-8 that the others can read"""
+    print("Testing: JSON libraries...")
+    encoded = {}
+    for name, (dumps_bytes, loads) in serialization.LIBRARIES.items():
+        raw = dumps_bytes(SAMPLE, sort_keys=True)
+        assert b" " not in raw.replace(b"M\xc3\xbcller", b""), f"{name} output should be compact"
+        assert "Müller".encode() in raw, f"{name} should write UTF-8, not escapes"
+        encoded[name] = raw
+    for raw in encoded.values():
+        for name, (_, loads) in serialization.LIBRARIES.items():
+            assert loads(raw) == SAMPLE, f"{name} could not read another library's output"
+    print(f"✓ JSON libraries agree ({', '.join(serialization.LIBRARIES)})")
+
+
+def test_snapshot_formats():
+    """Snapshots are compact, MessagePack is optional, and both are detected on load"""
+    print("Testing: snapshot formats...")
+    with catalog_copy() as path:
+        original = dict(open_store(path).load())
+
+        store = open_store(path)
+        store.save(original)
+        with open(path, "rb") as f:
+            assert b"\n    " not in f.read(), "Snapshots should no longer be indented"
+
+        if serialization.msgpack is None:
+            print("✓ Snapshot formats work (msgpack not installed, skipped)")
+            return
+
+        open_store(path, snapshot_format="msgpack").save(original)
+        with open(path, "rb") as f:
+            assert f.read(1) not in (b"{", b"["), "Snapshot should be MessagePack now"
+        assert dict(open_store(path).load()) == original, "MessagePack should be detected on load"
+
+        # Journaled store on a .msgpack file: snapshot in msgpack, journal in JSON
+        packed = os.path.join(os.path.dirname(path), "database.msgpack")
+        store = open_store(packed, journal=True)
+        store.save(original)
+        name = next(iter(original))
+        store.put(name, dict(original[name], status="borrowed"))
+        assert store.compact(), "Compaction should succeed"
+        assert open_store(packed, journal=True).get(name)["status"] == "borrowed", "Journal lost"
+        print("✓ Snapshot formats work")
+
+
+def run_all_tests():
+    """Run all tests"""
+    print("=" * 50)
+    print("Running Serialization Tests")
+    print("=" * 50)
+    print()
+
+    try:
+        test_json_libraries_agree()
+        test_snapshot_formats()
+
+        print()
+        print("=" * 50)
+        print("✓ ALL TESTS PASSED!")
+        print("=" * 50)
+    except AssertionError as e:
+        print()
+        print("=" * 50)
+        print(f"✗ TEST FAILED: {e}")
+        print("=" * 50)
+
+
+if __name__ == "__main__":
+    run_all_tests()